@@ -0,0 +1,161 @@
+# Benchmark: cold-start and warm-invocation latency of the BigQuery loader function
+#
+# Measures the generic loader (bigquery_loader.py); the legacy per-table
+# functions are now thin wrappers around it. Each run starts a fresh Python
+# process, builds the app with functions_framework and posts CloudEvents to it
+# through the Flask test client. BigQuery is replaced by an in-process stub, so
+# no credentials or network are needed; --client-init-ms can simulate the time
+# a real bigquery.Client spends on credential discovery.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+VARIANTS = {
+    "generic": ("bigquery_loader.py", "bigquery_load"),
+}
+
+SAMPLE_SCHEMA = [
+    {"name": "_id", "type": "STRING"},
+    {"name": "ip", "type": "STRING"},
+    {"name": "collection", "type": "STRING"},
+    {"name": "product_id", "type": "STRING"},
+    {"name": "time_stamp", "type": "INTEGER"},
+]
+
+# --- Stub BigQuery client ---
+class StubJob:
+    def __init__(self, job_id="stub"):
+        self.job_id = job_id
+        self.state = "DONE"
+        self.output_rows = 0
+
+    def result(self):
+        return self
+
+class StubDataset:
+    def __init__(self, dataset_id):
+        self.dataset_id = dataset_id
+
+    def table(self, table_id):
+        from google.cloud import bigquery
+        return bigquery.DatasetReference("stub-project", self.dataset_id).table(table_id)
+
+class StubClient:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def schema_from_json(self, schema_file):
+        from google.cloud import bigquery
+        return [bigquery.SchemaField.from_api_repr(field) for field in json.load(schema_file)]
+
+    def dataset(self, dataset_id):
+        return StubDataset(dataset_id)
+
+    def load_table_from_uri(self, uris, table_ref, job_id=None, job_config=None):
+        return StubJob(job_id or "stub")
+
+    def get_job(self, job_id):
+        return StubJob(job_id)
+
+    def get_table(self, table_ref):
+        from google.api_core.exceptions import NotFound
+        raise NotFound(f"{table_ref.path} (stub)")
+
+    def create_table(self, table):
+        return table
+
+    def update_table(self, table, fields):
+        return table
+
+# --- Child process: one cold start followed by warm invocations ---
+def run_child(variant, invocations, client_init_ms):
+    start = time.perf_counter()
+    import functions_framework
+    source, target = VARIANTS[variant]
+    app = functions_framework.create_app(target=target, source=os.path.join(SCRIPTS_DIR, source),
+                                         signature_type="cloudevent")
+    startup = time.perf_counter() - start
+
+    # Stub out the client. The loader defers the bigquery import to its first
+    # invocation, so the import cost is counted here as part of that invocation.
+    t0 = time.perf_counter()
+    from google.cloud import bigquery
+    deferred_import = time.perf_counter() - t0
+
+    class TimedStubClient(StubClient):
+        def __init__(self, *args, **kwargs):
+            time.sleep(client_init_ms / 1000.0)
+
+    bigquery.Client = TimedStubClient
+
+    test_client = app.test_client()
+    latencies = []
+    for i in range(invocations):
+        headers = {
+            "ce-id": f"event-{i}",
+            "ce-specversion": "1.0",
+            "ce-type": "google.cloud.storage.object.v1.finalized",
+            "ce-source": "//storage.googleapis.com/projects/_/buckets/raw-glamira-data",
+            "Content-Type": "application/json",
+        }
+        body = {"bucket": "raw-glamira-data", "generation": str(i),
+                "name": f"exports/user_behaviors/user_behaviors_2024-01-01-00000{i}.jsonl"}
+        t0 = time.perf_counter()
+        response = test_client.post("/", headers=headers, json=body)
+        latencies.append(time.perf_counter() - t0)
+        if response.status_code != 200:
+            raise RuntimeError(f"Invocation failed ({response.status_code}): {response.data[:500]}")
+
+    print(json.dumps({"startup": startup, "first": deferred_import + latencies[0], "warm": latencies[1:]}))
+
+# --- Parent process ---
+def run_variant(variant, runs, invocations, client_init_ms, workdir):
+    startups, firsts, warms = [], [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", variant,
+             "--invocations", str(invocations), "--client-init-ms", str(client_init_ms)],
+            cwd=workdir, capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        startups.append(result["startup"])
+        firsts.append(result["first"])
+        warms.extend(result["warm"])
+    return {
+        "startup_ms": statistics.median(startups) * 1000,
+        "cold_total_ms": statistics.median(s + f for s, f in zip(startups, firsts)) * 1000,
+        "warm_ms": statistics.median(warms) * 1000 if warms else float("nan"),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loader cold-start and warm latency.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per variant")
+    parser.add_argument("--invocations", type=int, default=50, help="Invocations per process")
+    parser.add_argument("--client-init-ms", type=float, default=0.0,
+                        help="Simulated bigquery.Client construction time")
+    parser.add_argument("--child", choices=sorted(VARIANTS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.invocations, args.client_init_ms)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, "user_behaviors_schema.json"), "w") as f:
+            json.dump(SAMPLE_SCHEMA, f)
+
+        print(f"{'variant':<10} {'startup ms':>12} {'cold total ms':>14} {'warm ms':>10}")
+        for variant in VARIANTS:
+            result = run_variant(variant, args.runs, args.invocations, args.client_init_ms, workdir)
+            print(f"{variant:<10} {result['startup_ms']:>12.1f} {result['cold_total_ms']:>14.1f} {result['warm_ms']:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Benchmark: current write_to_jsonl vs the raw-BSON / orjson fast path
+#
+# Runs offline: synthetic summary documents are BSON-encoded into batches that
+# mimic what MongoDB returns. Both paths decode them the same way, one
+# bson.decode_all call per batch (as pymongo does for a regular cursor and the
+# exporters do for raw batches), so the comparison is between the encoders.
+# Decoding and encoding (transform + JSON + write) are timed and reported
+# separately.
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import bson
+from bson import ObjectId
+
+import collection_export
+import export_user_behavior_to_gcs as user_behavior_export
+from fast_jsonl import orjson
+
+COLLECTIONS = ["view_product_detail", "select_product_option", "add_to_cart_action",
+               "product_detail_recommendation_visible", "product_view_all_recommend_clicked"]
+
+def make_summary_doc(i):
+    """Builds one synthetic summary event roughly shaped like production data."""
+    doc = {
+        "_id": ObjectId(),
+        "time_stamp": 1591266092 + i,
+        "ip": f"37.170.{i % 256}.{(i * 7) % 256}",
+        "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+        "resolution": "1920x1080",
+        "device_id": f"device-{i % 5000}",
+        "store_id": str(random.randint(1, 90)),
+        "local_time": "2020-06-04 18:21:32",
+        "current_url": f"https://www.glamira.de/glamira-ring-{i}.html",
+        "collection": random.choice(COLLECTIONS),
+        "product_id": str(100000 + i % 20000),
+        "option": [{"option_label": "alloy", "option_id": "1", "value_label": "white-375", "value_id": "2"}],
+    }
+    if doc["collection"] == "add_to_cart_action":
+        doc["cart_products"] = [
+            {"product_id": 100000 + i % 20000, "amount": 1, "price": "350.00", "currency": "€",
+             "option": random.choice(["", [{"option_label": "diamond", "value_label": "sapphire"}]])}
+        ]
+    if i % 10 == 0:
+        doc["option"] = {"category id": "42", "alloy": "white-375"}
+    return doc
+
+def build_raw_batches(n_docs, batch_size):
+    """Encodes synthetic documents into raw BSON batches."""
+    batches = []
+    for start in range(0, n_docs, batch_size):
+        batches.append(b"".join(bson.encode(make_summary_doc(i))
+                                for i in range(start, min(start + batch_size, n_docs))))
+    return batches
+
+def decode_batches(raw_batches):
+    """Decodes each raw batch in a single bson.decode_all call."""
+    return [doc for raw_batch in raw_batches for doc in bson.decode_all(raw_batch)]
+
+def timed(func, *args):
+    """Runs func(*args); returns (result, wall seconds, CPU seconds)."""
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    result = func(*args)
+    return result, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+def run(label, writer, raw_batches, n_docs):
+    """Times one path; returns (label, decode CPU us/row, encode CPU us/row, rows/sec, bytes)."""
+    # Every path decodes its own copy: transform_document modifies the documents
+    docs, decode_wall, decode_cpu = timed(decode_batches, raw_batches)
+    with tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False) as tmp:
+        path = tmp.name
+    try:
+        _, encode_wall, encode_cpu = timed(lambda: writer(docs, path, transform=user_behavior_export.transform_document))
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+    return (label, decode_cpu / n_docs * 1e6, encode_cpu / n_docs * 1e6,
+            n_docs / (decode_wall + encode_wall), size)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSONL serialization paths.")
+    parser.add_argument("--docs", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    raw_batches = build_raw_batches(args.docs, args.batch_size)
+
+    results = [
+        run("write_to_jsonl (json)", collection_export.write_to_jsonl, raw_batches, args.docs),
+        run(f"write_to_jsonl_fast ({'orjson' if orjson else 'json fallback'})",
+            collection_export.write_to_jsonl_fast, raw_batches, args.docs),
+    ]
+
+    print(f"{'path':<36} {'decode us/row':>14} {'encode us/row':>14} {'rows/sec':>12} {'bytes':>14}")
+    for label, decode_per_row, encode_per_row, rows_per_sec, size in results:
+        print(f"{label:<36} {decode_per_row:>14.2f} {encode_per_row:>14.2f} {rows_per_sec:>12,.0f} {size:>14,}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+# Benchmark: per-stage throughput, peak RSS and MongoDB read volume at growing scale
+#
+# For each scale (default 1M, 10M and 50M summary documents) the benchmark
+# database on a local mongod is topped up with generate_summary_data.py, then
+# every stage runs in a fresh Python process against it:
+#   get_unique_product_ids, process_ip_locations, export_user_behaviors,
+#   export_products, export_ip_locations, check_cart_products_options
+#
+# Measured per stage and scale:
+#   - throughput: input documents / wall time of the stage call (from a connected client)
+#   - peak RSS:   ru_maxrss of the child process (and its value before the stage)
+#   - read volume: growth of serverStatus network.bytesOut on the mongod
+#
+# Exports write their files to a scratch directory and skip the GCS upload.
+# process_ip_locations needs the IP2Location database from config.ini; without it
+# the stage is recorded as skipped and ip_locations comes from the generator.
+#
+# Every result is appended as one JSON line to ../benchmarks/stage_results.jsonl,
+# together with the git commit, so runs can be compared over time.
+#
+# Usage: python benchmark_stages.py [--scales 1000000 10000000 50000000] [--stage NAME ...]
+#                                   [--db glamira_bench] [--workers 4] [--fast] [--pushdown]
+#                                   [--format jsonl|parquet] [--results ../benchmarks/stage_results.jsonl]
+
+import argparse
+import configparser
+import json
+import os
+import platform
+import resource
+import runpy
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import runtime
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Configuration Section ---
+DEFAULT_SCALES = [1000000, 10000000, 50000000]
+DEFAULT_RESULTS_FILE = "../benchmarks/stage_results.jsonl"
+
+# Stage -> collection whose size is the stage's input
+STAGES = {
+    "get_unique_product_ids": "summary_collection",
+    "process_ip_locations": "summary_collection",
+    "export_user_behaviors": "summary_collection",
+    "export_products": "products_collection",
+    "export_ip_locations": "location_collection",
+    "check_cart_products_options": "summary_collection",
+}
+EXPORT_MODULES = {
+    "export_user_behaviors": "export_user_behavior_to_gcs",
+    "export_products": "export_products_to_gcs",
+    "export_ip_locations": "export_ip_location_to_gcs",
+}
+
+class StageSkipped(Exception):
+    """Raised in the child when a stage cannot run in this environment."""
+
+# --- Stage runners (child process) ---
+def run_get_unique_product_ids(workdir, options):
+    import crawl_product_name
+    config = runtime.load_config()
+    event_collections = [c.strip() for c in config["script_logic"]["event_collections"].split(",")]
+    summary = runtime.get_collection(config["mongodb"]["summary_collection"])
+    product_ids = crawl_product_name.get_unique_product_ids(
+        summary, os.path.join(workdir, "unique_product_ids.ids"), event_collections)
+    return {"unique_product_ids": len(product_ids or ())}
+
+def run_process_ip_locations(workdir, options):
+    import process_ip_location
+    config = runtime.load_config()
+    if not os.path.exists(runtime.resolve_path(config["ip2location"]["ip2location_db_path"])):
+        raise StageSkipped("IP2Location database not found")
+    # Start from an empty target so every scale does the full work
+    runtime.get_database().drop_collection(config["mongodb"]["location_collection"])
+    process_ip_location.process_ip_locations()
+    return {"ip_locations": runtime.get_collection(config["mongodb"]["location_collection"])
+            .estimated_document_count()}
+
+def run_export(stage):
+    def run(workdir, options):
+        import importlib
+        import collection_export
+        exporter = importlib.import_module(EXPORT_MODULES[stage])
+        exporter.LOCAL_FILE_PATH = os.path.join(workdir, os.path.basename(exporter.LOCAL_FILE_PATH))
+        exporter.QUARANTINE_FILE_PATH = os.path.join(workdir, os.path.basename(exporter.QUARANTINE_FILE_PATH))
+        uploaded = {}
+
+        def upload_to_gcs(bucket_name, source_file, destination_blob):
+            # Measure extraction and serialization only; keep the data file size for the record
+            if not destination_blob.endswith(collection_export.MANIFEST_SUFFIX):
+                uploaded["bytes"] = os.path.getsize(source_file)
+
+        collection_export.upload_to_gcs = upload_to_gcs
+        exporter.export_to_gcs(export_format=options["format"], fast=options["fast"], mode="full",
+                               pushdown=options["pushdown"], validate=False)
+        return {"file_bytes": uploaded.get("bytes", 0)}
+    return run
+
+def run_check_cart_products_options(workdir, options):
+    os.chdir(workdir)
+    runpy.run_module("check_cart_products_options", run_name="__main__")
+    with open("invalid_cart_products.jsonl", "rb") as f:
+        return {"offenders": sum(1 for _ in f)}
+
+STAGE_RUNNERS = {
+    "get_unique_product_ids": run_get_unique_product_ids,
+    "process_ip_locations": run_process_ip_locations,
+    "export_user_behaviors": run_export("export_user_behaviors"),
+    "export_products": run_export("export_products"),
+    "export_ip_locations": run_export("export_ip_locations"),
+    "check_cart_products_options": run_check_cart_products_options,
+}
+
+def max_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KB on Linux, bytes on macOS)."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def run_child(stage, workdir, options):
+    """Runs one stage in this (fresh) process and prints its measurements as JSON."""
+    # Connect before timing; the stage's own imports are part of what it costs
+    runtime.get_mongo_client()
+
+    baseline_rss = max_rss_mb()
+    started = time.perf_counter()
+    result = {"status": "ok"}
+    try:
+        result["output"] = STAGE_RUNNERS[stage](workdir, options)
+    except StageSkipped as e:
+        result = {"status": "skipped", "error": str(e)}
+    result["seconds"] = time.perf_counter() - started
+    result["baseline_rss_mb"] = round(baseline_rss, 1)
+    result["peak_rss_mb"] = round(max_rss_mb(), 1)
+    print(json.dumps(result))
+
+# --- Orchestration (parent process) ---
+def write_bench_config(db_name, workdir):
+    """Copy of the active config pointing at the benchmark database, with scratch files in workdir."""
+    source = runtime.load_config()
+    config = configparser.ConfigParser()
+    config.read_dict(source)
+    config["mongodb"]["db_name"] = db_name
+    config["ip2location"]["ip2location_db_path"] = runtime.resolve_path(source["ip2location"]["ip2location_db_path"])
+    for key in ("unique_ips_file", "unique_product_ids_file", "processed_product_ids_file",
+                "product_output_file", "failed_output_file", "log_file", "error_log_file"):
+        if config.has_option("script_logic", key):
+            config["script_logic"][key] = os.path.join(workdir, os.path.basename(source["script_logic"][key]))
+    path = os.path.join(workdir, "bench_config.ini")
+    with open(path, "w") as f:
+        config.write(f)
+    return path
+
+def mongo_bytes_out(client):
+    return client.admin.command("serverStatus")["network"]["bytesOut"]
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPTS_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_stage(stage, scale, docs, config_path, workdir, options, client):
+    """Runs a stage in a child process and returns its result record."""
+    stage_dir = tempfile.mkdtemp(prefix=f"{stage}_", dir=workdir)
+    env = dict(os.environ, GLAMIRA_CONFIG=config_path)
+    bytes_before = mongo_bytes_out(client)
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", stage, "--workdir", stage_dir,
+         "--child-options", json.dumps(options)],
+        cwd=SCRIPTS_DIR, env=env, capture_output=True, text=True)
+    bytes_read = mongo_bytes_out(client) - bytes_before
+    shutil.rmtree(stage_dir, ignore_errors=True)
+
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "host": socket.gethostname(),
+        "python": platform.python_version(),
+        "stage": stage,
+        "scale": scale,
+        "input_docs": docs,
+        "options": options,
+    }
+    if completed.returncode != 0:
+        record.update(status="failed", error=completed.stderr.strip().splitlines()[-1:])
+        return record
+
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    record.update(result)
+    record["docs_per_sec"] = round(docs / result["seconds"]) if result["status"] == "ok" and result["seconds"] else None
+    record["mongo_bytes_out"] = bytes_read
+    record["mongo_bytes_per_doc"] = round(bytes_read / docs, 1) if docs else None
+    return record
+
+def print_results(records):
+    print(f"{'stage':<30} {'scale':>11} {'status':<8} {'seconds':>9} {'docs/sec':>11} "
+          f"{'peak RSS MB':>12} {'Mongo MB out':>13}")
+    for r in records:
+        seconds = f"{r['seconds']:.1f}" if "seconds" in r else "-"
+        rate = f"{r['docs_per_sec']:,}" if r.get("docs_per_sec") else "-"
+        rss = f"{r['peak_rss_mb']:.0f}" if "peak_rss_mb" in r else "-"
+        mongo = f"{r['mongo_bytes_out'] / 1e6:.1f}" if "mongo_bytes_out" in r else "-"
+        print(f"{r['stage']:<30} {r['scale']:>11,} {r['status']:<8} {seconds:>9} {rate:>11} {rss:>12} {mongo:>13}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic data at several scales.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES)
+    parser.add_argument("--stage", action="append", choices=list(STAGES), help="Restrict to these stages")
+    parser.add_argument("--db", default="glamira_bench")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Generator processes")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--fast", action="store_true")
+    parser.add_argument("--pushdown", action="store_true")
+    parser.add_argument("--results", default=DEFAULT_RESULTS_FILE)
+    parser.add_argument("--child", choices=list(STAGES), help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--child-options", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.workdir, json.loads(args.child_options))
+        return
+
+    import generate_summary_data
+
+    options = {"format": args.format, "fast": args.fast, "pushdown": args.pushdown}
+    stages = args.stage or list(STAGES)
+    client = runtime.get_mongo_client()
+    db = client[args.db]
+    collections = runtime.load_config()["mongodb"]
+    os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+
+    records = []
+    workdir = tempfile.mkdtemp(prefix="glamira_bench_")
+    try:
+        config_path = write_bench_config(args.db, workdir)
+        # With the IP2Location database, ip_locations is rebuilt by process_ip_locations instead
+        ip2location_path = runtime.resolve_path(runtime.load_config()["ip2location"]["ip2location_db_path"])
+        synthetic_ip_locations = not os.path.exists(ip2location_path) or "process_ip_locations" not in stages
+        for scale in sorted(args.scales):
+            generate_summary_data.generate(db, scale, workers=args.workers, with_products=True,
+                                           with_ip_locations=synthetic_ip_locations)
+            for stage in stages:
+                docs = db[collections[STAGES[stage]]].estimated_document_count()
+                print(f"Running {stage} at {scale:,} documents...", flush=True)
+                record = run_stage(stage, scale, docs, config_path, workdir, options, client)
+                records.append(record)
+                with open(args.results, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        runtime.close_mongo_client()
+
+    print_results(records)
+    print(f"Results appended to {args.results}")
+
+if __name__ == "__main__":
+    main()
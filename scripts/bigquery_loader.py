@@ -0,0 +1,290 @@
+# Generic BigQuery loader (Cloud Functions)
+#
+# One deployment serves every export: objects are routed to their table by
+# name prefix through TABLE_REGISTRY.
+#   - bigquery_load:          per-object trigger (replaces the three
+#                             bigquery_load_*_function.py functions, now thin
+#                             wrappers around load_object)
+#   - bigquery_load_manifest: the batched mode. Triggered when an
+#                             "*_manifest.json" object lands; every export run
+#                             (collection_export.py, the stream, the rollup
+#                             snapshots) uploads one after its data, and all
+#                             objects it lists go into one load job
+#   - bigquery_load_prefix:   HTTP; loads every object of one export run
+#                             (<registry prefix><run timestamp>..., e.g. all
+#                             part files of a pipeline run) with one load job.
+#                             Broader prefixes are refused: they would list
+#                             every earlier export again, under a new job ID
+#
+# Deploy either bigquery_load or bigquery_load_manifest on a bucket, never both:
+# they derive different job IDs for the same object, so each file would be
+# loaded twice.
+#
+# Idempotency comes from the load job ID, derived from the target table and the
+# sorted source URIs (plus the object generation for single objects):
+# re-delivering the same event re-submits the same job ID, which BigQuery
+# rejects with 409 Conflict, and we simply wait on the existing job. If that job
+# failed, the load is resubmitted under the next retry ID (salt + "-r1", "-r2",
+# ... up to MAX_LOAD_ATTEMPTS), which is just as deterministic.
+#
+# Cold start: google.cloud imports are deferred to first use, and the client
+# and parsed schemas live at module scope so warm invocations reuse them.
+#
+# Target tables are created partitioned and clustered (bigquery_tables.py);
+# set PARTITION_EXPIRATION_DAYS on the function to expire old partitions. Loads
+# take their partitioning/clustering from the live table; an existing table that
+# is still unpartitioned is refused with its migration DDL (migration_sql()).
+# Raw exports are appended; the rollup snapshots (event_rollups.py) replace their
+# table's contents (write_disposition WRITE_TRUNCATE in the registry).
+
+import hashlib
+import json
+import os
+import re
+
+import functions_framework
+
+from bigquery_tables import TABLE_DEFINITIONS, apply_to_load_config, ensure_table
+
+# BigQuery settings
+PROJECT_ID = "my-glamira-project"
+DATASET_ID = "glamira_dataset"
+MANIFEST_SUFFIX = "_manifest.json"
+DATA_EXTENSIONS = (".jsonl", ".parquet")
+RUN_ID = re.compile(r"\d{4}-\d{2}-\d{2}-\d{6}")  # Run timestamp in object names (%Y-%m-%d-%H%M%S)
+# Partition expiry for tables without their own override (unset = keep forever)
+PARTITION_EXPIRATION_DAYS = os.environ.get("PARTITION_EXPIRATION_DAYS")
+
+DEFAULT_WRITE_DISPOSITION = "WRITE_APPEND"
+MAX_LOAD_ATTEMPTS = 3  # Job IDs tried per load: the base ID, then -r1, -r2
+
+# Object name prefix -> target table, schema file and (optionally) write disposition
+TABLE_REGISTRY = {
+    "exports/user_behaviors/user_behaviors_": {"table_id": "raw_user_behaviors", "schema_path": "user_behaviors_schema.json"},
+    "exports/products/products_": {"table_id": "raw_products", "schema_path": "products_schema.json"},
+    "exports/ip_locations/ip_locations_": {"table_id": "raw_ip_locations", "schema_path": "ip_locations_schema.json"},
+    "exports/rollups/product_daily_events/product_daily_events_": {
+        "table_id": "agg_product_daily_events", "schema_path": "agg_product_daily_events_schema.json",
+        "write_disposition": "WRITE_TRUNCATE"},
+    "exports/rollups/product_daily_unique_ips/product_daily_unique_ips_": {
+        "table_id": "agg_product_daily_unique_ips", "schema_path": "agg_product_daily_unique_ips_schema.json",
+        "write_disposition": "WRITE_TRUNCATE"},
+    "exports/rollups/add_to_cart_daily/add_to_cart_daily_": {
+        "table_id": "agg_add_to_cart_daily", "schema_path": "agg_add_to_cart_daily_schema.json",
+        "write_disposition": "WRITE_TRUNCATE"},
+}
+
+# Created lazily, once per instance
+_bigquery_client = None
+_storage_client = None
+_schema_cache = {}
+_ensured_tables = {}  # table_id -> live Table, as returned by ensure_table()
+
+# --- Lazy clients and schemas ---
+def get_bigquery_client():
+    """Returns the instance-wide BigQuery client, creating it on first use."""
+    global _bigquery_client
+    if _bigquery_client is None:
+        from google.cloud import bigquery
+        _bigquery_client = bigquery.Client(project=PROJECT_ID)
+    return _bigquery_client
+
+def get_storage_client():
+    """Returns the instance-wide Storage client, creating it on first use."""
+    global _storage_client
+    if _storage_client is None:
+        from google.cloud import storage
+        _storage_client = storage.Client(project=PROJECT_ID)
+    return _storage_client
+
+def get_schema(client, schema_path):
+    """Returns the parsed schema for a schema file, reading it only once per instance."""
+    schema = _schema_cache.get(schema_path)
+    if schema is None:
+        with open(schema_path, "r") as schema_file:
+            schema = client.schema_from_json(schema_file)
+        _schema_cache[schema_path] = schema
+    return schema
+
+def ensure_target_table(client, table_id, schema_path):
+    """Creates or syncs the partitioned/clustered target table once per instance; returns the live table."""
+    if table_id not in TABLE_DEFINITIONS:
+        return None
+    if table_id not in _ensured_tables:
+        table_ref = client.dataset(DATASET_ID).table(table_id)
+        _ensured_tables[table_id] = ensure_table(client, table_ref, get_schema(client, schema_path),
+                                                 TABLE_DEFINITIONS[table_id], PARTITION_EXPIRATION_DAYS)
+    return _ensured_tables[table_id]
+
+# --- Helper Functions ---
+def resolve_target(object_name):
+    """Returns the TABLE_REGISTRY entry whose prefix matches the object name, or None."""
+    for prefix, target in TABLE_REGISTRY.items():
+        if object_name.startswith(prefix):
+            return target
+    return None
+
+def is_run_prefix(prefix):
+    """True when prefix names the objects of one export run: a registry prefix plus a full run timestamp."""
+    return any(prefix.startswith(registered) and RUN_ID.match(prefix, len(registered))
+               for registered in TABLE_REGISTRY)
+
+def load_job_id(table_id, uris, salt=""):
+    """Deterministic load job ID for a set of source URIs."""
+    key = "\n".join(sorted(uris)) + salt
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:40]
+    return f"load_{table_id}_{digest}"
+
+def group_by_format(uris):
+    """Splits URIs by source format, since one load job takes a single format."""
+    from google.cloud import bigquery
+
+    groups = {}
+    for uri in uris:
+        source_format = (bigquery.SourceFormat.PARQUET if uri.endswith(".parquet")
+                         else bigquery.SourceFormat.NEWLINE_DELIMITED_JSON)
+        groups.setdefault(source_format, []).append(uri)
+    return groups
+
+def build_load_config(client, table_id, schema_path, source_format, write_disposition=DEFAULT_WRITE_DISPOSITION,
+                      table=None):
+    """Builds the LoadJobConfig used for every load (matching the live table's layout when given)."""
+    from google.cloud import bigquery
+
+    load_config = bigquery.LoadJobConfig(
+        source_format=source_format,
+        write_disposition=write_disposition,
+        schema=get_schema(client, schema_path),
+    )
+    if source_format == bigquery.SourceFormat.PARQUET:
+        parquet_options = bigquery.ParquetOptions()
+        parquet_options.enable_list_inference = True
+        load_config.parquet_options = parquet_options
+    if table is not None:
+        apply_to_load_config(load_config, table, TABLE_DEFINITIONS[table_id])
+    return load_config
+
+def submit_load(client, table_id, table_ref, uris, load_config, salt=""):
+    """Starts the load job for uris, or picks up the existing one; resubmits under a retry ID when it failed."""
+    from google.api_core.exceptions import Conflict
+
+    for attempt in range(MAX_LOAD_ATTEMPTS):
+        job_id = load_job_id(table_id, uris, salt + (f"-r{attempt}" if attempt else ""))
+        try:
+            job = client.load_table_from_uri(uris, table_ref, job_id=job_id, job_config=load_config)
+            print(f"Started load job {job_id} for {len(uris)} files into {table_id}")
+            return job
+        except Conflict:
+            # Same URIs already submitted: wait on the existing job instead of loading twice
+            job = client.get_job(job_id)
+            if job.state == "DONE" and job.error_result:
+                print(f"Load job {job_id} already exists and failed: {job.error_result.get('message')}")
+                continue
+            print(f"Load job {job_id} already exists (state={job.state}). Not resubmitting.")
+            return job
+    raise RuntimeError(f"Loading {len(uris)} files into {table_id} failed in all {MAX_LOAD_ATTEMPTS} load jobs "
+                       f"(last: {job_id}: {job.error_result}). Fix the cause and reload with a new salt.")
+
+def load_uris(client, table_id, schema_path, uris, salt="", write_disposition=DEFAULT_WRITE_DISPOSITION):
+    """Loads all URIs with one load job per source format; safe to call repeatedly."""
+    table = ensure_target_table(client, table_id, schema_path)
+    table_ref = client.dataset(DATASET_ID).table(table_id)
+    jobs = []
+    for source_format, format_uris in group_by_format(uris).items():
+        load_config = build_load_config(client, table_id, schema_path, source_format, write_disposition, table)
+        job = submit_load(client, table_id, table_ref, format_uris, load_config, salt)
+        job.result()
+        print(f"Load job {job.job_id} done: {job.output_rows} rows into {table_ref.path}")
+        jobs.append(job)
+    return jobs
+
+def list_prefix_uris(storage_client, bucket_name, prefix):
+    """Lists the data objects under a prefix as gs:// URIs."""
+    return sorted(
+        f"gs://{bucket_name}/{blob.name}"
+        for blob in storage_client.list_blobs(bucket_name, prefix=prefix)
+        if blob.name.endswith(DATA_EXTENSIONS)
+    )
+
+def read_manifest(storage_client, bucket_name, manifest_name):
+    """Reads a manifest ({"objects": [...]}) and returns its data objects as gs:// URIs."""
+    blob = storage_client.bucket(bucket_name).blob(manifest_name)
+    manifest = json.loads(blob.download_as_text())
+    return sorted(
+        name if name.startswith("gs://") else f"gs://{bucket_name}/{name}"
+        for name in manifest["objects"]
+    )
+
+def load_object(client, bucket_name, object_name, generation=""):
+    """Loads a single object into the table routed by its name."""
+    target = resolve_target(object_name)
+    if target is None or not object_name.endswith(DATA_EXTENSIONS):
+        print(f"Ignoring file {object_name}. It does not match the required naming convention.")
+        return []
+
+    uri = f"gs://{bucket_name}/{object_name}"
+    # The generation makes an overwritten object (same name, new content) a new job
+    return load_uris(client, target["table_id"], target["schema_path"], [uri], salt=str(generation),
+                     write_disposition=target.get("write_disposition", DEFAULT_WRITE_DISPOSITION))
+
+def load_manifest(client, storage_client, bucket_name, manifest_name):
+    """Loads every object listed in a manifest into the table routed by the manifest name."""
+    target = resolve_target(manifest_name)
+    if target is None:
+        print(f"Ignoring manifest {manifest_name}. No load target matches its prefix.")
+        return []
+
+    uris = read_manifest(storage_client, bucket_name, manifest_name)
+    if not uris:
+        print(f"Manifest {manifest_name} lists no objects. Nothing to load.")
+        return []
+    return load_uris(client, target["table_id"], target["schema_path"], uris,
+                     write_disposition=target.get("write_disposition", DEFAULT_WRITE_DISPOSITION))
+
+def load_prefix(client, storage_client, bucket_name, prefix):
+    """Loads every data object of one export run (a run-scoped prefix) with a single load job."""
+    target = resolve_target(prefix)
+    if target is None:
+        raise ValueError(f"No load target matches prefix '{prefix}'")
+    if not is_run_prefix(prefix):
+        raise ValueError(f"Prefix '{prefix}' is not scoped to one export run; expected "
+                         f"<registry prefix><YYYY-mm-dd-HHMMSS>..., e.g. 'exports/products/products_2024-01-31-120000'")
+
+    uris = list_prefix_uris(storage_client, bucket_name, prefix)
+    if not uris:
+        print(f"No data objects under gs://{bucket_name}/{prefix}. Nothing to load.")
+        return []
+    return load_uris(client, target["table_id"], target["schema_path"], uris,
+                     write_disposition=target.get("write_disposition", DEFAULT_WRITE_DISPOSITION))
+
+# --- Cloud Function entry points ---
+@functions_framework.cloud_event
+def bigquery_load(cloud_event):
+    data = cloud_event.data
+    load_object(get_bigquery_client(), data["bucket"], data["name"], data.get("generation", ""))
+
+@functions_framework.cloud_event
+def bigquery_load_manifest(cloud_event):
+    data = cloud_event.data
+    bucket_name = data["bucket"]
+    file_path = data["name"]
+
+    if not file_path.endswith(MANIFEST_SUFFIX):
+        print(f"Ignoring file {file_path}. Only manifests trigger batched loads.")
+        return
+
+    load_manifest(get_bigquery_client(), get_storage_client(), bucket_name, file_path)
+
+@functions_framework.http
+def bigquery_load_prefix(request):
+    payload = request.get_json(silent=True) or {}
+    bucket_name = payload.get("bucket")
+    prefix = payload.get("prefix")
+    if not bucket_name or not prefix:
+        return ("Expected JSON body with 'bucket' and 'prefix'.", 400)
+
+    try:
+        jobs = load_prefix(get_bigquery_client(), get_storage_client(), bucket_name, prefix)
+    except ValueError as e:
+        return (str(e), 400)
+    return {"jobs": [job.job_id for job in jobs]}
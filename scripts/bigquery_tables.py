@@ -0,0 +1,213 @@
+# Table definitions for the raw BigQuery tables
+#
+# The loaders create the target tables on first use with time partitioning and
+# clustering on our hot filter columns, and keep clustering / partition expiry in
+# sync afterwards. Every function takes the client as an argument so the logic
+# can be exercised against a fake client.
+#
+# Tables created before partitioning existed have to be rebuilt once:
+#   python bigquery_tables.py --print-migration [--unpartitioned] [TABLE ...] > migration.sql
+#   bq query --use_legacy_sql=false < migration.sql
+
+import logging
+
+# Partitioning type: "DAY" or "HOUR". partition_field None = ingestion time (_PARTITIONTIME).
+TABLE_DEFINITIONS = {
+    "raw_user_behaviors": {
+        "partition_type": "DAY",
+        "partition_field": None,
+        "clustering_fields": ["collection", "product_id", "ip"],
+    },
+    "raw_products": {
+        "partition_type": "DAY",
+        "partition_field": None,
+        "clustering_fields": ["product_id"],
+    },
+    "raw_ip_locations": {
+        "partition_type": "DAY",
+        "partition_field": None,
+        "clustering_fields": ["ip"],
+    },
+    # Rollup snapshots from event_rollups.py, partitioned by event day
+    "agg_product_daily_events": {
+        "partition_type": "DAY",
+        "partition_field": "day",
+        "clustering_fields": ["product_id", "collection"],
+    },
+    "agg_product_daily_unique_ips": {
+        "partition_type": "DAY",
+        "partition_field": "day",
+        "clustering_fields": ["product_id"],
+    },
+    "agg_add_to_cart_daily": {
+        "partition_type": "DAY",
+        "partition_field": "day",
+        "clustering_fields": ["product_id"],
+    },
+}
+
+def expiration_ms(definition, default_days=None):
+    """Partition expiry in milliseconds (per-table override first), or None to keep partitions forever."""
+    days = definition.get("partition_expiration_days", default_days)
+    if days is None or str(days).strip() == "":
+        return None
+    days = float(days)  # PARTITION_EXPIRATION_DAYS arrives as a string
+    if days <= 0:
+        return None
+    return int(days * 24 * 60 * 60 * 1000)
+
+def build_time_partitioning(definition, default_expiration_days=None):
+    """Builds the TimePartitioning object for a table definition."""
+    from google.cloud import bigquery
+
+    return bigquery.TimePartitioning(
+        type_=definition.get("partition_type", "DAY"),
+        field=definition.get("partition_field"),
+        expiration_ms=expiration_ms(definition, default_expiration_days),
+    )
+
+def build_table(table_ref, schema, definition, default_expiration_days=None):
+    """Builds a partitioned, clustered Table object ready for create_table()."""
+    from google.cloud import bigquery
+
+    table = bigquery.Table(table_ref, schema=schema)
+    table.time_partitioning = build_time_partitioning(definition, default_expiration_days)
+    table.clustering_fields = definition.get("clustering_fields") or None
+    return table
+
+def ensure_table(client, table_ref, schema, definition, default_expiration_days=None):
+    """Creates the table if missing, otherwise syncs clustering and partition expiry; returns the live table."""
+    from google.api_core.exceptions import NotFound
+
+    try:
+        table = client.get_table(table_ref)
+    except NotFound:
+        table = client.create_table(build_table(table_ref, schema, definition, default_expiration_days))
+        logging.info(f"Created table {table_ref} partitioned by "
+                     f"{definition.get('partition_field') or '_PARTITIONTIME'} "
+                     f"and clustered on {definition.get('clustering_fields')}")
+        return table
+
+    if table.time_partitioning is None:
+        # Partitioning cannot be added in place; see migration_sql()
+        logging.warning(f"Table {table_ref} is not partitioned. Recreate it with migration_sql() to enable pruning.")
+        return table
+
+    fields_to_update = []
+    desired_clustering = definition.get("clustering_fields") or None
+    if table.clustering_fields != desired_clustering:
+        table.clustering_fields = desired_clustering
+        fields_to_update.append("clustering_fields")
+
+    desired_expiration = expiration_ms(definition, default_expiration_days)
+    if table.time_partitioning.expiration_ms != desired_expiration:
+        table.time_partitioning.expiration_ms = desired_expiration
+        fields_to_update.append("time_partitioning")
+
+    if fields_to_update:
+        table = client.update_table(table, fields_to_update)
+        logging.info(f"Updated {fields_to_update} on table {table_ref}")
+    return table
+
+def apply_to_load_config(load_config, table, definition):
+    """Copies the live table's partitioning/clustering onto a LoadJobConfig.
+
+    Raises ValueError for an unpartitioned table: a load with a partitioning spec
+    would be rejected by BigQuery, so the table has to be migrated first.
+    """
+    if table.time_partitioning is None:
+        raise ValueError(f"Table {table.project}.{table.dataset_id}.{table.table_id} is not partitioned. "
+                         f"Migrate it before loading:\n"
+                         f"{migration_sql(table.project, table.dataset_id, table.table_id, definition)}")
+    load_config.time_partitioning = table.time_partitioning
+    load_config.clustering_fields = table.clustering_fields
+    return load_config
+
+def migration_sql(project_id, dataset_id, table_id, definition):
+    """DDL that rebuilds an existing unpartitioned table with the configured layout."""
+    partition_field = definition.get("partition_field")
+    partition_type = definition.get("partition_type", "DAY")
+    if partition_field:
+        # Daily partition fields are DATE columns (the rollup day), which partition as-is
+        partition_by = partition_field if partition_type == "DAY" else f"TIMESTAMP_TRUNC({partition_field}, {partition_type})"
+        select = "SELECT * FROM"
+    else:
+        # Ingestion-time tables cannot be filled by CTAS: create the table empty and
+        # copy the history in (it lands in the migration day's partition).
+        partition_by = "_PARTITIONDATE" if partition_type == "DAY" else f"TIMESTAMP_TRUNC(_PARTITIONTIME, {partition_type})"
+        select = None
+
+    cluster_by = ", ".join(definition.get("clustering_fields") or [])
+    target = f"`{project_id}.{dataset_id}.{table_id}`"
+    source = f"`{project_id}.{dataset_id}.{table_id}_unpartitioned`"
+
+    statements = [f"ALTER TABLE {target} RENAME TO `{table_id}_unpartitioned`;"]
+    if select:
+        statements.append(
+            f"CREATE TABLE {target} PARTITION BY {partition_by}"
+            + (f" CLUSTER BY {cluster_by}" if cluster_by else "")
+            + f" AS {select} {source};"
+        )
+    else:
+        statements.append(
+            f"CREATE TABLE {target} LIKE {source} PARTITION BY {partition_by}"
+            + (f" CLUSTER BY {cluster_by}" if cluster_by else "")
+            + ";"
+        )
+        statements.append(f"INSERT INTO {target} SELECT * FROM {source};")
+    return "\n".join(statements)
+
+def unpartitioned_tables(client, project_id, dataset_id, table_ids):
+    """The existing tables among table_ids that are not partitioned yet (missing tables are created partitioned)."""
+    from google.api_core.exceptions import NotFound
+
+    found = []
+    for table_id in table_ids:
+        try:
+            table = client.get_table(f"{project_id}.{dataset_id}.{table_id}")
+        except NotFound:
+            continue
+        if table.time_partitioning is None:
+            found.append(table_id)
+    return found
+
+def migration_script(project_id, dataset_id, table_ids):
+    """migration_sql() for every table, as one script."""
+    return "\n\n".join(f"-- {table_id}\n{migration_sql(project_id, dataset_id, table_id, TABLE_DEFINITIONS[table_id])}"
+                       for table_id in table_ids)
+
+# --- Script entry point ---
+def main(argv=None):
+    import argparse
+
+    from bigquery_loader import DATASET_ID, PROJECT_ID
+
+    parser = argparse.ArgumentParser(description="Table layout tools for the BigQuery dataset.")
+    parser.add_argument("--print-migration", action="store_true",
+                        help="Print the DDL that rebuilds unpartitioned tables with their configured layout")
+    parser.add_argument("--unpartitioned", action="store_true",
+                        help="Only tables that exist and are still unpartitioned (queries BigQuery)")
+    parser.add_argument("--project", default=PROJECT_ID)
+    parser.add_argument("--dataset", default=DATASET_ID)
+    parser.add_argument("tables", nargs="*", metavar="TABLE",
+                        help=f"Tables to migrate (default: all of {', '.join(TABLE_DEFINITIONS)})")
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.tables) - set(TABLE_DEFINITIONS))
+    if unknown:
+        parser.error(f"unknown table(s): {', '.join(unknown)}")
+
+    if not args.print_migration:
+        parser.print_help()
+        return
+
+    table_ids = args.tables or list(TABLE_DEFINITIONS)
+    if args.unpartitioned:
+        from google.cloud import bigquery
+        table_ids = unpartitioned_tables(bigquery.Client(project=args.project), args.project, args.dataset, table_ids)
+    if table_ids:
+        print(migration_script(args.project, args.dataset, table_ids))
+    else:
+        print("-- Every table is already partitioned. Nothing to migrate.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# Shared MongoDB -> GCS export of one collection
+#
+# export_user_behavior_to_gcs.py, export_products_to_gcs.py and
+# export_ip_location_to_gcs.py only describe their dataset in an ExportSpec
+# (collection, transform_document, watermark field, schema and paths). Reading
+# (find, raw BSON batches or a pushdown pipeline), delta watermarks, IP
+# enrichment, schema validation, JSONL/Parquet serialization and the upload are
+# implemented here once, for every dataset.
+#
+# Every run uploads a manifest next to its data object
+# (<object name without extension>_manifest.json, listing the run's objects),
+# which bigquery_loader.bigquery_load_manifest loads with one job per run.
+
+import json
+import logging
+import os
+from datetime import datetime
+
+import profiling
+import runtime
+
+# --- Configuration Section ---
+GCS_BUCKET_NAME = "raw-glamira-data"
+EXPORT_FORMATS = ("jsonl", "parquet")
+EXPORT_MODES = ("full", "delta")
+ENRICH_SOURCES = ("index", "ip2location")
+EXPORT_MODULES = {  # Dataset -> exporter script (each defines export_spec())
+    "user_behaviors": "export_user_behavior_to_gcs",
+    "products": "export_products_to_gcs",
+    "ip_locations": "export_ip_location_to_gcs",
+}
+MANIFEST_SUFFIX = "_manifest.json"  # Same as bigquery_loader.MANIFEST_SUFFIX
+
+class ExportSpec:
+    """What one exporter script exports, and where to."""
+
+    def __init__(self, collection, transform, schema_path, gcs_prefix, local_file_path,
+                 quarantine_file_path, gcs_quarantine_prefix, watermark_field="_id",
+                 bucket=GCS_BUCKET_NAME, batch_size=None, enrichment_stats_path=None):
+        self.collection = collection
+        self.transform = transform                  # Per-row cleanup, see the exporter's transform_document()
+        self.schema_path = schema_path              # BigQuery schema (Parquet typing, validation)
+        self.gcs_prefix = gcs_prefix                # Object names: <gcs_prefix>_<timestamp>[_<range>].<format>
+        self.local_file_path = local_file_path
+        self.quarantine_file_path = quarantine_file_path
+        self.gcs_quarantine_prefix = gcs_quarantine_prefix
+        self.watermark_field = watermark_field      # Delta exports read documents beyond its saved maximum
+        self.bucket = bucket
+        self.batch_size = batch_size                # None = [mongodb] cursor_batch_size from config.ini
+        self.enrichment_stats_path = enrichment_stats_path  # Set for datasets that support --enrich
+
+    @property
+    def supports_enrichment(self):
+        return self.enrichment_stats_path is not None
+
+# --- Extraction ---
+def get_mongo_connection():
+    """Returns the configured database on the shared, pooled MongoDB client."""
+    return runtime.get_database()
+
+def extract_data(collection_name, batch_size, query=None):
+    """Extracts documents from a MongoDB collection in batches."""
+    db = get_mongo_connection()
+    collection = db[collection_name]
+
+    cursor = collection.find(query or {}, batch_size=batch_size)
+    for doc in profiling.timed_iter("export.mongo_cursor", cursor):
+        yield doc
+
+def extract_data_fast(collection_name, batch_size, query=None):
+    """Extracts documents as raw BSON batches, decoding each batch in one call."""
+    from fast_jsonl import iter_raw_batches
+    db = get_mongo_connection()
+    yield from profiling.timed_iter("export.mongo_cursor",
+                                    iter_raw_batches(db[collection_name], query, batch_size=batch_size))
+
+def extract_data_pipeline(collection_name, batch_size, pipeline, fast=False):
+    """Extracts documents already shaped by a server-side aggregation pipeline."""
+    db = get_mongo_connection()
+    collection = db[collection_name]
+
+    if fast:
+        from fast_jsonl import iter_raw_aggregate_batches
+        docs = iter_raw_aggregate_batches(collection, pipeline, batch_size=batch_size)
+    else:
+        docs = collection.aggregate(pipeline, batchSize=batch_size)
+    yield from profiling.timed_iter("export.mongo_aggregate", docs)
+
+# --- Serialization ---
+def write_to_jsonl(docs, file_path, transform=None):
+    """Writes documents to a JSONL file."""
+    transform = profiling.wrap("export.transform", transform)
+    dumps = profiling.wrap("export.json_dumps", json.dumps)
+    with open(file_path, "w", encoding='utf-8') as f:
+        for doc in docs:
+            if transform is not None:
+                doc = transform(doc)
+            f.write(dumps(doc) + "\n")
+
+def write_to_jsonl_fast(docs, file_path, transform=None):
+    """Writes documents to a JSONL file using the fast encoder and buffered writes."""
+    from fast_jsonl import write_jsonl_fast
+    transform = profiling.wrap("export.transform", transform)
+    if transform is not None:
+        docs = (transform(doc) for doc in docs)
+    return write_jsonl_fast(docs, file_path)
+
+def write_to_parquet(docs, file_path, schema_path, transform=None, extra_fields=None):
+    """Writes documents to a Parquet file typed by the BigQuery schema (plus extra_fields)."""
+    from parquet_export import write_to_parquet as write_parquet_file
+    transform = profiling.wrap("export.transform", transform)
+    if transform is not None:
+        docs = (transform(doc) for doc in docs)
+    return write_parquet_file(docs, file_path, schema_path, extra_fields=extra_fields)
+
+def upload_to_gcs(bucket_name, source_file, destination_blob):
+    """Uploads a file to a specified Google Cloud Storage bucket."""
+    from google.cloud import storage
+    with profiling.span("export.gcs_upload"):
+        client = storage.Client()
+        bucket = client.bucket(bucket_name)
+        blob = bucket.blob(destination_blob)
+        blob.upload_from_filename(source_file)
+    print(f"Uploaded {source_file} to gs://{bucket_name}/{destination_blob}")
+
+def manifest_name(object_name):
+    """Object name of the manifest for a run whose (first) data object is object_name."""
+    return os.path.splitext(object_name)[0] + MANIFEST_SUFFIX
+
+def write_manifest(object_names, file_path):
+    """Writes the manifest listing a run's data objects; returns file_path."""
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump({"objects": list(object_names)}, f)
+    return file_path
+
+# --- Export ---
+def export_to_gcs(spec, export_format="jsonl", fast=False, mode="full", pushdown=False, validate=False,
+                  enrich=None):
+    """Exports spec.collection to GCS."""
+    logging.info(f"Starting export of '{spec.collection}' from MongoDB (format={export_format}, fast={fast}, "
+                 f"mode={mode}, pushdown={pushdown}, validate={validate}, enrich={enrich})")
+
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    if mode not in EXPORT_MODES:
+        raise ValueError(f"Unsupported export mode: {mode}")
+    if enrich and not spec.supports_enrichment:
+        raise ValueError(f"IP enrichment is not supported for '{spec.collection}'")
+
+    batch_size = spec.batch_size or runtime.mongo_batch_size()
+
+    # Generate a timestamped destination file name
+    timestamp = datetime.now().strftime("%Y-%m-%d-%H%M%S")
+    gcs_destination_blob = f"{spec.gcs_prefix}_{timestamp}.{export_format}"
+    local_file_path = os.path.splitext(spec.local_file_path)[0] + f".{export_format}"
+
+    # In delta mode only documents beyond the last uploaded watermark are read
+    query = {}
+    tracker = None
+    if mode == "delta":
+        from export_watermark import load_watermark, watermark_query, WatermarkTracker
+        previous_watermark = load_watermark(spec.collection)
+        query = watermark_query(spec.watermark_field, previous_watermark)
+        tracker = WatermarkTracker(spec.watermark_field)
+        logging.info(f"Delta export of '{spec.collection}' from {spec.watermark_field} > {previous_watermark}")
+
+    transform = spec.transform
+    if pushdown:
+        # Documents arrive already transformed, exactly as transform_document() would leave them
+        from export_pipelines import build_pipeline, WATERMARK_KEY
+        pipeline = build_pipeline(spec.collection, query,
+                                  watermark_field=spec.watermark_field if tracker is not None else None)
+        if tracker is not None:
+            tracker.source_key = WATERMARK_KEY
+        docs = extract_data_pipeline(spec.collection, batch_size, pipeline, fast=fast)
+        transform = None
+    elif fast:
+        docs = extract_data_fast(spec.collection, batch_size=batch_size, query=query)
+    else:
+        docs = extract_data(spec.collection, batch_size=batch_size, query=query)
+    if tracker is not None:
+        docs = tracker.track(docs)
+
+    # Attach the IP location in the same pass, so BigQuery needs no join with raw_ip_locations
+    enricher = None
+    extra_fields = None
+    if enrich:
+        from ip_enrichment import build_enricher, SCHEMA_FIELDS
+        enricher = build_enricher(enrich)
+        docs = enricher.enrich(docs)
+        extra_fields = SCHEMA_FIELDS
+
+    # Validate transformed rows in the same pass; rejects go to the quarantine file
+    quarantine = None
+    if validate:
+        from export_validation import SchemaValidator, Quarantine
+        from parquet_export import load_bigquery_schema, extend_schema
+        if transform is not None:
+            docs = map(transform, docs)
+            transform = None
+        validator = SchemaValidator(extend_schema(load_bigquery_schema(spec.schema_path), extra_fields))
+        quarantine = Quarantine(validator, spec.quarantine_file_path)
+        docs = quarantine.filter(docs)
+
+    # Total for reading, transforming and writing; the export.* spans break it down
+    with profiling.span("export.extract_and_write"):
+        if export_format == "parquet":
+            write_to_parquet(docs, local_file_path, spec.schema_path, transform=transform,
+                             extra_fields=extra_fields)
+        elif fast:
+            write_to_jsonl_fast(docs, local_file_path, transform=transform)
+        else:
+            write_to_jsonl(docs, local_file_path, transform=transform)
+
+    if enricher is not None:
+        enricher.log_summary()
+        enricher.write_summary(spec.enrichment_stats_path)
+
+    if tracker is not None:
+        if tracker.count == 0:
+            logging.info("No new documents since the last export. Nothing to upload.")
+            return
+        from export_watermark import format_range_value
+        # Encode the exported range in the object name: (previous watermark, new watermark]
+        gcs_destination_blob = (f"{spec.gcs_prefix}_{timestamp}_"
+                                f"{format_range_value(previous_watermark)}-{format_range_value(tracker.max_value)}"
+                                f".{export_format}")
+
+    upload_to_gcs(spec.bucket, local_file_path, gcs_destination_blob)
+    # Uploaded after the data, so the batched loader only ever sees complete runs
+    manifest_path = write_manifest([gcs_destination_blob], manifest_name(local_file_path))
+    upload_to_gcs(spec.bucket, manifest_path, manifest_name(gcs_destination_blob))
+
+    if quarantine is not None:
+        quarantine.log_summary()
+        with open(f"{spec.quarantine_file_path}.stats.json", "w", encoding="utf-8") as f:
+            json.dump(quarantine.summary(), f, indent=4)
+        if quarantine.quarantined_count:
+            upload_to_gcs(spec.bucket, spec.quarantine_file_path, f"{spec.gcs_quarantine_prefix}_{timestamp}.jsonl")
+
+    # Advance the watermark only once the upload has succeeded
+    if tracker is not None:
+        from export_watermark import save_watermark
+        save_watermark(spec.collection, spec.watermark_field, tracker.max_value)
+
+    logging.info("Export successfully")
+
+# --- Command line ---
+def main(export, description, session_name, enrich=False):
+    """Command line of an exporter script; options left unset fall back to export()'s defaults."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--format", dest="export_format", choices=EXPORT_FORMATS)
+    parser.add_argument("--fast", action="store_true", default=None,
+                        help="Read raw BSON batches and serialize with orjson")
+    parser.add_argument("--mode", choices=EXPORT_MODES,
+                        help="delta exports only documents beyond the persisted watermark")
+    parser.add_argument("--pushdown", action="store_true", default=None,
+                        help="Apply the row transforms in a MongoDB aggregation pipeline")
+    parser.add_argument("--validate", action="store_true", default=None,
+                        help="Quarantine rows that do not match the BigQuery schema")
+    if enrich:
+        parser.add_argument("--enrich", choices=ENRICH_SOURCES,
+                            help="Attach country_code/region_name/city_name from ip_locations or the IP2Location file")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.configure(args.profile)
+    options = {name: value for name, value in vars(args).items() if name != "profile" and value is not None}
+    with profiling.session(session_name):
+        export(**options)
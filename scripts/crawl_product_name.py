@@ -3,11 +3,9 @@
 import pymongo
 import csv
 import logging
-import configparser
 import os
 import requests
 import time
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 import json
 import sys
@@ -16,6 +14,10 @@ import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import re
 
+import profiling
+import runtime
+from id_sets import IdSet, IdSetBuilder, as_id_set, load_ids, save_ids
+
 # --- Set up logging for better tracking and error reporting ---
 def setup_logging(log_file, error_log_file):
     """Configures logging to write to a main log file and a separate error log file."""
@@ -40,20 +42,17 @@ def setup_logging(log_file, error_log_file):
     root_logger.addHandler(console_handler)
 
 # --- Load configuration from INI file ---
-def load_config(filename='../config/config.ini'):
-    """Loads configuration from the specified INI file."""
-    config = configparser.ConfigParser()
-    if not os.path.exists(filename):
-        logging.error(f"Configuration file '{filename}' not found. Please create it.")
-        raise FileNotFoundError(f"Configuration file '{filename}' not found.")
-    config.read(filename)
-    return config
+def load_config(filename=None):
+    """Loads the validated configuration shared by all scripts (see runtime.py)."""
+    if filename:
+        runtime.set_config_path(filename)
+    return runtime.load_config()
 
 # --- MongoDB connection function ---
 def connect_to_mongodb(mongo_uri, db_name):
-    """Establishes a connection to MongoDB and returns the database object."""
+    """Returns the database and client from the shared, pooled MongoDB client."""
     try:
-        client = pymongo.MongoClient(mongo_uri)
+        client = runtime.get_mongo_client()
         db = client[db_name]
         logging.info("Successfully connected to MongoDB.")
         return db, client
@@ -63,24 +62,23 @@ def connect_to_mongodb(mongo_uri, db_name):
 
 # --- Function to get unique product IDs only ---
 def get_unique_product_ids(summary_collection, unique_ids_file, event_collections):
-    """Extracts unique product IDs from a MongoDB collection or a file."""
-    product_ids = set()
-    if os.path.exists(unique_ids_file):
-        logging.info(f"Loading unique product IDs from file: '{unique_ids_file}'...")
-        try:
-            with open(unique_ids_file, 'r') as f:
-                product_ids = set(json.load(f))
-            logging.info(f"Loaded {len(product_ids)} unique product IDs from file.")
+    """Extracts unique product IDs (an IdSet, see id_sets.py) from a MongoDB collection or a file."""
+    try:
+        with profiling.span("crawl.load_unique_ids"):
+            product_ids = load_ids(unique_ids_file)
+        if product_ids is not None:
+            logging.info(f"Loaded {len(product_ids)} unique product IDs from file: '{unique_ids_file}'.")
             return product_ids
-        except Exception as e:
-            logging.error(f"Error loading unique product IDs from file: {e}. Re-extracting from MongoDB.")
+    except Exception as e:
+        logging.error(f"Error loading unique product IDs from file: {e}. Re-extracting from MongoDB.")
 
     logging.info(f"Extracting unique product IDs from the 'summary' collection for events: {event_collections}")
     try:
         query = {"collection": {"$in": event_collections}}
         cursor = summary_collection.find(query, {"product_id": 1, "viewing_product_id": 1, "collection": 1, "_id": 0})
+        builder = IdSetBuilder()
         
-        for doc in cursor:
+        for doc in profiling.timed_iter("crawl.mongo_cursor", cursor):
             collection_name = doc.get('collection')
             
             if collection_name == 'product_view_all_recommend_clicked':
@@ -89,12 +87,13 @@ def get_unique_product_ids(summary_collection, unique_ids_file, event_collection
                 product_id = doc.get('product_id') or doc.get('viewing_product_id')
             
             if product_id:
-                product_ids.add(product_id)
+                builder.add(product_id)
         
-        with open(unique_ids_file, 'w') as f:
-            json.dump(list(product_ids), f, indent=4)
+        product_ids = builder.build()
+        with profiling.span("crawl.save_unique_ids"):
+            saved_file = save_ids(product_ids, unique_ids_file)
         
-        logging.info(f"Finished extracting. Found {len(product_ids)} unique product IDs. Saved to '{unique_ids_file}'.")
+        logging.info(f"Finished extracting. Found {len(product_ids)} unique product IDs. Saved to '{saved_file}'.")
         return product_ids
     except Exception as e:
         logging.error(f"Error while fetching data from the 'summary' collection: {e}")
@@ -153,11 +152,23 @@ def extract_product_fields(react_data):
 
 # --- Thread-safe data handler for checkpoint saves ---
 class ThreadSafeDataHandler:
-    def __init__(self, failed_output_file, processed_ids_file, success_output_file):
+    def __init__(self, failed_output_file, processed_ids_file, success_output_file,
+                 product_sink=None, failure_sink=None, write_csv=True):
         self.failed_output_file = failed_output_file
         self.processed_ids_file = processed_ids_file
         self.success_output_file = success_output_file
-        self.processed_ids = set()
+        # Optional BulkUpsertSinks into MongoDB (products / crawl_failures), see mongo_sink.py
+        self.product_sink = product_sink
+        self.failure_sink = failure_sink
+        self.write_csv = write_csv
+        # Without the CSV files the sinks hold the only copy of a result, so an ID counts as
+        # processed only once its sink has written the record (a dropped record is crawled again)
+        self.confirm_via_sinks = not write_csv and (product_sink is not None or failure_sink is not None)
+        for sink in (product_sink, failure_sink):
+            if self.confirm_via_sinks and sink is not None:
+                sink.on_written = self.mark_processed
+        self.processed_ids = IdSet()  # Processed before the last checkpoint
+        self.new_processed_ids = set()  # Processed since; merged into processed_ids on checkpoint
         self.processed_count = 0
         self.successful_count = 0
         self.failed_count = 0
@@ -170,7 +181,7 @@ class ThreadSafeDataHandler:
         
     def _init_failed_csv(self):
         """Initialize failed CSV file with header if it doesn't exist."""
-        if not os.path.exists(self.failed_output_file):
+        if self.write_csv and not os.path.exists(self.failed_output_file):
             with open(self.failed_output_file, 'w', newline='', encoding='utf-8') as csvfile:
                 fieldnames = ["product_id", "url", "error"]
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
@@ -182,40 +193,60 @@ class ThreadSafeDataHandler:
             success_record = {"product_id": product_id, "url": url}
             success_record.update(product_data)
             
-            self.success_data.append(success_record)
-            self.processed_ids.add(product_id)
+            if self.write_csv:
+                self.success_data.append(success_record)
+            if not self.confirm_via_sinks or self.product_sink is None:
+                self.new_processed_ids.add(product_id)
             self.processed_count += 1
             self.successful_count += 1
+        
+        if self.product_sink is not None:
+            self.product_sink.add(success_record)
+        if self.failure_sink is not None:
+            # A retried product that now succeeds is no longer a failure
+            self.failure_sink.delete(product_id)
             
     def add_failure(self, product_id, url, error_message):
         """Add failed crawl result and immediately write to CSV."""
         with self.lock:
             error_record = {"product_id": product_id, "url": url, "error": error_message}
             self.failed_data.append(error_record)
-            self.processed_ids.add(product_id)
+            if not self.confirm_via_sinks or self.failure_sink is None:
+                self.new_processed_ids.add(product_id)
             self.processed_count += 1
             self.failed_count += 1
             
             # Immediately write failed record to CSV
-            try:
-                with open(self.failed_output_file, 'a', newline='', encoding='utf-8') as csvfile:
-                    fieldnames = ["product_id", "url", "error"]
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                    writer.writerow(error_record)
-            except Exception as e:
-                logging.error(f"Error writing failed record to CSV: {e}")
+            if self.write_csv:
+                try:
+                    with open(self.failed_output_file, 'a', newline='', encoding='utf-8') as csvfile:
+                        fieldnames = ["product_id", "url", "error"]
+                        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+                        writer.writerow(error_record)
+                except Exception as e:
+                    logging.error(f"Error writing failed record to CSV: {e}")
+        
+        if self.failure_sink is not None:
+            self.failure_sink.add(error_record)
     
+    def mark_processed(self, product_ids):
+        """Records IDs whose results a sink has written (its on_written callback)."""
+        with self.lock:
+            self.new_processed_ids.update(product_ids)
+
     def checkpoint_save(self, force=False):
         """Save checkpoint data every 100 records or when forced."""
         with self.lock:
             if (self.processed_count % 100 == 0 and self.processed_count > 0) or force:
                 try:
                     # Save processed IDs
-                    with open(self.processed_ids_file, 'w') as f:
-                        json.dump(list(self.processed_ids), f)
+                    if self.new_processed_ids:
+                        self.processed_ids = self.processed_ids.union(self.new_processed_ids)
+                        self.new_processed_ids = set()
+                    save_ids(self.processed_ids, self.processed_ids_file)
                     
                     # Save successful products to CSV
-                    if self.success_data:
+                    if self.write_csv and self.success_data:
                         # Define all possible fieldnames
                         base_fields = ["product_id", "url"]
                         product_fields = [
@@ -248,15 +279,18 @@ def crawl_single_url(product_id, data_handler, crawl_delay_min, crawl_delay_max,
     url = f"https://www.glamira.com/catalog/product/view/id/{product_id}"
     
     try:
-        response = session.get(url, timeout=10)
+        with profiling.span("crawl.http_get"):
+            response = session.get(url, timeout=10)
         response.raise_for_status()
         
         # Extract React data from the page
-        react_data = extract_react_data(response.text)
+        with profiling.span("crawl.parse_react_data"):
+            react_data = extract_react_data(response.text)
         
         if react_data:
             # Extract product fields from React data
-            product_data = extract_product_fields(react_data)
+            with profiling.span("crawl.extract_fields"):
+                product_data = extract_product_fields(react_data)
             
             if product_data and product_data.get('name'):
                 data_handler.add_success(product_id, product_data, url)
@@ -271,7 +305,8 @@ def crawl_single_url(product_id, data_handler, crawl_delay_min, crawl_delay_max,
         error_msg = f"HTTP error for product_id '{product_id}' at URL '{url}': {e}"
         data_handler.add_failure(product_id, url, error_msg)
         if e.response and e.response.status_code in (429, 503, 504):
-            time.sleep(retry_delay)
+            with profiling.span("crawl.retry_backoff"):
+                time.sleep(retry_delay)
             
     except requests.exceptions.RequestException as e:
         error_msg = f"Could not connect to product_id '{product_id}' at URL '{url}': {e}"
@@ -284,22 +319,29 @@ def crawl_single_url(product_id, data_handler, crawl_delay_min, crawl_delay_max,
     finally:
         session.close()
         # Randomize the delay to avoid being detected
-        time.sleep(random.uniform(crawl_delay_min, crawl_delay_max))
+        with profiling.span("crawl.politeness_delay"):
+            time.sleep(random.uniform(crawl_delay_min, crawl_delay_max))
         
         # Check for checkpoint save
-        data_handler.checkpoint_save()
+        with profiling.span("crawl.checkpoint_save"):
+            data_handler.checkpoint_save()
 
 # --- Multi-threaded crawling function with checkpoint saves ---
 def crawl_and_process_urls_threaded(crawl_list, processed_ids, output_files, 
-                                  crawl_delay_min, crawl_delay_max, retry_delay, max_workers=5):
+                                  crawl_delay_min, crawl_delay_max, retry_delay, max_workers=5,
+                                  sinks=None):
     """Crawls URLs using multiple threads with checkpoint saves."""
+    sinks = sinks or {}
     
     data_handler = ThreadSafeDataHandler(
         output_files['failed'], 
         output_files['processed_ids'],
-        output_files['success']
+        output_files['success'],
+        product_sink=sinks.get('products'),
+        failure_sink=sinks.get('failures'),
+        write_csv=sinks.get('csv', True)
     )
-    data_handler.processed_ids = processed_ids.copy()
+    data_handler.processed_ids = as_id_set(processed_ids)
     
     total_to_crawl = len(crawl_list)
     logging.info(f"🚀 Starting threaded crawl with {max_workers} workers for {total_to_crawl} products...")
@@ -330,7 +372,10 @@ def crawl_and_process_urls_threaded(crawl_list, processed_ids, output_files,
                 logging.error(f"Thread execution error: {e}")
                 completed += 1
     
-    # Final checkpoint save
+    # Flush the sinks first, so the final checkpoint includes the IDs they confirm
+    for sink in (data_handler.product_sink, data_handler.failure_sink):
+        if sink is not None:
+            sink.close()
     data_handler.checkpoint_save(force=True)
     
     logging.info(f"🎉 Threaded crawling completed!")
@@ -338,7 +383,29 @@ def crawl_and_process_urls_threaded(crawl_list, processed_ids, output_files,
     logging.info(f"   ✅ Successful: {data_handler.successful_count}")
     logging.info(f"   ❌ Failed: {data_handler.failed_count}")
     
-    return data_handler.success_data, data_handler.failed_data
+    return data_handler.success_data, data_handler.failed_data, data_handler.successful_count
+
+# --- MongoDB sinks for crawl results ---
+def create_mongo_sinks(db, config):
+    """Bulk-upsert sinks for successful products and crawl failures (keyed on product_id)."""
+    from mongo_sink import BulkUpsertSink
+
+    flush_size = config['script_logic'].getint('sink_flush_size')
+    flush_interval = config['script_logic'].getfloat('sink_flush_interval_seconds')
+    max_buffer = config['script_logic'].getint('sink_max_buffer')
+    products = db[config['mongodb']['products_collection']]
+    failures = db[config['mongodb']['crawl_failures_collection']]
+    for collection in (products, failures):
+        try:
+            collection.create_index("product_id", unique=True)
+        except pymongo.errors.OperationFailure as e:
+            logging.warning(f"Could not create the product_id index on '{collection.name}': {e}")
+    return {
+        'products': BulkUpsertSink(products, "product_id", flush_size, flush_interval, timestamp_field="crawled_at",
+                                   max_buffer=max_buffer),
+        'failures': BulkUpsertSink(failures, "product_id", flush_size, flush_interval, timestamp_field="failed_at",
+                                   max_buffer=max_buffer),
+    }
 
 # --- Function to save successful data to CSV (final save) ---
 def save_successful_data(product_data, output_file):
@@ -365,7 +432,8 @@ def save_successful_data(product_data, output_file):
         logging.warning("⚠️  No product data to save. The process finished with no successful results.")
 
 # --- Function to print final summary ---
-def print_summary(product_ids, successful_crawls, failed_crawls_current_run, failed_output_file):
+def print_summary(product_ids, successful_crawls, failed_crawls_current_run, failed_output_file,
+                  failures_collection=None):
     """Prints a final summary of the crawling process."""
     total_products = len(product_ids)
     logging.info("\n--- CRAWLING SUMMARY ---")
@@ -384,6 +452,8 @@ def print_summary(product_ids, successful_crawls, failed_crawls_current_run, fai
             logging.error(f"Could not read from '{failed_output_file}' to get total failed count: {e}")
     
     logging.info(f"Total failed records in '{failed_output_file}': {total_failed_in_file}")
+    if failures_collection is not None:
+        logging.info(f"Total failed records in '{failures_collection.name}': {failures_collection.estimated_document_count()}")
     logging.info("------------------------")
 
 # --- Main function to process product data ---
@@ -393,46 +463,49 @@ def process_product_data():
     """
     try:
         config = load_config()
-    except FileNotFoundError:
+    except (FileNotFoundError, ValueError):
         return
 
-    setup_logging(config['script_logic']['log_file'], config['script_logic']['error_log_file'])
+    setup_logging(runtime.resolve_path(config['script_logic']['log_file']),
+                  runtime.resolve_path(config['script_logic']['error_log_file']))
     logging.info("🔥 Starting threaded product data processing with checkpoint saves...")
 
     mongo_uri = config['mongodb']['mongo_uri']
     db_name = config['mongodb']['db_name']
-    product_output_file = config['script_logic']['product_output_file']
-    failed_output_file = config['script_logic']['failed_output_file']
+    product_output_file = runtime.resolve_path(config['script_logic']['product_output_file'])
+    failed_output_file = runtime.resolve_path(config['script_logic']['failed_output_file'])
     event_collections = [col.strip() for col in config['script_logic']['event_collections'].split(',')]
-    unique_product_ids_file = config['script_logic']['unique_product_ids_file']
-    processed_product_ids_file = config['script_logic']['processed_product_ids_file']
+    unique_product_ids_file = runtime.resolve_path(config['script_logic']['unique_product_ids_file'])
+    processed_product_ids_file = runtime.resolve_path(config['script_logic']['processed_product_ids_file'])
     crawl_delay_min = float(config['script_logic']['crawl_delay_min_seconds'])
     crawl_delay_max = float(config['script_logic']['crawl_delay_max_seconds'])
     retry_delay = int(config['script_logic']['retry_delay_seconds'])
     
     # Get max_workers from config with default value
     max_workers = int(config['script_logic'].get('max_workers', 5))
+    product_sinks = {sink.strip() for sink in config['script_logic']['product_sinks'].split(',') if sink.strip()}
 
     db, client = connect_to_mongodb(mongo_uri, db_name)
     if db is None:
         return
 
-    summary_collection = db['summary']
+    summary_collection = db[config['mongodb']['summary_collection']]
     product_ids = get_unique_product_ids(summary_collection, unique_product_ids_file, event_collections)
     if not product_ids:
-        client.close()
+        runtime.close_mongo_client()
         return
 
-    processed_ids = set()
-    if os.path.exists(processed_product_ids_file):
-        try:
-            with open(processed_product_ids_file, 'r') as f:
-                processed_ids = set(json.load(f))
+    processed_ids = IdSet()
+    try:
+        with profiling.span("crawl.load_processed_ids"):
+            processed_ids = load_ids(processed_product_ids_file) or processed_ids
+        if processed_ids:
             logging.info(f"📂 Loaded {len(processed_ids)} previously processed product IDs.")
-        except Exception as e:
-            logging.error(f"Error loading processed IDs from '{processed_product_ids_file}': {e}. Starting from scratch.")
+    except Exception as e:
+        logging.error(f"Error loading processed IDs from '{processed_product_ids_file}': {e}. Starting from scratch.")
 
-    crawl_list = [product_id for product_id in product_ids if product_id not in processed_ids]
+    with profiling.span("crawl.resume_diff"):
+        crawl_list = product_ids.difference(processed_ids)
     
     output_files = {
         'failed': failed_output_file,
@@ -440,24 +513,40 @@ def process_product_data():
         'success': product_output_file
     }
     
+    sinks = {'csv': "csv" in product_sinks}
+    if "mongo" in product_sinks:
+        sinks.update(create_mongo_sinks(db, config))
+    
     logging.info(f"📋 Ready to crawl {len(crawl_list)} new products using {max_workers} threads")
     logging.info(f"   (Skipping {len(processed_ids)} already processed products)")
+    logging.info(f"   (Writing results to: {', '.join(sorted(product_sinks))})")
     
     # Use threaded crawling with checkpoint saves
-    product_data, failed_data_current_run = crawl_and_process_urls_threaded(
+    product_data, failed_data_current_run, successful_count = crawl_and_process_urls_threaded(
         crawl_list, processed_ids, output_files, 
-        crawl_delay_min, crawl_delay_max, retry_delay, max_workers
+        crawl_delay_min, crawl_delay_max, retry_delay, max_workers, sinks
     )
 
     # Final save - ensures the final complete dataset is saved
-    save_successful_data(product_data, product_output_file)
+    if sinks['csv']:
+        with profiling.span("crawl.final_save"):
+            save_successful_data(product_data, product_output_file)
     
-    print_summary(product_ids, len(product_data), len(failed_data_current_run), failed_output_file)
+    failure_sink = sinks.get('failures')
+    print_summary(product_ids, successful_count, len(failed_data_current_run), failed_output_file,
+                  failure_sink.collection if failure_sink is not None else None)
 
-    client.close()
+    runtime.close_mongo_client()
     logging.info("🎉 Threaded product data processing complete. MongoDB connection closed.")
 
 
 # --- Script entry point ---
 if __name__ == "__main__":
-    process_product_data()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Crawl product names from glamira.com.")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.configure(args.profile)
+    with profiling.session("crawl_product_name"):
+        process_product_data()
\ No newline at end of file
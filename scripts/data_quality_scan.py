@@ -0,0 +1,204 @@
+# Data-quality scanner
+#
+# Runs a registry of named checks inside MongoDB. All checks that target the same
+# collection share a single pass: each _id range partition is scanned once by an
+# aggregation whose $facet evaluates every check (count + sampled offenders) on
+# the same documents. Partitions run in parallel.
+#
+# Usage: python data_quality_scan.py [--collection summary] [--check NAME ...]
+#                                    [--partitions 8] [--sample-size 20] [--output report.json]
+
+import argparse
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
+
+import runtime
+
+# --- Configuration Section ---
+DEFAULT_PARTITIONS = 8
+DEFAULT_SAMPLE_SIZE = 20
+
+# --- Check Registry ---
+# collection: collection the check runs against
+# unwind:     optional array field unwound before matching (one offender per element)
+# match:      $match condition selecting offending documents/elements
+# sample:     $project spec describing an offender
+CHECKS = {
+    "string_cart_option": {
+        "collection": "summary",
+        "description": "cart_products.option is a non-empty string instead of an option list",
+        "unwind": "cart_products",
+        "match": {"cart_products.option": {"$type": "string", "$ne": ""}},
+        "sample": {"_id": {"$toString": "$_id"}, "option": "$cart_products.option"},
+    },
+    "category_id_key": {
+        "collection": "summary",
+        "description": "option contains a 'category id' key (space instead of underscore)",
+        "match": {"option.category id": {"$exists": True}},
+        "sample": {"_id": {"$toString": "$_id"}, "option": "$option"},
+    },
+    "non_finite_collection": {
+        "collection": "products",
+        "description": "collection is a non-finite float (inf, -inf or NaN)",
+        "match": {"collection": {"$in": [float("inf"), float("-inf"), float("nan")]}},
+        "sample": {"_id": {"$toString": "$_id"}, "collection": {"$toString": "$collection"}},
+    },
+}
+
+def checks_for(collection_name, names=None):
+    """Returns the registered checks for a collection, optionally restricted to some names."""
+    return {
+        name: check for name, check in CHECKS.items()
+        if check["collection"] == collection_name and (names is None or name in names)
+    }
+
+# --- Partitioning ---
+def id_partitions(collection, partitions):
+    """Splits the _id range into roughly equal ranges, as [(lower, upper), ...] (upper exclusive)."""
+    first = collection.find_one({}, {"_id": 1}, sort=[("_id", 1)])
+    last = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    if first is None:
+        return []
+
+    low, high = first["_id"], last["_id"]
+    if partitions <= 1 or low == high:
+        return [(None, None)]
+
+    if isinstance(low, ObjectId) and isinstance(high, ObjectId):
+        # ObjectIds start with their creation time, so split the time range
+        start, end = low.generation_time.timestamp(), high.generation_time.timestamp()
+        step = (end - start) / partitions
+        cuts = [ObjectId.from_datetime(datetime.utcfromtimestamp(start + step * i)) for i in range(1, partitions)]
+    elif isinstance(low, (int, float)) and isinstance(high, (int, float)):
+        step = (high - low) / partitions
+        cuts = [low + step * i for i in range(1, partitions)]
+    else:
+        return [(None, None)]
+
+    bounds = [None] + sorted(set(cuts)) + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def range_filter(lower, upper):
+    """$match filter for one _id partition."""
+    condition = {}
+    if lower is not None:
+        condition["$gte"] = lower
+    if upper is not None:
+        condition["$lt"] = upper
+    return {"_id": condition} if condition else {}
+
+# --- Scanning ---
+def _check_stages(check):
+    """Stages selecting a check's offenders from the partition's documents."""
+    stages = []
+    if check.get("unwind"):
+        stages.append({"$unwind": f"${check['unwind']}"})
+    stages.append({"$match": check["match"]})
+    return stages
+
+def build_scan_pipeline(checks, lower, upper, sample_size):
+    """One-pass pipeline evaluating every check on one _id partition."""
+    facets = {"__scanned": [{"$count": "n"}]}
+    for name, check in checks.items():
+        facets[f"{name}__count"] = _check_stages(check) + [{"$count": "n"}]
+        if sample_size:
+            facets[f"{name}__sample"] = _check_stages(check) + [{"$limit": sample_size}, {"$project": check["sample"]}]
+
+    pipeline = []
+    match = range_filter(lower, upper)
+    if match:
+        pipeline.append({"$match": match})
+    pipeline.append({"$facet": facets})
+    return pipeline
+
+def scan_partition(collection, checks, lower, upper, sample_size):
+    """Scans one partition and returns {"scanned": n, check: {"count", "samples"}}."""
+    result = next(collection.aggregate(build_scan_pipeline(checks, lower, upper, sample_size), allowDiskUse=True))
+    report = {"scanned": result["__scanned"][0]["n"] if result["__scanned"] else 0}
+    for name in checks:
+        counts = result[f"{name}__count"]
+        report[name] = {
+            "count": counts[0]["n"] if counts else 0,
+            "samples": result.get(f"{name}__sample", []),
+        }
+    return report
+
+def run_scan(db, collection_name, names=None, partitions=DEFAULT_PARTITIONS, sample_size=DEFAULT_SAMPLE_SIZE):
+    """Runs all selected checks for a collection in one parallel pass and merges the results."""
+    checks = checks_for(collection_name, names)
+    if not checks:
+        raise ValueError(f"No checks registered for collection '{collection_name}'")
+
+    collection = db[collection_name]
+    ranges = id_partitions(collection, partitions)
+    logging.info(f"Scanning '{collection_name}' for {sorted(checks)} over {len(ranges)} partitions...")
+
+    report = {"collection": collection_name, "scanned": 0,
+              "checks": {name: {"description": checks[name]["description"], "count": 0, "samples": []}
+                         for name in checks}}
+    if not ranges:
+        return report
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        futures = [executor.submit(scan_partition, collection, checks, lower, upper, sample_size)
+                   for lower, upper in ranges]
+        for future in futures:
+            partial = future.result()
+            report["scanned"] += partial["scanned"]
+            for name in checks:
+                merged = report["checks"][name]
+                merged["count"] += partial[name]["count"]
+                merged["samples"].extend(partial[name]["samples"][:max(sample_size - len(merged["samples"]), 0)])
+
+    for name, result in report["checks"].items():
+        logging.info(f"  {name}: {result['count']} offenders")
+    return report
+
+def iter_offenders(db, check_name, partitions=DEFAULT_PARTITIONS):
+    """Streams every offender of one check (server-side filtering, partitions read in parallel)."""
+    check = CHECKS[check_name]
+    collection = db[check["collection"]]
+
+    def fetch(bounds):
+        lower, upper = bounds
+        pipeline = []
+        match = range_filter(lower, upper)
+        if match:
+            pipeline.append({"$match": match})
+        pipeline += _check_stages(check) + [{"$project": check["sample"]}]
+        return list(collection.aggregate(pipeline, allowDiskUse=True))
+
+    with ThreadPoolExecutor(max_workers=max(partitions, 1)) as executor:
+        for offenders in executor.map(fetch, id_partitions(collection, partitions)):
+            yield from offenders
+
+# --- Script entry point ---
+def main(argv=None, prog=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(prog=prog, description="Run data-quality checks inside MongoDB.")
+    parser.add_argument("--collection", action="append",
+                        help="Collection(s) to scan (default: every collection with registered checks)")
+    parser.add_argument("--check", action="append", choices=sorted(CHECKS), help="Restrict to these checks")
+    parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS)
+    parser.add_argument("--sample-size", type=int, default=DEFAULT_SAMPLE_SIZE)
+    parser.add_argument("--output", default="data_quality_report.json")
+    args = parser.parse_args(argv)
+
+    collections = args.collection or sorted({check["collection"] for check in CHECKS.values()})
+    if args.check:
+        collections = [c for c in collections if checks_for(c, args.check)]
+
+    db = runtime.get_database()
+    reports = [run_scan(db, name, args.check, args.partitions, args.sample_size) for name in collections]
+    runtime.close_mongo_client()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(reports, f, ensure_ascii=False, indent=2, default=str)
+    print(f"✅ Report written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# Incrementally maintained event rollups of the summary collection
+#
+# Each rollup is an aggregation over the events that arrived since its last run
+# (summary _id beyond a persisted watermark, see export_watermark.py) and ends in
+# a $merge into a small collection, so the work per run is proportional to the
+# new events only:
+#   product_daily_events      events per product x event collection x day
+#   product_daily_unique_ips  distinct IPs per product x day (the IP set is kept
+#                             in the rollup document and unioned on merge)
+#   add_to_cart_daily         add_to_cart_action events, quantity and value per
+#                             product x day x currency
+# Days are UTC dates of time_stamp. Product IDs are resolved like the crawler does
+# (viewing_product_id for product_view_all_recommend_clicked, product_id otherwise).
+#
+# All rollups of a run stop at the same upper _id, and each watermark is saved as
+# soon as its $merge has finished. $merge is not atomic: if one fails part-way,
+# the groups it already merged are added again on the next run. Use --rebuild to
+# recompute every rollup from scratch after such a failure.
+#
+# The watermarks live in a state file of their own (STATE_FILE), not in the
+# exports' export_watermarks.json. `glamira.py rollups` and the pipeline's rollups
+# stage can run at the same time, so an update holds an exclusive lock on
+# LOCK_FILE: a second run waits, then finds the rollups up to date instead of
+# merging the same events twice.
+#
+# --export writes every rollup as one JSONL snapshot and uploads it under
+# exports/rollups/<rollup>/, which bigquery_loader.py loads into agg_<rollup>
+# (WRITE_TRUNCATE, so each table always holds the latest snapshot).
+#
+# Usage: python event_rollups.py [--rollup NAME ...] [--rebuild] [--export]
+
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Not on Windows; rollup runs are then not serialized across processes
+    fcntl = None
+
+import profiling
+import runtime
+from export_watermark import WATERMARK_FILE, decode_value, load_watermark, save_watermark
+
+# --- Configuration Section ---
+WATERMARK_FIELD = "_id"
+WATERMARK_PREFIX = "rollup:"          # Watermark state key: rollup:<name>
+STATE_FILE = "../data/rollup_watermarks.json"
+LEGACY_STATE_FILE = WATERMARK_FILE    # Where earlier versions kept the rollup watermarks
+LOCK_FILE = "../data/rollups.lock"
+GCS_BUCKET_NAME = "raw-glamira-data"
+GCS_EXPORT_PATH_PREFIX = "exports/rollups"
+LOCAL_EXPORT_DIR = "../data"
+
+VIEW_ALL_CLICKED = "product_view_all_recommend_clicked"
+ADD_TO_CART = "add_to_cart_action"
+
+# --- Expressions ---
+def _convert(expression, to, default=None):
+    return {"$convert": {"input": expression, "to": to, "onError": default, "onNull": default}}
+
+def product_id_expr():
+    """Product of an event, as a string (same precedence as crawl_product_name.get_unique_product_ids)."""
+    return {"$toString": {"$cond": [
+        {"$eq": ["$collection", VIEW_ALL_CLICKED]},
+        "$viewing_product_id",
+        {"$ifNull": ["$product_id", "$viewing_product_id"]},
+    ]}}
+
+def day_expr():
+    """UTC date (YYYY-MM-DD) of the event's time_stamp in seconds; null when it is not numeric."""
+    return {"$dateToString": {"format": "%Y-%m-%d", "date": {"$toDate": {"$multiply": [
+        _convert("$time_stamp", "long"), 1000]}}}}
+
+def _has(*fields):
+    """$match stage dropping rows where any of the fields is null or empty."""
+    return {"$match": {field: {"$nin": [None, ""]} for field in fields}}
+
+def merge_stage(into, sums=(), when_matched=None):
+    """$merge into a rollup collection on _id, adding the sums to existing groups."""
+    if when_matched is None:
+        update = {field: {"$add": [{"$ifNull": [f"${field}", 0]}, f"$$new.{field}"]} for field in sums}
+        update["updated_at"] = "$$new.updated_at"
+        when_matched = [{"$set": update}]
+    return {"$merge": {"into": into, "on": "_id", "whenMatched": when_matched, "whenNotMatched": "insert"}}
+
+# --- Rollup definitions ---
+def product_daily_events_stages(into):
+    return [
+        {"$project": {"_id": 0, "product_id": product_id_expr(), "collection": 1, "day": day_expr()}},
+        _has("product_id", "day"),
+        {"$group": {"_id": {"product_id": "$product_id", "collection": "$collection", "day": "$day"},
+                    "events": {"$sum": 1}}},
+        {"$set": {"updated_at": "$$NOW"}},
+        merge_stage(into, sums=["events"]),
+    ]
+
+def product_daily_unique_ips_stages(into):
+    return [
+        {"$project": {"_id": 0, "product_id": product_id_expr(), "day": day_expr(), "ip": 1}},
+        _has("product_id", "day", "ip"),
+        {"$group": {"_id": {"product_id": "$product_id", "day": "$day"}, "ips": {"$addToSet": "$ip"}}},
+        {"$set": {"unique_ips": {"$size": "$ips"}, "updated_at": "$$NOW"}},
+        merge_stage(into, when_matched=[
+            {"$set": {"ips": {"$setUnion": ["$ips", "$$new.ips"]}}},
+            {"$set": {"unique_ips": {"$size": "$ips"}, "updated_at": "$$new.updated_at"}},
+        ]),
+    ]
+
+def add_to_cart_daily_stages(into):
+    # The cart line of the product that was added; events without one count a quantity of 1
+    cart = {"$cond": [{"$isArray": "$cart_products"}, "$cart_products", []]}
+    item = {"$arrayElemAt": [{"$filter": {
+        "input": cart,
+        "as": "cp",
+        "cond": {"$eq": [{"$toString": "$$cp.product_id"}, {"$toString": "$product_id"}]},
+    }}, 0]}
+    return [
+        {"$match": {"collection": ADD_TO_CART}},
+        {"$project": {"_id": 0, "product_id": product_id_expr(), "day": day_expr(), "item": item}},
+        _has("product_id", "day"),
+        {"$set": {"quantity": _convert("$item.amount", "long", 1)}},
+        {"$group": {
+            "_id": {"product_id": "$product_id", "day": "$day", "currency": {"$ifNull": ["$item.currency", ""]}},
+            "add_to_cart_events": {"$sum": 1},
+            "quantity": {"$sum": "$quantity"},
+            "value": {"$sum": {"$multiply": ["$quantity", _convert("$item.price", "double")]}},
+        }},
+        {"$set": {"updated_at": "$$NOW"}},
+        merge_stage(into, sums=["add_to_cart_events", "quantity", "value"]),
+    ]
+
+# name -> target collection, stage builder, group key fields and value fields (export column order)
+ROLLUPS = {
+    "product_daily_events": {
+        "collection": "rollup_product_daily_events",
+        "stages": product_daily_events_stages,
+        "key_fields": ["product_id", "collection", "day"],
+        "value_fields": ["events"],
+    },
+    "product_daily_unique_ips": {
+        "collection": "rollup_product_daily_unique_ips",
+        "stages": product_daily_unique_ips_stages,
+        "key_fields": ["product_id", "day"],
+        "value_fields": ["unique_ips"],
+    },
+    "add_to_cart_daily": {
+        "collection": "rollup_add_to_cart_daily",
+        "stages": add_to_cart_daily_stages,
+        "key_fields": ["product_id", "day", "currency"],
+        "value_fields": ["add_to_cart_events", "quantity", "value"],
+    },
+}
+
+# --- Incremental update ---
+def rollup_names(names=None):
+    """The requested rollups (all by default); raises ValueError for unknown names."""
+    unknown = set(names or ()) - set(ROLLUPS)
+    if unknown:
+        raise ValueError(f"Unknown rollup(s) {sorted(unknown)}; choose from {', '.join(ROLLUPS)}")
+    return list(names or ROLLUPS)
+
+def build_pipeline(name, lower, upper):
+    """Aggregation pipeline folding the events in (lower, upper] into a rollup."""
+    window = {"$lte": upper}
+    if lower is not None:
+        window["$gt"] = lower
+    rollup = ROLLUPS[name]
+    return [{"$match": {WATERMARK_FIELD: window}}] + rollup["stages"](rollup["collection"])
+
+def latest_event_id(summary):
+    """Highest watermark value in the summary collection right now (None when empty)."""
+    latest = summary.find_one({}, {WATERMARK_FIELD: 1}, sort=[(WATERMARK_FIELD, -1)])
+    return latest[WATERMARK_FIELD] if latest else None
+
+@contextmanager
+def rollup_lock():
+    """Holds the exclusive cross-process lock on LOCK_FILE, waiting for another run to finish."""
+    os.makedirs(os.path.dirname(LOCK_FILE) or ".", exist_ok=True)
+    with open(LOCK_FILE, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def migrate_state():
+    """Copies the rollup watermarks of earlier versions out of the exports' state file, once."""
+    if os.path.exists(STATE_FILE) or not os.path.exists(LEGACY_STATE_FILE):
+        return
+    with open(LEGACY_STATE_FILE, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    for key, entry in state.items():
+        if key.startswith(WATERMARK_PREFIX):
+            save_watermark(key, entry["field"], decode_value(entry["value"]), path=STATE_FILE)
+
+def update_rollups(names=None, rebuild=False):
+    """Folds the events that arrived since each rollup's watermark into it; returns {name: status}."""
+    with rollup_lock():
+        migrate_state()
+        return _update_rollups(names, rebuild)
+
+def _update_rollups(names, rebuild):
+    config = runtime.load_config()
+    db = runtime.get_database()
+    summary = db[config["mongodb"]["summary_collection"]]
+    upper = latest_event_id(summary)
+    results = {}
+
+    for name in rollup_names(names):
+        key = f"{WATERMARK_PREFIX}{name}"
+        if rebuild:
+            db.drop_collection(ROLLUPS[name]["collection"])
+            save_watermark(key, WATERMARK_FIELD, None, path=STATE_FILE)
+        lower = load_watermark(key, path=STATE_FILE)
+        if upper is None or (lower is not None and lower >= upper):
+            logging.info(f"Rollup '{name}' is up to date.")
+            results[name] = "up to date"
+            continue
+
+        logging.info(f"Updating rollup '{name}' with events in ({lower}, {upper}]...")
+        with profiling.span(f"rollup.{name}"):
+            summary.aggregate(build_pipeline(name, lower, upper), allowDiskUse=True)
+        save_watermark(key, WATERMARK_FIELD, upper, path=STATE_FILE)
+        results[name] = "updated"
+    return results
+
+# --- Export ---
+def export_pipeline(name):
+    """Projects a rollup collection onto flat export rows (key fields, values, updated_at)."""
+    rollup = ROLLUPS[name]
+    projection = {"_id": 0}
+    projection.update({field: f"$_id.{field}" for field in rollup["key_fields"]})
+    projection.update({field: 1 for field in rollup["value_fields"]})
+    projection["updated_at"] = {"$dateToString": {"format": "%Y-%m-%dT%H:%M:%SZ", "date": "$updated_at"}}
+    return [{"$project": projection}]
+
+def write_rollup(name, file_path):
+    """Writes a rollup collection as JSONL; returns the number of rows."""
+    collection = runtime.get_collection(ROLLUPS[name]["collection"])
+    rows = 0
+    with open(file_path, "w", encoding="utf-8") as f:
+        for doc in collection.aggregate(export_pipeline(name), batchSize=runtime.mongo_batch_size()):
+            f.write(json.dumps(doc) + "\n")
+            rows += 1
+    return rows
+
+def object_name(name, timestamp):
+    """GCS object name of a rollup snapshot (routed to agg_<name> by bigquery_loader.TABLE_REGISTRY)."""
+    return f"{GCS_EXPORT_PATH_PREFIX}/{name}/{name}_{timestamp}.jsonl"
+
+def upload_to_gcs(bucket_name, source_file, destination_blob):
+    """Uploads a file to a specified Google Cloud Storage bucket."""
+    from google.cloud import storage
+    client = storage.Client()
+    bucket = client.bucket(bucket_name)
+    blob = bucket.blob(destination_blob)
+    blob.upload_from_filename(source_file)
+    print(f"Uploaded {source_file} to gs://{bucket_name}/{destination_blob}")
+
+def export_rollups(names=None):
+    """Exports a snapshot of every rollup to GCS, each with its manifest."""
+    from collection_export import manifest_name, write_manifest
+
+    timestamp = datetime.now().strftime("%Y-%m-%d-%H%M%S")
+    os.makedirs(LOCAL_EXPORT_DIR, exist_ok=True)
+    for name in rollup_names(names):
+        local_file_path = os.path.join(LOCAL_EXPORT_DIR, f"rollup_{name}.jsonl")
+        rows = write_rollup(name, local_file_path)
+        logging.info(f"Wrote {rows} rows of rollup '{name}' to {local_file_path}")
+        destination_blob = object_name(name, timestamp)
+        upload_to_gcs(GCS_BUCKET_NAME, local_file_path, destination_blob)
+        upload_to_gcs(GCS_BUCKET_NAME, write_manifest([destination_blob], manifest_name(local_file_path)),
+                      manifest_name(destination_blob))
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Incrementally update the event rollups of the summary collection.")
+    parser.add_argument("--rollup", action="append", choices=list(ROLLUPS), help="Restrict to these rollups")
+    parser.add_argument("--rebuild", action="store_true", help="Drop the rollups and recompute them from all events")
+    parser.add_argument("--export", action="store_true", help="Export a snapshot of the rollups to GCS afterwards")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.configure(args.profile)
+    try:
+        with profiling.session("event_rollups"):
+            update_rollups(args.rollup, rebuild=args.rebuild)
+            if args.export:
+                export_rollups(args.rollup)
+    finally:
+        runtime.close_mongo_client()
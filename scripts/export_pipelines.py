@@ -0,0 +1,122 @@
+# Server-side equivalents of the exporters' transform_document() functions
+#
+# Each collection's per-row cleanup is expressed as aggregation stages so that
+# documents leave MongoDB already shaped for BigQuery. The stages must keep the
+# output byte-identical to the Python transforms (same values, same key order);
+# verify_export_pipelines.py checks that against a live collection, and
+# tests/test_export_pipelines.py on seeded documents (mongomock cannot run these
+# stages, so the tests evaluate them with a small reference evaluator).
+
+# Temporary field carrying the raw (untransformed) watermark value to the client
+WATERMARK_KEY = "__watermark"
+
+def _without_key(object_expr, key):
+    """Expression: object_expr with one key removed, preserving the order of the others."""
+    return {"$arrayToObject": {"$filter": {
+        "input": {"$objectToArray": object_expr},
+        "as": "kv",
+        "cond": {"$ne": ["$$kv.k", key]},
+    }}}
+
+def _id_to_string_stage():
+    """$set stage mirroring doc['_id'] = str(doc['_id'])."""
+    return {"$set": {"_id": {"$toString": "$_id"}}}
+
+def user_behaviors_stages():
+    """Stages mirroring export_user_behavior_to_gcs.transform_document()."""
+    # clean_empty_option(): drop cart item 'option' keys holding an empty string
+    cart_products = {"$cond": [
+        {"$isArray": "$cart_products"},
+        {"$map": {
+            "input": "$cart_products",
+            "as": "cp",
+            "in": {"$cond": [
+                {"$and": [
+                    {"$eq": [{"$type": "$$cp"}, "object"]},
+                    {"$eq": ["$$cp.option", ""]},
+                ]},
+                _without_key("$$cp", "option"),
+                "$$cp",
+            ]},
+        }},
+        "$cart_products",
+    ]}
+
+    # option['category id'] -> option['category_id'] (moved to the end, like dict.pop + assign)
+    option = {"$cond": [
+        {"$eq": [{"$type": "$option"}, "object"]},
+        {"$let": {
+            "vars": {"kvs": {"$objectToArray": "$option"}},
+            "in": {"$cond": [
+                {"$in": ["category id", "$$kvs.k"]},
+                {"$arrayToObject": {"$concatArrays": [
+                    {"$filter": {"input": "$$kvs", "as": "kv", "cond": {"$ne": ["$$kv.k", "category id"]}}},
+                    [{"k": "category_id",
+                      "v": {"$arrayElemAt": ["$$kvs.v", {"$indexOfArray": ["$$kvs.k", "category id"]}]}}],
+                ]}},
+                "$option",
+            ]},
+        }},
+        "$option",
+    ]}
+
+    return [
+        _id_to_string_stage(),
+        {"$set": {"cart_products": cart_products, "option": option}},
+    ]
+
+def products_stages():
+    """Stages mirroring export_products_to_gcs.transform_document()."""
+    # Only +infinity is rewritten: the Python NaN branch compares NaN == NaN,
+    # which is never true, so NaN passes through unchanged there as well.
+    collection = {"$cond": [
+        {"$eq": ["$collection", float("inf")]},
+        "infinity",
+        "$collection",
+    ]}
+    return [
+        _id_to_string_stage(),
+        {"$set": {"collection": collection}},
+    ]
+
+def ip_locations_stages():
+    """Stages mirroring export_ip_location_to_gcs.transform_document()."""
+    return [
+        _id_to_string_stage(),
+        {"$unset": "last_updated"},
+    ]
+
+PIPELINE_STAGES = {
+    "summary": user_behaviors_stages,
+    "products": products_stages,
+    "ip_locations": ip_locations_stages,
+}
+
+def build_pipeline(collection_name, query=None, fields=None, watermark_field=None):
+    """Builds the full export pipeline: filter, optional projection, then the transforms.
+
+    fields (opt-in) projects the documents onto those columns, which drops the fields
+    transform_document() keeps; the exporters do not pass it, so pushdown output stays
+    byte-identical to the Python transforms.
+    """
+    if collection_name not in PIPELINE_STAGES:
+        raise ValueError(f"No export pipeline defined for collection '{collection_name}'")
+
+    pipeline = []
+    if query:
+        pipeline.append({"$match": query})
+    if fields:
+        projection = {field: 1 for field in fields}
+        if watermark_field:
+            projection[watermark_field] = 1
+        pipeline.append({"$project": projection})
+    if watermark_field:
+        # Captured before the transforms so the client sees the raw ObjectId/datetime
+        pipeline.append({"$set": {WATERMARK_KEY: f"${watermark_field}"}})
+    pipeline.extend(PIPELINE_STAGES[collection_name]())
+    return pipeline
+
+def schema_field_names(schema_path):
+    """Returns the top-level column names of a BigQuery JSON schema file."""
+    from parquet_export import load_bigquery_schema
+    return [field["name"] for field in load_bigquery_schema(schema_path)]
@@ -1,73 +1,49 @@
-from pymongo import MongoClient
-from google.cloud import storage
-import logging
-import json
-import os
-from datetime import datetime
+# Export of crawled products to GCS; the export itself is collection_export.py
+
+import collection_export
+from collection_export import ExportSpec
 
 # --- Configuration Section ---
-MONGO_URI = "mongodb://127.0.0.1:27017"
-MONGO_DB_NAME = "glamira_db"
 MONGO_COLLECTION_NAME = "products"
-GCS_BUCKET_NAME = "raw-glamira-data"
+GCS_BUCKET_NAME = collection_export.GCS_BUCKET_NAME
 GCS_EXPORT_PATH_PREFIX = "exports/products/products"
 LOCAL_FILE_PATH = "../data/products.jsonl"
-BATCH_SIZE = 1000
+BATCH_SIZE = None  # None = [mongodb] cursor_batch_size from config.ini
+EXPORT_FORMAT = "jsonl"  # "jsonl" or "parquet"
+FAST_SERIALIZATION = False  # Raw BSON batches + orjson, see fast_jsonl.py
+PUSHDOWN_TRANSFORMS = False  # Run the row transforms inside MongoDB, see export_pipelines.py
+EXPORT_MODE = "full"  # "full" or "delta" (only documents beyond the persisted watermark)
+WATERMARK_FIELD = "_id"
+SCHEMA_PATH = "products_schema.json"
+VALIDATE_ROWS = False  # Divert rows that do not fit SCHEMA_PATH to the quarantine file
+QUARANTINE_FILE_PATH = "../data/products.quarantine.jsonl"
+GCS_QUARANTINE_PATH_PREFIX = "quarantine/products/products"
 
 # --- Helper Functions ---
-def get_mongo_connection():
-    """Establishes a connection to MongoDB."""
-    client = MongoClient(MONGO_URI)
-    db = client[MONGO_DB_NAME]
-    return db
-
-def extract_data(collection_name, batch_size):
-    """Extracts documents from a MongoDB collection in batches."""
-    db = get_mongo_connection()
-    collection = db[collection_name]
-
-    cursor = collection.find({}).batch_size(batch_size)
-    for doc in cursor:
-        yield doc
-
-def write_to_jsonl(docs, file_path):
-    """Writes documents to a JSONL file."""
-    with open(file_path, "w", encoding='utf-8') as f:
-        for doc in docs:
-            # Convert ObjectId to string for JSON serialization
-            doc['_id'] = str(doc['_id'])
-            
-            # Handle special float values if they exist
-            if 'collection' in doc and isinstance(doc['collection'], float):
-                if doc['collection'] == float('inf'):
-                    doc['collection'] = "infinity" 
-                elif doc['collection'] == float('nan'):
-                    doc['collection'] = "nan"
-            
-            f.write(json.dumps(doc) + '\n')
-
-def upload_to_gcs(bucket_name, source_file, destination_blob):
-    """Uploads a file to a specified Google Cloud Storage bucket."""
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob)
-    blob.upload_from_filename(source_file)
-    print(f"Uploaded {source_file} to gs://{bucket_name}/{destination_blob}")
-
-def export_to_gcs():
-    """Main function to orchestrate the export process."""
-    logging.info("Starting export from MongoDB")
-
-    # Generate a timestamped destination file name
-    timestamp = datetime.now().strftime("%Y-%m-%d-%H%M%S")
-    gcs_destination_blob = f"{GCS_EXPORT_PATH_PREFIX}_{timestamp}.jsonl"
-        
-    docs = extract_data(MONGO_COLLECTION_NAME, batch_size=BATCH_SIZE)
-    write_to_jsonl(docs, LOCAL_FILE_PATH)
+def transform_document(doc):
+    """Applies the per-row cleanup expected by the products BigQuery schema."""
+    # Convert ObjectId to string for JSON serialization
+    doc['_id'] = str(doc['_id'])
     
-    upload_to_gcs(GCS_BUCKET_NAME, LOCAL_FILE_PATH, gcs_destination_blob)
-    
-    logging.info("Export successfully")
+    # Handle special float values if they exist
+    if 'collection' in doc and isinstance(doc['collection'], float):
+        if doc['collection'] == float('inf'):
+            doc['collection'] = "infinity" 
+        elif doc['collection'] == float('nan'):
+            doc['collection'] = "nan"
+    return doc
+
+def export_spec():
+    """This export's settings (read at call time, so changes to the constants above apply)."""
+    return ExportSpec(MONGO_COLLECTION_NAME, transform_document, SCHEMA_PATH, GCS_EXPORT_PATH_PREFIX,
+                      LOCAL_FILE_PATH, QUARANTINE_FILE_PATH, GCS_QUARANTINE_PATH_PREFIX,
+                      watermark_field=WATERMARK_FIELD, bucket=GCS_BUCKET_NAME, batch_size=BATCH_SIZE)
+
+def export_to_gcs(export_format=EXPORT_FORMAT, fast=FAST_SERIALIZATION, mode=EXPORT_MODE,
+                  pushdown=PUSHDOWN_TRANSFORMS, validate=VALIDATE_ROWS):
+    """Main function to orchestrate the export process."""
+    collection_export.export_to_gcs(export_spec(), export_format=export_format, fast=fast, mode=mode,
+                                    pushdown=pushdown, validate=validate)
 
 if __name__ == "__main__":
-    export_to_gcs()
+    collection_export.main(export_to_gcs, "Export products from MongoDB to GCS.", "export_products")
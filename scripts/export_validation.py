@@ -0,0 +1,157 @@
+# Inline validation of exported rows against the target BigQuery schema
+#
+# Rows are checked while they stream to the export file; rows BigQuery would
+# reject are diverted to a quarantine JSONL file together with the reasons, so
+# the clean file loads on the first attempt. The rules follow how BigQuery
+# parses newline-delimited JSON (numeric strings are accepted for numeric
+# columns, scalars for STRING, objects only for RECORD, arrays only for
+# REPEATED, no NaN/Infinity, no fields missing from the schema).
+
+import json
+import logging
+import math
+from collections import Counter
+
+import profiling
+from parquet_export import load_bigquery_schema
+
+_INTEGER_TYPES = ("INTEGER", "INT64")
+_FLOAT_TYPES = ("FLOAT", "FLOAT64", "NUMERIC", "BIGNUMERIC")
+_BOOLEAN_TYPES = ("BOOLEAN", "BOOL")
+_RECORD_TYPES = ("RECORD", "STRUCT")
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _check_scalar(value, field_type):
+    """Returns a rule name if a non-null scalar does not fit field_type, else None."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return "non_finite_float"
+    if field_type in _RECORD_TYPES:
+        return None if isinstance(value, dict) else "record_not_object"
+    if isinstance(value, (dict, list)):
+        return "object_in_scalar"
+    if field_type in _INTEGER_TYPES:
+        if isinstance(value, bool):
+            return "type_mismatch"
+        if isinstance(value, int) or (isinstance(value, float) and value.is_integer()):
+            return None
+        if isinstance(value, str):
+            try:
+                int(value)
+                return None
+            except ValueError:
+                return "type_mismatch"
+        return "type_mismatch"
+    if field_type in _FLOAT_TYPES:
+        if _is_number(value):
+            return None
+        if isinstance(value, str):
+            try:
+                return None if math.isfinite(float(value)) else "non_finite_float"
+            except ValueError:
+                return "type_mismatch"
+        return "type_mismatch"
+    if field_type in _BOOLEAN_TYPES:
+        if isinstance(value, bool) or (isinstance(value, str) and value.lower() in ("true", "false")):
+            return None
+        return "type_mismatch"
+    # STRING, TIMESTAMP, DATE, DATETIME, BYTES, JSON: any JSON scalar is handed to BigQuery's parser
+    return None
+
+class SchemaValidator:
+    """Validates documents against a BigQuery JSON schema."""
+
+    def __init__(self, bq_schema):
+        self.fields = self._compile(bq_schema)
+
+    @classmethod
+    def from_file(cls, schema_path):
+        return cls(load_bigquery_schema(schema_path))
+
+    def _compile(self, bq_fields):
+        """Turns the schema into {name: (type, mode, subfields)} lookups."""
+        compiled = {}
+        for field in bq_fields:
+            field_type = field.get("type", "STRING").upper()
+            subfields = self._compile(field.get("fields", [])) if field_type in _RECORD_TYPES else None
+            compiled[field["name"]] = (field_type, field.get("mode", "NULLABLE").upper(), subfields)
+        return compiled
+
+    def validate(self, doc):
+        """Returns a list of (rule, path) problems; empty when the document conforms."""
+        problems = []
+        self._validate_record(doc, self.fields, "", problems)
+        return problems
+
+    def _validate_record(self, record, fields, prefix, problems):
+        for key in record:
+            if key not in fields:
+                problems.append(("unknown_field", prefix + key))
+        for name, (field_type, mode, subfields) in fields.items():
+            path = prefix + name
+            value = record.get(name)
+            if value is None:
+                if mode == "REQUIRED":
+                    problems.append(("missing_required", path))
+                continue
+            if mode == "REPEATED":
+                if not isinstance(value, list):
+                    problems.append(("repeated_not_array", path))
+                    continue
+                for item in value:
+                    if item is None:
+                        problems.append(("null_in_array", path))
+                    else:
+                        self._validate_value(item, field_type, subfields, path, problems)
+            else:
+                self._validate_value(value, field_type, subfields, path, problems)
+
+    def _validate_value(self, value, field_type, subfields, path, problems):
+        rule = _check_scalar(value, field_type)
+        if rule:
+            problems.append((rule, path))
+        elif subfields is not None:
+            self._validate_record(value, subfields, path + ".", problems)
+
+class Quarantine:
+    """Splits a document stream into valid rows and quarantined rows with per-rule counters."""
+
+    def __init__(self, validator, quarantine_path):
+        self.validator = validator
+        self.quarantine_path = quarantine_path
+        self.counters = Counter()
+        self.valid_count = 0
+        self.quarantined_count = 0
+
+    def filter(self, docs):
+        """Yields conforming documents; writes the others to the quarantine file."""
+        validate = profiling.wrap("export.validate", self.validator.validate)
+        with open(self.quarantine_path, "w", encoding="utf-8") as quarantine_file:
+            for doc in docs:
+                problems = validate(doc)
+                if not problems:
+                    self.valid_count += 1
+                    yield doc
+                    continue
+                self.quarantined_count += 1
+                for rule, path in problems:
+                    self.counters[f"{rule}:{path}"] += 1
+                quarantine_file.write(json.dumps({
+                    "reasons": [f"{rule}:{path}" for rule, path in problems],
+                    "document": doc,
+                }, default=str) + "\n")
+
+    def summary(self):
+        """Counters for this run, ready to log or dump as JSON."""
+        return {
+            "valid_rows": self.valid_count,
+            "quarantined_rows": self.quarantined_count,
+            "rules": dict(self.counters.most_common()),
+        }
+
+    def log_summary(self):
+        logging.info(f"Validation: {self.valid_count} valid rows, {self.quarantined_count} quarantined "
+                     f"(see {self.quarantine_path})")
+        for rule, count in self.counters.most_common():
+            logging.info(f"  {rule}: {count}")
@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+# --- Configuration Section ---
+WATERMARK_FILE = "../data/export_watermarks.json"
+
+# Pipeline stages save watermarks from several threads; each save rewrites the whole file
+_save_lock = threading.Lock()
+
+# --- Value Encoding ---
+def encode_value(value):
+    """Encodes a watermark value (ObjectId, datetime, number, string) for the JSON state file."""
+    from bson import ObjectId
+
+    if isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+def decode_value(value):
+    """Decodes a watermark value read from the JSON state file."""
+    from bson import ObjectId
+
+    if isinstance(value, dict) and "$oid" in value:
+        return ObjectId(value["$oid"])
+    if isinstance(value, dict) and "$date" in value:
+        return datetime.fromisoformat(value["$date"])
+    return value
+
+def format_range_value(value):
+    """Formats a watermark value so it can be embedded in a GCS object name."""
+    if value is None:
+        return "start"
+    if isinstance(value, datetime):
+        return value.strftime("%Y%m%dT%H%M%S")
+    return str(value)
+
+# --- State File ---
+def load_watermark(collection_name, path=WATERMARK_FILE):
+    """Returns the last exported watermark for a collection, or None for a first run."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logging.error(f"Could not read watermark file '{path}': {e}. Refusing to guess a watermark.")
+        raise
+    entry = state.get(collection_name)
+    if not entry:
+        return None
+    return decode_value(entry["value"])
+
+def save_watermark(collection_name, field, value, path=WATERMARK_FILE):
+    """Persists the watermark for a collection (atomic replace of the state file)."""
+    with _save_lock:
+        state = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+
+        state[collection_name] = {
+            "field": field,
+            "value": encode_value(value),
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+
+        # A temporary file of its own, so no other writer can replace or remove it under us
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=os.path.dirname(path) or ".",
+                                         prefix=f"{os.path.basename(path)}.", suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            json.dump(state, f, indent=4)
+        try:
+            os.replace(tmp_path, path)
+        except OSError:
+            os.remove(tmp_path)
+            raise
+    logging.info(f"Saved watermark for '{collection_name}': {field} = {value}")
+
+def watermark_query(field, value):
+    """Builds the MongoDB filter selecting documents beyond the watermark."""
+    if value is None:
+        return {}
+    return {field: {"$gt": value}}
+
+# --- Tracking ---
+class WatermarkTracker:
+    """Tracks the maximum watermark field value over a stream of documents."""
+
+    def __init__(self, field, source_key=None):
+        self.field = field
+        # When set, the raw value is read (and removed) from this key instead of the field itself
+        self.source_key = source_key
+        self.max_value = None
+        self.count = 0
+
+    def track(self, docs):
+        """Yields the documents unchanged, recording the max field value before any transform."""
+        for doc in docs:
+            if self.source_key:
+                value = doc.pop(self.source_key, None)
+            else:
+                value = doc.get(self.field)
+            if value is not None and (self.max_value is None or value > self.max_value):
+                self.max_value = value
+            self.count += 1
+            yield doc
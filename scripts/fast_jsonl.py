@@ -0,0 +1,76 @@
+import json
+import logging
+
+import profiling
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
+
+# --- Configuration Section ---
+RAW_BATCH_SIZE = 5000       # Documents per raw BSON batch requested from MongoDB
+WRITE_BUFFER_ROWS = 10000   # Serialized rows buffered before each file write
+
+# --- Serialization ---
+def _default(value):
+    """Serializes BSON types (ObjectId, Decimal128, datetime, ...) that JSON does not know."""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_APPEND_NEWLINE | orjson.OPT_NON_STR_KEYS
+
+    def dumps_line(doc):
+        """Serializes a document to one newline-terminated JSON line (bytes)."""
+        try:
+            return orjson.dumps(doc, default=_default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # e.g. integers beyond 64 bits, which orjson refuses
+            return json.dumps(doc, default=_default).encode("utf-8") + b"\n"
+else:
+    def dumps_line(doc):
+        """Serializes a document to one newline-terminated JSON line (bytes)."""
+        return json.dumps(doc, default=_default).encode("utf-8") + b"\n"
+
+# --- Extraction ---
+def iter_raw_batches(collection, query=None, projection=None, batch_size=RAW_BATCH_SIZE):
+    """Reads raw BSON batches from MongoDB and decodes each batch with a single C call."""
+    import bson
+
+    cursor = collection.find_raw_batches(query or {}, projection, batch_size=batch_size)
+    for raw_batch in cursor:
+        yield from bson.decode_all(raw_batch)
+
+def iter_raw_aggregate_batches(collection, pipeline, batch_size=RAW_BATCH_SIZE):
+    """Runs an aggregation returning raw BSON batches, decoding each batch with a single C call."""
+    import bson
+
+    cursor = collection.aggregate_raw_batches(pipeline, batchSize=batch_size)
+    for raw_batch in cursor:
+        yield from bson.decode_all(raw_batch)
+
+# --- Writing ---
+def _write_chunks(f, chunks):
+    f.write(b"".join(chunks))
+
+def write_jsonl_fast(docs, file_path, buffer_rows=WRITE_BUFFER_ROWS):
+    """Writes (already transformed) documents to a JSONL file in large buffered chunks."""
+    encode = profiling.wrap("export.json_dumps", dumps_line)
+    write = profiling.wrap("export.file_write", _write_chunks)
+    total_rows = 0
+    buffer = []
+    with open(file_path, "wb") as f:
+        for doc in docs:
+            buffer.append(encode(doc))
+            if len(buffer) >= buffer_rows:
+                write(f, buffer)
+                total_rows += len(buffer)
+                buffer = []
+        if buffer:
+            write(f, buffer)
+            total_rows += len(buffer)
+
+    logging.info(f"Wrote {total_rows} rows to {file_path} (encoder={'orjson' if orjson else 'json'})")
+    return total_rows
@@ -0,0 +1,290 @@
+# Synthetic data generator for the summary collection
+#
+# Produces summary events shaped like production data: every event type in
+# [script_logic] event_collections plus the common non-product events, product_id
+# vs viewing_product_id depending on the event, option as an option list or as a
+# dict with the "category id" key, cart_products whose option is an option list,
+# "" or a plain string, and a mix of IPv4 and IPv6 addresses.
+#
+# Document i is fully determined by (seed, i), and _ids grow with i, so a
+# collection can be topped up to a larger size later and equals one generated at
+# that size in one go. Optionally also writes matching products and ip_locations
+# collections, so the product and IP location exports have input without the
+# crawler or the IP2Location database.
+#
+# Usage: python generate_summary_data.py --docs 1000000 [--db glamira_bench] [--workers 4]
+#                                        [--with-products] [--with-ip-locations] [--drop]
+
+import argparse
+import ipaddress
+import logging
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import runtime
+
+# --- Configuration Section ---
+DEFAULT_DB_NAME = "glamira_bench"  # Never the production database by default
+INSERT_BATCH_SIZE = 10000
+DEFAULT_SEED = 42
+DEFAULT_PRODUCTS = 20000           # Distinct product IDs referenced by events
+DEFAULT_IP_POOL = 4000000          # Distinct client addresses (production: ~1 per 12 events)
+IPV6_SHARE = 10                    # 1 in IPV6_SHARE addresses is IPv6
+START_TIMESTAMP = 1585612800      # 2020-03-31 00:00:00 UTC, first event
+EVENTS_PER_SECOND = 20             # _id / time_stamp advance one second every N events
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Event type -> relative frequency
+EVENT_WEIGHTS = {
+    "view_product_detail": 30,
+    "select_product_option": 14,
+    "select_product_option_quality": 6,
+    "add_to_cart_action": 5,
+    "product_detail_recommendation_visible": 12,
+    "product_detail_recommendation_noticed": 4,
+    "product_view_all_recommend_clicked": 2,
+    "view_listing_page": 12,
+    "view_shopping_cart": 4,
+    "checkout": 2,
+    "checkout_success": 1,
+    "search_box_action": 3,
+    "view_landing_page": 5,
+}
+EVENT_TYPES = list(EVENT_WEIGHTS)
+EVENT_CUM_WEIGHTS = []
+for _weight in EVENT_WEIGHTS.values():
+    EVENT_CUM_WEIGHTS.append((EVENT_CUM_WEIGHTS[-1] if EVENT_CUM_WEIGHTS else 0) + _weight)
+
+STORES = [("de", "€", 6), ("co.uk", "£", 2), ("fr", "€", 4), ("it", "€", 5), ("com", "$", 1),
+          ("pl", "zł", 41), ("se", "kr", 9), ("com.au", "AUD", 53), ("nl", "€", 20), ("es", "€", 19)]
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.97 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 13_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.1.1 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 10; SM-G973F) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/83.0.4103.101 Mobile Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_5) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/13.1.1 Safari/605.1.15",
+]
+RESOLUTIONS = ["1920x1080", "1366x768", "375x667", "414x896", "1536x864", "360x640"]
+ALLOYS = ["white-375", "yellow-585", "red-750", "platinum", "silber"]
+DIAMONDS = ["diamond-Brillant", "sapphire", "ruby", "zirconia", "emerald"]
+STRING_OPTIONS = ["Ring size 52", "Engraving: Forever", "gift box"]
+SEARCH_TERMS = ["verlobungsring", "ring", "ohrringe", "engagement ring", "kette", "bague"]
+PRODUCT_COLLECTIONS = ["Glamira", "Glamira Classic", "Glamira Tiny", "Glamira Eternity", "Glamira Ocean"]
+
+# --- Value Helpers ---
+def object_id(index, seed=DEFAULT_SEED):
+    """Unique, increasing ObjectId for document index (timestamp + index)."""
+    seconds = START_TIMESTAMP + index // EVENTS_PER_SECOND
+    return ObjectId(struct.pack(">IIi", seconds, index & 0xFFFFFFFF, seed))
+
+def ip_address(ip_index):
+    """Deterministic client address for a pool index; every IPV6_SHARE-th one is IPv6."""
+    mixed = (ip_index * 2654435761 + 0x9E3779B9) & 0xFFFFFFFF
+    if ip_index % IPV6_SHARE == 0:
+        high = (0x2A02 << 112) | (mixed << 64) | ((ip_index * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF)
+        return str(ipaddress.IPv6Address(high))
+    # Keep the first octet in public unicast space (1-223, no 10/127)
+    first = 1 + (mixed >> 24) % 223
+    if first in (10, 127):
+        first += 1
+    return str(ipaddress.IPv4Address((first << 24) | (mixed & 0xFFFFFF)))
+
+def product_id(product_index):
+    return str(10000 + product_index * 7)
+
+def option_list(rng):
+    """Option list as sent by the product page."""
+    options = [{"option_label": "alloy", "option_id": str(rng.randint(1, 300000)),
+                "value_label": rng.choice(ALLOYS), "value_id": str(rng.randint(1, 3000000))}]
+    if rng.random() < 0.6:
+        options.append({"option_label": "diamond", "option_id": str(rng.randint(1, 300000)),
+                        "value_label": rng.choice(DIAMONDS), "value_id": str(rng.randint(1, 3000000))})
+    return options
+
+def cart_option(rng):
+    """cart_products.option: usually an option list, often "", rarely a plain string."""
+    roll = rng.random()
+    if roll < 0.70:
+        return option_list(rng)
+    if roll < 0.97:
+        return ""
+    return rng.choice(STRING_OPTIONS)
+
+def cart_products(rng, products):
+    return [{"product_id": int(product_id(rng.randrange(products))), "amount": rng.randint(1, 2),
+             "price": f"{rng.uniform(150, 5000):.2f}", "currency": rng.choice(STORES)[1],
+             "option": cart_option(rng)}
+            for _ in range(rng.randint(1, 3))]
+
+# --- Document Builder ---
+def make_event(index, seed=DEFAULT_SEED, products=DEFAULT_PRODUCTS, ip_pool=DEFAULT_IP_POOL):
+    """Builds summary event number index."""
+    rng = random.Random(index * 1000003 + seed)
+    event = rng.choices(EVENT_TYPES, cum_weights=EVENT_CUM_WEIGHTS)[0]
+    domain, currency, store_id = rng.choice(STORES)
+    seconds = START_TIMESTAMP + index // EVENTS_PER_SECOND
+    product = product_id(rng.randrange(products))
+
+    doc = {
+        "_id": object_id(index, seed),
+        "time_stamp": seconds,
+        "ip": ip_address(rng.randrange(ip_pool)),
+        "user_agent": rng.choice(USER_AGENTS),
+        "resolution": rng.choice(RESOLUTIONS),
+        "user_id_db": str(rng.randint(1, 500000)) if rng.random() < 0.1 else "",
+        "device_id": f"{rng.getrandbits(128):032x}",
+        "api_version": "1.0",
+        "store_id": str(store_id),
+        "local_time": datetime.utcfromtimestamp(seconds).strftime("%Y-%m-%d %H:%M:%S"),
+        "show_recommendation": "false",
+        "current_url": f"https://www.glamira.{domain}/glamira-ring-{product}.html",
+        "referrer_url": f"https://www.glamira.{domain}/",
+        "email_address": "",
+        "collection": event,
+    }
+
+    if event == "product_view_all_recommend_clicked":
+        doc["viewing_product_id"] = product
+    elif event in ("product_detail_recommendation_visible", "product_detail_recommendation_noticed"):
+        doc["product_id"] = product
+        doc["viewing_product_id"] = product_id(rng.randrange(products))
+        doc["recommendation"] = True
+    elif event in ("view_product_detail", "select_product_option", "select_product_option_quality"):
+        doc["product_id"] = product
+        if rng.random() < 0.02:
+            # Older tracker releases sent a dict with a space in the key
+            doc["option"] = {"category id": str(rng.randint(1, 200)), "alloy": rng.choice(ALLOYS)}
+        else:
+            doc["option"] = option_list(rng)
+        doc["price"] = f"{rng.uniform(150, 5000):.2f}"
+        doc["currency"] = currency
+    elif event in ("add_to_cart_action", "view_shopping_cart", "checkout", "checkout_success"):
+        if event == "add_to_cart_action":
+            doc["product_id"] = product
+        doc["cart_products"] = cart_products(rng, products)
+        if event == "checkout_success":
+            doc["order_id"] = str(rng.randint(10000000, 99999999))
+    elif event == "search_box_action":
+        doc["key_search"] = rng.choice(SEARCH_TERMS)
+    elif event == "view_listing_page":
+        doc["cat_id"] = str(rng.randint(1, 500))
+
+    if rng.random() < 0.3:
+        doc["utm_source"] = rng.choice(["google", "facebook", "newsletter"])
+        doc["utm_medium"] = rng.choice(["cpc", "social", "email"])
+    return doc
+
+def make_product(product_index, seed=DEFAULT_SEED):
+    """products document for a product index (collection is occasionally +inf, as in production)."""
+    rng = random.Random(product_index * 7919 + seed)
+    return {
+        "_id": ObjectId(struct.pack(">IIi", START_TIMESTAMP, product_index, seed)),
+        "product_id": product_id(product_index),
+        "name": f"Glamira Ring {product_index}",
+        "collection": float("inf") if rng.random() < 0.01 else rng.choice(PRODUCT_COLLECTIONS),
+        "price": f"{rng.uniform(150, 5000):.2f}",
+    }
+
+def make_ip_location(ip_index, seed=DEFAULT_SEED):
+    """ip_locations document for a pool index, with made-up geography."""
+    rng = random.Random(ip_index * 104729 + seed)
+    country_code, country_name = rng.choice([("DE", "Germany"), ("GB", "United Kingdom"), ("FR", "France"),
+                                             ("IT", "Italy"), ("US", "United States of America"),
+                                             ("VN", "Viet Nam"), ("AU", "Australia")])
+    return {
+        "ip": ip_address(ip_index),
+        "country_code": country_code,
+        "country_name": country_name,
+        "region_name": f"Region {rng.randint(1, 40)}",
+        "city_name": f"City {rng.randint(1, 500)}",
+        "last_updated": datetime(2025, 1, 1) + timedelta(seconds=ip_index),
+    }
+
+# --- Writers ---
+def insert_range(collection, builder, start, stop, **kwargs):
+    """Builds and inserts documents [start, stop) in INSERT_BATCH_SIZE batches."""
+    for batch_start in range(start, stop, INSERT_BATCH_SIZE):
+        batch = [builder(i, **kwargs) for i in range(batch_start, min(batch_start + INSERT_BATCH_SIZE, stop))]
+        collection.insert_many(batch, ordered=False)
+
+def _insert_range_worker(mongo_uri, db_name, collection_name, builder_name, start, stop, kwargs):
+    """Process pool entry point: own client per worker process."""
+    import pymongo
+    client = pymongo.MongoClient(mongo_uri)
+    try:
+        insert_range(client[db_name][collection_name], globals()[builder_name], start, stop, **kwargs)
+    finally:
+        client.close()
+    return stop - start
+
+def fill_collection(db, collection_name, builder, target, workers=1, **kwargs):
+    """Tops a collection up to target documents built by builder(index); returns the number inserted."""
+    collection = db[collection_name]
+    existing = collection.estimated_document_count()
+    if existing >= target:
+        logging.info(f"'{collection_name}' already has {existing} documents (target {target}).")
+        return 0
+
+    started = time.perf_counter()
+    logging.info(f"Generating {target - existing} documents into '{db.name}.{collection_name}' "
+                 f"({existing} -> {target}, {workers} worker(s))...")
+    if workers <= 1:
+        insert_range(collection, builder, existing, target, **kwargs)
+    else:
+        mongo_uri = runtime.load_config()["mongodb"]["mongo_uri"]
+        step = max(INSERT_BATCH_SIZE, (target - existing) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_insert_range_worker, mongo_uri, db.name, collection_name,
+                                       builder.__name__, start, min(start + step, target), kwargs)
+                       for start in range(existing, target, step)]
+            for future in futures:
+                future.result()
+
+    seconds = time.perf_counter() - started
+    logging.info(f"Inserted {target - existing} documents in {seconds:.1f}s "
+                 f"({(target - existing) / seconds:,.0f} docs/s)")
+    return target - existing
+
+def generate(db, docs, seed=DEFAULT_SEED, products=DEFAULT_PRODUCTS, ip_pool=DEFAULT_IP_POOL, workers=1,
+             with_products=False, with_ip_locations=False):
+    """Tops up summary (and optionally products / ip_locations) in db."""
+    config = runtime.load_config()["mongodb"]
+    fill_collection(db, config["summary_collection"], make_event, docs, workers=workers,
+                    seed=seed, products=products, ip_pool=ip_pool)
+    if with_products:
+        fill_collection(db, config["products_collection"], make_product, products, workers=workers, seed=seed)
+    if with_ip_locations:
+        # Only the part of the address pool the events can actually reference
+        fill_collection(db, config["location_collection"], make_ip_location, min(ip_pool, docs),
+                        workers=workers, seed=seed)
+
+# --- Script entry point ---
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic summary events into MongoDB.")
+    parser.add_argument("--docs", type=int, required=True, help="Target number of summary documents")
+    parser.add_argument("--db", default=DEFAULT_DB_NAME, help=f"Database to fill (default: {DEFAULT_DB_NAME})")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--products", type=int, default=DEFAULT_PRODUCTS)
+    parser.add_argument("--ip-pool", type=int, default=DEFAULT_IP_POOL)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--with-products", action="store_true")
+    parser.add_argument("--with-ip-locations", action="store_true")
+    parser.add_argument("--drop", action="store_true", help="Drop the generated collections first")
+    args = parser.parse_args()
+
+    db = runtime.get_mongo_client()[args.db]
+    if args.drop:
+        config = runtime.load_config()["mongodb"]
+        for name in ("summary_collection", "products_collection", "location_collection"):
+            db.drop_collection(config[name])
+    generate(db, args.docs, seed=args.seed, products=args.products, ip_pool=args.ip_pool,
+             workers=args.workers, with_products=args.with_products, with_ip_locations=args.with_ip_locations)
+    runtime.close_mongo_client()
+
+if __name__ == "__main__":
+    main()
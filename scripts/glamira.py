@@ -0,0 +1,159 @@
+# Single entry point for every pipeline stage
+#
+# Usage:
+#   python glamira.py [--config ../config/config.ini] crawl
+#   python glamira.py ip-locations
+#   python glamira.py export user_behaviors [--format parquet] [--fast] [--mode delta] [--pushdown] [--validate]
+#   python glamira.py stream [--max-events N] [--max-seconds S]   (change stream, see stream_user_behaviors_to_gcs.py)
+#   python glamira.py rollups [--rollup NAME] [--rebuild] [--export]
+#   python glamira.py dq-scan [--collection summary] [--check NAME] [--partitions 8]
+#   python glamira.py check-options
+#   python glamira.py pipeline [--local] [--resume] ...   (see run_pipeline.py)
+#   python glamira.py --profile spans,tracemalloc export products   (see profiling.py)
+#
+# Stage modules are imported only when their subcommand runs, and they all share
+# the config and pooled MongoDB client from runtime.py. dq-scan and pipeline hand
+# their options to the stage script's own parser (python glamira.py pipeline -h).
+
+import argparse
+import importlib
+import runpy
+import threading
+
+import profiling
+import runtime
+from collection_export import ENRICH_SOURCES, EXPORT_FORMATS, EXPORT_MODES, EXPORT_MODULES
+
+# Subcommands whose options are parsed by the stage script itself
+PASS_THROUGH_COMMANDS = ("dq-scan", "pipeline")
+
+def run_crawl(args):
+    import crawl_product_name
+    crawl_product_name.process_product_data()
+
+def run_ip_locations(args):
+    import process_ip_location
+    process_ip_location.process_ip_locations()
+
+def run_export(args):
+    exporter = importlib.import_module(EXPORT_MODULES[args.dataset])
+    options = dict(
+        export_format=args.export_format or exporter.EXPORT_FORMAT,
+        fast=args.fast or exporter.FAST_SERIALIZATION,
+        mode=args.mode or exporter.EXPORT_MODE,
+        pushdown=args.pushdown or exporter.PUSHDOWN_TRANSFORMS,
+        validate=args.validate or exporter.VALIDATE_ROWS,
+    )
+    if args.enrich:
+        if not exporter.export_spec().supports_enrichment:
+            raise SystemExit(f"--enrich is not supported for {args.dataset}")
+        options["enrich"] = args.enrich
+    exporter.export_to_gcs(**options)
+
+def run_stream(args):
+    import stream_user_behaviors_to_gcs as streamer
+    stop = threading.Event()
+    streamer.stop_on_signals(stop)
+    streamer.stream_to_gcs(
+        max_events=args.max_events or streamer.MAX_BATCH_EVENTS,
+        max_seconds=args.max_seconds or streamer.MAX_BATCH_SECONDS,
+        fast=args.fast or streamer.FAST_SERIALIZATION,
+        enrich=args.enrich or streamer.ENRICH_LOCATIONS,
+        reset=args.reset,
+        max_batches=args.max_batches,
+        stop=stop,
+    )
+
+def run_rollups(args):
+    import event_rollups
+    event_rollups.update_rollups(args.rollup, rebuild=args.rebuild)
+    if args.export:
+        event_rollups.export_rollups(args.rollup)
+
+def run_dq_scan(args):
+    import data_quality_scan
+    data_quality_scan.main(args.stage_args, prog="glamira.py dq-scan")
+
+def run_check_options(args):
+    runpy.run_module("check_cart_products_options", run_name="__main__")
+
+def run_full_pipeline(args):
+    import run_pipeline
+    run_pipeline.configure_logging()
+    options = run_pipeline.build_parser(prog="glamira.py pipeline").parse_args(args.stage_args)
+    if not run_pipeline.run(options):
+        raise SystemExit(1)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Glamira data pipeline.")
+    parser.add_argument("--config", help="Config file (default: $GLAMIRA_CONFIG or ../config/config.ini)")
+    profiling.add_argument(parser)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    crawl = subparsers.add_parser("crawl", help="Crawl product names from glamira.com")
+    crawl.set_defaults(func=run_crawl)
+
+    ip_locations = subparsers.add_parser("ip-locations", help="Resolve IP geolocations into MongoDB")
+    ip_locations.set_defaults(func=run_ip_locations)
+
+    export = subparsers.add_parser("export", help="Export a collection to GCS")
+    export.add_argument("dataset", choices=sorted(EXPORT_MODULES))
+    export.add_argument("--format", dest="export_format", choices=EXPORT_FORMATS)
+    export.add_argument("--fast", action="store_true")
+    export.add_argument("--mode", choices=EXPORT_MODES)
+    export.add_argument("--pushdown", action="store_true")
+    export.add_argument("--validate", action="store_true")
+    export.add_argument("--enrich", choices=ENRICH_SOURCES,
+                        help="user_behaviors only: attach the IP location to every event")
+    export.set_defaults(func=run_export)
+
+    stream = subparsers.add_parser("stream", help="Continuously export new user behaviour events (change stream)")
+    stream.add_argument("--max-events", type=int, help="Events per uploaded file at most")
+    stream.add_argument("--max-seconds", type=float, help="Seconds a batch stays open at most")
+    stream.add_argument("--fast", action="store_true")
+    stream.add_argument("--enrich", choices=ENRICH_SOURCES)
+    stream.add_argument("--reset", action="store_true", help="Forget the saved resume token and start from now")
+    stream.add_argument("--max-batches", type=int, help="Stop after uploading this many batches")
+    stream.set_defaults(func=run_stream)
+
+    rollups = subparsers.add_parser("rollups", help="Update the event rollups incrementally ($merge)")
+    rollups.add_argument("--rollup", action="append", help="Restrict to these rollups")
+    rollups.add_argument("--rebuild", action="store_true", help="Recompute the rollups from all events")
+    rollups.add_argument("--export", action="store_true", help="Export a snapshot of the rollups to GCS")
+    rollups.set_defaults(func=run_rollups)
+
+    dq_scan = subparsers.add_parser("dq-scan", add_help=False,
+                                    help="Run data-quality checks inside MongoDB (options: dq-scan -h)")
+    dq_scan.set_defaults(func=run_dq_scan)
+
+    check_options = subparsers.add_parser("check-options", help="List cart products with string options")
+    check_options.set_defaults(func=run_check_options)
+
+    pipeline = subparsers.add_parser("pipeline", add_help=False,
+                                     help="Run every stage as one concurrent, streaming DAG (options: pipeline -h)")
+    pipeline.set_defaults(func=run_full_pipeline)
+
+    return parser
+
+def parse_args(argv=None):
+    """Parses the command line; the options of pass-through subcommands are kept in args.stage_args."""
+    parser = build_parser()
+    args, stage_args = parser.parse_known_args(argv)
+    if stage_args and args.command not in PASS_THROUGH_COMMANDS:
+        parser.error(f"unrecognized arguments: {' '.join(stage_args)}")
+    args.stage_args = stage_args
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.config:
+        runtime.set_config_path(args.config)
+    profiling.configure(args.profile)
+    try:
+        with profiling.session(args.command.replace("-", "_")):
+            args.func(args)
+    finally:
+        runtime.close_mongo_client()
+
+if __name__ == "__main__":
+    main()
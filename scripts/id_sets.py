@@ -0,0 +1,236 @@
+# Compact product-ID sets for the crawler's resume files
+#
+# Product IDs are numeric strings, so a set of them is stored as a sorted array
+# of unique int64 values instead of a Python set of str objects (~8 bytes per ID
+# instead of ~100). On disk the array is written as raw little-endian int64 after
+# a small header, so loading it is a memory map rather than a parse:
+#   8 bytes   magic b"GLMIDS01"
+#   8 bytes   number of integer IDs (n)
+#   8 bytes   length of the JSON tail in bytes
+#   8*n bytes sorted, unique int64 IDs
+#   tail      JSON list of the IDs that are not canonical integers ("A12", "007")
+# Difference and union work on the sorted arrays (vectorized with NumPy when it
+# is installed, bisect / merge over array('q') otherwise); the rare non-numeric
+# IDs are kept in a small frozenset beside the array.
+#
+# Files are written as <name>.ids. load_ids() migrates an existing <name>.json
+# (the former pretty-printed JSON list) on first use and leaves it in place.
+
+import bisect
+import heapq
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # Pure-Python fallback over array('q')
+    np = None
+
+# --- Configuration Section ---
+MAGIC = b"GLMIDS01"
+HEADER = struct.Struct("<8sQQ")
+BINARY_SUFFIX = ".ids"
+LEGACY_SUFFIX = ".json"
+BUILDER_CHUNK_SIZE = 1000000  # Pending IDs folded into the sorted array at a time
+ITER_CHUNK_SIZE = 65536        # Integers converted to str per slice while iterating
+INT64_ID = re.compile(r"0|-?[1-9][0-9]{0,17}")  # Round-trips through int() and fits in int64
+
+# --- Helper Functions ---
+def _split(ids):
+    """Splits IDs into integers (canonical numeric IDs) and the remaining strings."""
+    ints, strings = [], set()
+    for value in ids:
+        value = str(value)
+        if INT64_ID.fullmatch(value):
+            ints.append(int(value))
+        else:
+            strings.add(value)
+    return ints, strings
+
+def _sorted_unique(ints):
+    if np is not None:
+        return np.unique(np.asarray(ints, dtype=np.int64))
+    return array("q", sorted(set(ints)))
+
+def _empty():
+    return np.empty(0, dtype=np.int64) if np is not None else array("q")
+
+def _members(values, sorted_ids):
+    """NumPy mask of the values that are in sorted_ids."""
+    if not len(sorted_ids):
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(sorted_ids, values).clip(max=len(sorted_ids) - 1)
+    return sorted_ids[positions] == values
+
+def _contains(sorted_ids, value):
+    position = bisect.bisect_left(sorted_ids, value)
+    return position < len(sorted_ids) and sorted_ids[position] == value
+
+def _walk_difference(left, right):
+    """Values of sorted left that are not in sorted right, in one merge pass."""
+    right = iter(right)
+    current = next(right, None)
+    for value in left:
+        while current is not None and current < value:
+            current = next(right, None)
+        if value != current:
+            yield value
+
+def binary_path(path):
+    """The .ids file for a configured ID file path (which may still name the old .json)."""
+    root, ext = os.path.splitext(path)
+    return root + BINARY_SUFFIX if ext == LEGACY_SUFFIX else path
+
+def legacy_path(path):
+    """The former JSON file for a configured ID file path."""
+    return os.path.splitext(path)[0] + LEGACY_SUFFIX
+
+class IdSet:
+    """Immutable set of product IDs: a sorted int64 array plus a frozenset of non-numeric IDs."""
+
+    __slots__ = ("ints", "strings", "_mapping")
+
+    def __init__(self, ints=None, strings=(), mapping=None):
+        self.ints = _empty() if ints is None else ints  # Sorted and unique
+        self.strings = frozenset(strings)
+        self._mapping = mapping  # Keeps a pure-Python memory map open
+
+    @classmethod
+    def from_ids(cls, ids):
+        ints, strings = _split(ids)
+        return cls(_sorted_unique(ints), strings)
+
+    def __len__(self):
+        return len(self.ints) + len(self.strings)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        """Yields the IDs as strings, numeric ones in ascending order."""
+        for start in range(0, len(self.ints), ITER_CHUNK_SIZE):
+            for value in self.ints[start:start + ITER_CHUNK_SIZE].tolist():
+                yield str(value)
+        yield from sorted(self.strings)
+
+    def __contains__(self, product_id):
+        ints, strings = _split([product_id])
+        if strings:
+            return strings.pop() in self.strings
+        return _contains(self.ints, ints[0])
+
+    def difference(self, other):
+        """IDs of this set that are not in other (an IdSet or any iterable of IDs)."""
+        other = as_id_set(other)
+        if np is not None:
+            ints = self.ints[~_members(self.ints, other.ints)]
+        else:
+            ints = array("q", _walk_difference(self.ints, other.ints))
+        return IdSet(ints, self.strings - other.strings)
+
+    def union(self, other):
+        """IDs in either set; cheap when other is small (only its new IDs are inserted)."""
+        other = as_id_set(other)
+        if np is not None:
+            new = other.ints[~_members(other.ints, self.ints)]
+            ints = np.insert(self.ints, np.searchsorted(self.ints, new), new)
+        else:
+            new = [value for value in other.ints if not _contains(self.ints, value)]
+            ints = array("q", heapq.merge(self.ints, new))
+        return IdSet(ints, self.strings | other.strings)
+
+    def nbytes(self):
+        """Approximate memory held by the set."""
+        size = len(self.ints) * 8
+        return size + sum(sys.getsizeof(value) for value in self.strings)
+
+def as_id_set(ids):
+    return ids if isinstance(ids, IdSet) else IdSet.from_ids(ids or ())
+
+class IdSetBuilder:
+    """Accumulates IDs in bounded chunks, so extraction never holds them all as str objects."""
+
+    def __init__(self, chunk_size=BUILDER_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._ids = IdSet()
+        self._pending = []
+
+    def add(self, product_id):
+        self._pending.append(product_id)
+        if len(self._pending) >= self.chunk_size:
+            self._fold()
+
+    def _fold(self):
+        if self._pending:
+            self._ids = _merge(self._ids, IdSet.from_ids(self._pending))
+            self._pending = []
+
+    def build(self):
+        self._fold()
+        return self._ids
+
+def _merge(left, right):
+    """Union of two sets of comparable size (one sort instead of a bulk insert)."""
+    if np is not None:
+        ints = np.union1d(left.ints, right.ints)
+    else:
+        ints = array("q", sorted(set(left.ints) | set(right.ints)))
+    return IdSet(ints, left.strings | right.strings)
+
+# --- Persistence ---
+def save_ids(ids, path):
+    """Writes an ID set atomically to the .ids file for path; returns the file written."""
+    ids = as_id_set(ids)
+    path = binary_path(path)
+    tail = json.dumps(sorted(ids.strings)).encode("utf-8")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(ids.ints), len(tail)))
+        if np is not None:
+            np.asarray(ids.ints, dtype="<i8").tofile(f)
+        else:
+            values = array("q", ids.ints)
+            if sys.byteorder != "little":
+                values.byteswap()
+            values.tofile(f)
+        f.write(tail)
+    os.replace(tmp_path, path)
+    return path
+
+def _read_binary(path):
+    with open(path, "rb") as f:
+        magic, count, tail_length = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not a product ID file")
+        f.seek(HEADER.size + count * 8)
+        strings = json.loads(f.read(tail_length).decode("utf-8"))
+        if not count:
+            return IdSet(strings=strings)
+        if np is not None:
+            return IdSet(np.memmap(path, dtype="<i8", mode="r", offset=HEADER.size, shape=(count,)), strings)
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    ints = memoryview(mapping)[HEADER.size:HEADER.size + count * 8].cast("q")
+    if sys.byteorder != "little":
+        ints = array("q", ints)
+        ints.byteswap()
+    return IdSet(ints, strings, mapping)
+
+def load_ids(path):
+    """Loads the ID set for path (memory-mapped), migrating a legacy JSON list; None when neither exists."""
+    path = binary_path(path)
+    if os.path.exists(path):
+        return _read_binary(path)
+    legacy = legacy_path(path)
+    if not os.path.exists(legacy):
+        return None
+    with open(legacy, "r") as f:
+        ids = IdSet.from_ids(json.load(f))
+    save_ids(ids, path)
+    logging.info(f"Migrated {len(ids)} IDs from '{legacy}' to '{path}'.")
+    return ids
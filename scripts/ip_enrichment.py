@@ -0,0 +1,165 @@
+# IP geolocation enrichment for the user-behaviour export
+#
+# Attaches country_code / region_name / city_name to every event while it
+# streams to the export file, so BigQuery queries no longer join
+# raw_user_behaviors to raw_ip_locations on ip. Two sources:
+#   index        the ip_locations collection (built by process_ip_location.py),
+#                loaded once into an in-memory hash index ip -> location tuple;
+#                identical locations share one tuple, so the index costs roughly
+#                one dict slot and one key string per IP
+#   ip2location  the IP2Location BIN file, resolved on the fly behind an LRU cache
+# In index mode, IPs missing from ip_locations fall back to the BIN file when it
+# exists. IPs that stay unresolved are exported with null location fields.
+# Hits, misses and the index size are logged at the end of the export.
+
+import functools
+import json
+import logging
+import os
+import sys
+import time
+
+import profiling
+import runtime
+
+IP2Location = runtime.lazy_import("IP2Location")
+
+# --- Configuration Section ---
+SOURCES = ("index", "ip2location")
+LOCATION_FIELDS = ("country_code", "region_name", "city_name")
+LRU_CACHE_SIZE = 500000       # IP2Location results kept in memory (per export)
+MISS_SAMPLE_SIZE = 20         # Unresolved IPs kept for the report
+UNRESOLVED = (None, None, None)
+
+# BigQuery columns added to the user_behaviors schema when enrichment is on
+SCHEMA_FIELDS = [{"name": name, "type": "STRING", "mode": "NULLABLE"} for name in LOCATION_FIELDS]
+
+# --- Helper Functions ---
+def load_index(collection, batch_size=None):
+    """Loads ip_locations into {ip: (country_code, region_name, city_name)}."""
+    projection = {"_id": 0, "ip": 1}
+    projection.update({name: 1 for name in LOCATION_FIELDS})
+    index = {}
+    locations = {}  # Interning table: one shared tuple per distinct location
+    cursor = collection.find({}, projection, batch_size=batch_size or runtime.mongo_batch_size())
+    for doc in profiling.timed_iter("enrich.load_index", cursor):
+        location = tuple(doc.get(name) for name in LOCATION_FIELDS)
+        index[doc.get("ip")] = locations.setdefault(location, location)
+    return index, len(locations)
+
+def index_size_bytes(index):
+    """Approximate memory held by the index: table, keys and the distinct location tuples."""
+    size = sys.getsizeof(index) + sum(sys.getsizeof(ip) for ip in index)
+    distinct = {id(location): location for location in index.values()}
+    for location in distinct.values():
+        size += sys.getsizeof(location) + sum(sys.getsizeof(value) for value in location if value is not None)
+    return size
+
+class IpLocationEnricher:
+    """Resolves event IPs to locations from an in-memory index and/or the IP2Location database."""
+
+    def __init__(self, source, index=None, ip_db=None, cache_size=LRU_CACHE_SIZE):
+        self.source = source
+        self.index = index
+        self.ip_db = ip_db
+        self.index_hits = 0
+        self.unresolved = 0
+        self.missed_ips = []
+        self.index_entries = len(index) if index is not None else 0
+        self.distinct_locations = None
+        self.index_bytes = index_size_bytes(index) if index is not None else 0
+        self.load_seconds = 0.0
+        self._resolve = functools.lru_cache(maxsize=cache_size)(self._ip2location) if ip_db is not None else None
+
+    def _ip2location(self, ip):
+        try:
+            record = self.ip_db.get_all(ip)
+        except Exception as e:
+            logging.debug(f"IP2Location lookup failed for '{ip}': {e}")
+            return UNRESOLVED
+        if not record:
+            return UNRESOLVED
+        return (record.country_short, record.region, record.city)
+
+    def lookup(self, ip):
+        """(country_code, region_name, city_name) for ip, or UNRESOLVED."""
+        if self.index is not None:
+            location = self.index.get(ip)
+            if location is not None:
+                self.index_hits += 1
+                return location
+        location = self._resolve(ip) if self._resolve is not None and ip else UNRESOLVED
+        if location is UNRESOLVED:
+            self.unresolved += 1
+            if len(self.missed_ips) < MISS_SAMPLE_SIZE and ip not in self.missed_ips:
+                self.missed_ips.append(ip)
+        return location
+
+    def enrich(self, docs):
+        """Yields the documents with the location fields set."""
+        lookup = profiling.wrap("enrich.ip_lookup", self.lookup)
+        for doc in docs:
+            doc["country_code"], doc["region_name"], doc["city_name"] = lookup(doc.get("ip"))
+            yield doc
+
+    def summary(self):
+        """Hit / miss counts and memory use of the lookup structures."""
+        cache = None
+        if self._resolve is not None:
+            info = self._resolve.cache_info()
+            cache = {"hits": info.hits, "misses": info.misses, "entries": info.currsize, "max_entries": info.maxsize}
+        return {
+            "source": self.source,
+            "index_entries": self.index_entries,
+            "distinct_locations": self.distinct_locations,
+            "index_mb": round(self.index_bytes / 1e6, 1),
+            "index_load_seconds": round(self.load_seconds, 2),
+            "index_hits": self.index_hits,
+            "ip2location_cache": cache,
+            "unresolved_events": self.unresolved,
+            "unresolved_sample": self.missed_ips,
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+        cache = summary["ip2location_cache"]
+        logging.info(f"IP enrichment ({self.source}): {self.index_hits:,} index hits, "
+                     f"{summary['unresolved_events']:,} events without a location")
+        if self.index is not None:
+            logging.info(f"IP index: {self.index_entries:,} IPs, {summary['distinct_locations']:,} distinct locations, "
+                         f"~{summary['index_mb']} MB, loaded in {summary['index_load_seconds']}s")
+        if cache is not None:
+            logging.info(f"IP2Location cache: {cache['hits']:,} hits, {cache['misses']:,} lookups, "
+                         f"{cache['entries']:,}/{cache['max_entries']:,} entries")
+        if self.missed_ips:
+            logging.warning(f"Sample of unresolved IPs: {self.missed_ips}")
+
+    def write_summary(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=4)
+
+def open_ip2location(required):
+    """Opens the configured IP2Location database (None when missing and not required)."""
+    path = runtime.resolve_path(runtime.load_config()["ip2location"]["ip2location_db_path"])
+    if not os.path.exists(path):
+        if required:
+            raise FileNotFoundError(f"IP2Location database file not found at '{path}'")
+        logging.info(f"IP2Location database not found at '{path}'; IPs missing from the index stay unresolved.")
+        return None
+    return IP2Location.IP2Location(path)
+
+def build_enricher(source, cache_size=LRU_CACHE_SIZE):
+    """Creates the enricher for source ("index" or "ip2location")."""
+    if source not in SOURCES:
+        raise ValueError(f"Unsupported enrichment source: {source}")
+    if source == "ip2location":
+        return IpLocationEnricher(source, ip_db=open_ip2location(required=True), cache_size=cache_size)
+
+    started = time.perf_counter()
+    collection_name = runtime.load_config()["mongodb"]["location_collection"]
+    index, distinct_locations = load_index(runtime.get_collection(collection_name))
+    enricher = IpLocationEnricher(source, index=index, ip_db=open_ip2location(required=False), cache_size=cache_size)
+    enricher.distinct_locations = distinct_locations
+    enricher.load_seconds = time.perf_counter() - started
+    logging.info(f"Loaded {len(index):,} IP locations from '{collection_name}' in {enricher.load_seconds:.1f}s")
+    return enricher
@@ -0,0 +1,164 @@
+# Buffered bulk upserts into MongoDB
+#
+# Records are buffered and written as one unordered bulk_write of UpdateOne
+# upserts keyed on a field (product_id for the crawler); delete() buffers a
+# DeleteOne for a key the same way. The buffer is flushed when it reaches
+# flush_size, every flush_interval seconds from a background thread, and on
+# close(). Unordered batches let the server keep going past a bad record; those
+# errors are logged and counted, while batches that fail as a whole (connection
+# loss) go back into the buffer for the next flush.
+#
+# After such a failure the sink backs off: a full buffer no longer flushes in
+# the calling thread until flush_interval has passed, so the crawler threads
+# do not each retry the write against a server that is down. Meanwhile the
+# buffer grows up to max_buffer keys; records for further keys are dropped and
+# counted.
+#
+# on_written, when set, is called after every bulk_write with the keys whose
+# upserts the server applied (not deletions, not rejected records), so a caller
+# can treat a record as stored only once it really is.
+
+import logging
+import threading
+import time
+
+import profiling
+
+# --- Configuration Section ---
+DEFAULT_FLUSH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 5.0  # seconds
+DEFAULT_MAX_BUFFER = 20000    # Keys held at most while MongoDB is unreachable
+_DELETE = object()            # Buffered in place of a record: delete the key's document
+
+class BulkUpsertSink:
+    """Thread-safe buffer of upserts into one collection, keyed on one field."""
+
+    def __init__(self, collection, key, flush_size=DEFAULT_FLUSH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 timestamp_field=None, max_buffer=DEFAULT_MAX_BUFFER, on_written=None):
+        self.collection = collection
+        self.key = key
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.timestamp_field = timestamp_field  # Set to the server time on every write
+        self.max_buffer = max(max_buffer, flush_size)
+        self.on_written = on_written  # Called with the key values whose upserts were applied
+        self.upserted = 0
+        self.modified = 0
+        self.deleted = 0
+        self.failed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self._buffer = {}  # key value -> record or _DELETE; a later entry for the same key replaces the earlier one
+        self._backoff_until = 0.0  # No size-triggered flushes before this time.monotonic()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # One bulk_write at a time keeps writes for a key in order
+        self._stopped = threading.Event()
+        self._timer = None
+        if flush_interval:
+            self._timer = threading.Thread(target=self._flush_periodically, name=f"sink-{collection.name}",
+                                           daemon=True)
+            self._timer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def add(self, record):
+        """Buffers one record; flushes in the calling thread once the buffer is full."""
+        self._buffer_entry(record[self.key], record)
+
+    def delete(self, key_value):
+        """Buffers the deletion of the document with this key (a no-op if there is none)."""
+        self._buffer_entry(key_value, _DELETE)
+
+    def _buffer_entry(self, key_value, record):
+        with self._lock:
+            if key_value not in self._buffer and len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % self.flush_size == 0:
+                    logging.error(f"'{self.collection.name}' sink buffer is full ({self.max_buffer} keys); "
+                                  f"{self.dropped} records dropped so far.")
+                return
+            self._buffer[key_value] = record
+            full = len(self._buffer) >= self.flush_size and time.monotonic() >= self._backoff_until
+        if full:
+            self.flush()
+
+    def _operation(self, key_value, record):
+        from pymongo import DeleteOne, UpdateOne
+        if record is _DELETE:
+            return DeleteOne({self.key: key_value})
+        update = {"$set": record}
+        if self.timestamp_field:
+            update["$currentDate"] = {self.timestamp_field: True}
+        return UpdateOne({self.key: key_value}, update, upsert=True)
+
+    def flush(self):
+        """Writes the buffered records; returns the number of records sent."""
+        from pymongo.errors import BulkWriteError, PyMongoError
+
+        with self._write_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, {}
+            if not batch:
+                return 0
+
+            keys = list(batch)
+            operations = [self._operation(key_value, record) for key_value, record in batch.items()]
+            rejected = set()
+            try:
+                with profiling.span(f"sink.bulk_write.{self.collection.name}"):
+                    result = self.collection.bulk_write(operations, ordered=False)
+                self._count(result.bulk_api_result)
+            except BulkWriteError as bwe:
+                # Unordered: everything except the reported operations was applied
+                self._count(bwe.details)
+                errors = bwe.details.get("writeErrors", [])
+                self.failed += len(errors)
+                rejected = {error["index"] for error in errors}
+                for error in errors[:5]:
+                    logging.error(f"Upsert into '{self.collection.name}' failed: {error.get('errmsg')}")
+            except PyMongoError as e:
+                logging.error(f"Bulk write of {len(batch)} records into '{self.collection.name}' failed: {e}. "
+                              f"Keeping them for the next flush.")
+                with self._lock:
+                    for key_value, record in batch.items():
+                        self._buffer.setdefault(key_value, record)
+                    self._backoff_until = time.monotonic() + (self.flush_interval or DEFAULT_FLUSH_INTERVAL)
+                return 0
+            self._backoff_until = 0.0
+            self.flushes += 1
+            if self.on_written is not None:
+                self.on_written([key_value for i, key_value in enumerate(keys)
+                                 if i not in rejected and batch[key_value] is not _DELETE])
+            return len(batch)
+
+    def _count(self, result):
+        self.upserted += result.get("nUpserted", 0)
+        self.modified += result.get("nModified", 0)
+        self.deleted += result.get("nRemoved", 0)
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def close(self):
+        """Stops the flush thread and writes what is left in the buffer."""
+        self._stopped.set()
+        if self._timer is not None:
+            self._timer.join()
+        self.flush()
+        left = self.pending()
+        if left:
+            logging.error(f"{left} records could not be written to '{self.collection.name}'.")
+        if self.dropped:
+            logging.error(f"{self.dropped} records for '{self.collection.name}' were dropped on a full buffer.")
+        logging.info(f"'{self.collection.name}' sink: {self.upserted} inserted, {self.modified} updated, "
+                     f"{self.deleted} deleted, {self.failed} failed in {self.flushes} bulk writes")
@@ -0,0 +1,387 @@
+# DAG orchestrator for the pipeline stages
+#
+# Stages declare two kinds of edges:
+#   - deps:        the stage starts only after these stages completed
+#   - stream_from: the stage consumes the output of that stage through a bounded
+#                  queue while it is still running (no intermediate file)
+#
+# Stages linked by stream_from form a chain that runs as one unit: every stage of
+# the chain gets its own thread, a full queue blocks its producer (backpressure),
+# and a failure anywhere cancels the whole chain, which is then retried together.
+# Independent chains run concurrently.
+#
+# Stage status and per-chain checkpoint data are persisted to a state file after
+# every change, so an interrupted run can be resumed: completed stages are skipped
+# and chains pick up from their own checkpoint data.
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+
+# --- Configuration Section ---
+DEFAULT_QUEUE_SIZE = 8       # Items buffered between two streaming stages
+DEFAULT_RETRIES = 2          # Extra attempts after the first failure
+DEFAULT_RETRY_DELAY = 5      # Seconds before the first retry, doubled on each further retry
+POLL_INTERVAL = 0.5          # Seconds between cancellation checks while blocked on a queue
+
+# Stage statuses that let dependent stages start, or that stop them for good
+SATISFIED = ("done", "skipped")
+BLOCKED = ("failed", "cancelled", "upstream_failed")
+
+class Cancelled(Exception):
+    """Raised inside a stage when its chain was cancelled by a failure elsewhere."""
+
+class Stage:
+    """One node of the DAG: func(ctx) does the work, see StageContext."""
+
+    def __init__(self, name, func, deps=(), stream_from=None, retries=DEFAULT_RETRIES,
+                 retry_delay=DEFAULT_RETRY_DELAY, queue_size=DEFAULT_QUEUE_SIZE, no_retry=()):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.stream_from = stream_from
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # Size of the queue feeding this stage (when it streams from another stage)
+        self.queue_size = queue_size
+        # Exception types that fail the stage at once (e.g. missing files or bad config)
+        self.no_retry = tuple(no_retry)
+
+# --- Streaming ---
+_END = object()
+
+class Channel:
+    """Bounded queue between two stages of a chain, aware of chain cancellation."""
+
+    def __init__(self, maxsize, cancel_event):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._cancel = cancel_event
+        self._drained = False
+        self.put_wait = 0.0  # Seconds the producer spent blocked on a full queue
+        self.get_wait = 0.0  # Seconds the consumer spent waiting on an empty queue
+
+    def put(self, item):
+        started = time.perf_counter()
+        while True:
+            if self._cancel.is_set():
+                raise Cancelled()
+            try:
+                self._queue.put(item, timeout=POLL_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        self.put_wait += time.perf_counter() - started
+
+    def close(self):
+        self.put(_END)
+
+    def __iter__(self):
+        while not self._drained:
+            started = time.perf_counter()
+            while True:
+                if self._cancel.is_set():
+                    raise Cancelled()
+                try:
+                    item = self._queue.get(timeout=POLL_INTERVAL)
+                    break
+                except queue.Empty:
+                    continue
+            self.get_wait += time.perf_counter() - started
+            if item is _END:
+                self._drained = True
+                return
+            yield item
+
+class StageContext:
+    """What a stage function sees: its input stream, its output, checkpoint data and counters."""
+
+    def __init__(self, stage, orchestrator, data, inbox=None, outbox=None):
+        self.stage = stage
+        self.name = stage.name
+        self._orchestrator = orchestrator
+        self.run_id = orchestrator.state["run_id"]
+        # Checkpoint data shared by every stage of the chain, persisted in the state file;
+        # change it while holding self.lock, since the state file is written from several threads
+        self.data = data
+        self.lock = orchestrator._state_lock
+        self.inbox = inbox
+        self.outbox = outbox
+        self.items_in = 0
+        self.items_out = 0
+        # Free-form counters shown in the report (rows, bytes, ...)
+        self.stats = {}
+        self.error = None
+        self.seconds = 0.0
+        self.cancel_event = None
+
+    def __iter__(self):
+        """Iterates over the items streamed by the upstream stage."""
+        if self.inbox is None:
+            return
+        for item in self.inbox:
+            self.items_in += 1
+            yield item
+
+    def emit(self, item):
+        """Streams an item to the downstream stage (blocks while its queue is full)."""
+        if self.outbox is not None:
+            self.outbox.put(item)
+        self.items_out += 1
+
+    def count(self, key, n=1):
+        self.stats[key] = self.stats.get(key, 0) + n
+
+    def checkpoint(self):
+        """Persists the chain's checkpoint data (self.data) to the state file."""
+        self._orchestrator.save_state()
+
+# --- Orchestrator ---
+class Orchestrator:
+    """Runs a DAG of stages with concurrency, bounded streaming, retries and resumability."""
+
+    def __init__(self, stages, state_path, skip=(), max_parallel=None):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = state_path
+        self.skip = set(skip)
+        self.max_parallel = max_parallel
+        self.state = None
+        self._state_lock = threading.RLock()
+        self._validate()
+        self.chains = self._build_chains()
+        # A chain streams end to end, so skipping one of its stages skips all of them
+        for chain in self.chains:
+            if self.skip & set(chain):
+                self.skip |= set(chain)
+
+    def _validate(self):
+        consumers = {}
+        for stage in self.stages.values():
+            for upstream in stage.deps + ([stage.stream_from] if stage.stream_from else []):
+                if upstream not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{upstream}'")
+            if stage.stream_from:
+                if stage.stream_from in consumers:
+                    raise ValueError(f"Stage '{stage.stream_from}' streams to both "
+                                     f"'{consumers[stage.stream_from]}' and '{stage.name}'")
+                consumers[stage.stream_from] = stage.name
+        unknown = self.skip - set(self.stages)
+        if unknown:
+            raise ValueError(f"Cannot skip unknown stages: {sorted(unknown)}")
+
+    def _build_chains(self):
+        """Groups streaming stages into chains (head first), in dependency order."""
+        downstream = {s.stream_from: s.name for s in self.stages.values() if s.stream_from}
+        chains = []
+        for stage in self.stages.values():
+            if stage.stream_from:
+                continue
+            chain = [stage.name]
+            while chain[-1] in downstream:
+                chain.append(downstream[chain[-1]])
+            chains.append(chain)
+        if sum(len(chain) for chain in chains) != len(self.stages):
+            raise ValueError("The stream_from edges contain a cycle")
+
+        # Topological order over chains (deps of any member point at other chains)
+        chain_of = {name: i for i, chain in enumerate(chains) for name in chain}
+        ordered, placed = [], set()
+        while len(ordered) < len(chains):
+            progress = False
+            for i, chain in enumerate(chains):
+                if i in placed:
+                    continue
+                needs = {chain_of[d] for name in chain for d in self.stages[name].deps} - {i}
+                if needs <= placed:
+                    ordered.append(chain)
+                    placed.add(i)
+                    progress = True
+            if not progress:
+                raise ValueError("The stage graph contains a cycle")
+        return ordered
+
+    def chain_deps(self, chain):
+        return sorted({d for name in chain for d in self.stages[name].deps} - set(chain))
+
+    # --- State ---
+    def load_state(self, resume):
+        """Starts a new run, or continues the unfinished run recorded in the state file."""
+        if resume and os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+            logging.info(f"Resuming run {self.state['run_id']} from {self.state_path}")
+        else:
+            run_id = datetime.now().strftime("%Y-%m-%d-%H%M%S")
+            self.state = {"run_id": run_id, "started_at": datetime.now().isoformat(),
+                          "stages": {}, "data": {}}
+        for name in self.stages:
+            record = self.state["stages"].setdefault(name, {"status": "pending", "attempts": 0})
+            if record["status"] != "done":
+                record["status"] = "skipped" if name in self.skip else "pending"
+        self.save_state()
+        return self.state["run_id"]
+
+    def save_state(self):
+        with self._state_lock:
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=4, default=str)
+            os.replace(tmp_path, self.state_path)
+
+    def status(self, name):
+        return self.state["stages"][name]["status"]
+
+    def _set_status(self, names, status, **fields):
+        with self._state_lock:
+            for name in names:
+                self.state["stages"][name]["status"] = status
+                self.state["stages"][name].update(fields)
+            self.save_state()
+
+    # --- Execution ---
+    def run(self, resume=False):
+        """Runs every pending chain as soon as its dependencies are satisfied; returns True if all succeeded."""
+        run_id = self.load_state(resume)
+        started = time.perf_counter()
+        pending = [chain for chain in self.chains
+                   if not all(self.status(name) in SATISFIED for name in chain)]
+        logging.info(f"Run {run_id}: {len(pending)} of {len(self.chains)} stage chains to run")
+
+        with ThreadPoolExecutor(max_workers=self.max_parallel or max(len(pending), 1)) as executor:
+            running = {}
+            while pending or running:
+                for chain in list(pending):
+                    deps = [self.status(d) for d in self.chain_deps(chain)]
+                    if any(s in BLOCKED for s in deps):
+                        pending.remove(chain)
+                        self._set_status(chain, "upstream_failed")
+                        logging.warning(f"Not running {chain}: an upstream stage failed")
+                    elif all(s in SATISFIED for s in deps):
+                        pending.remove(chain)
+                        running[executor.submit(self._run_chain, chain)] = chain
+                if not running:
+                    # Nothing can finish that would unblock the rest: their dependencies
+                    # are stuck in a state that is neither satisfied nor blocked
+                    for chain in pending:
+                        stuck = {d: self.status(d) for d in self.chain_deps(chain)
+                                 if self.status(d) not in SATISFIED}
+                        self._set_status(chain, "upstream_failed")
+                        logging.warning(f"Not running {chain}: dependencies never completed {stuck}")
+                    pending = []
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    running.pop(future)
+                    future.result()
+
+        self.state["finished_at"] = datetime.now().isoformat()
+        self.state["seconds"] = round(time.perf_counter() - started, 3)
+        self.save_state()
+        return all(self.status(name) in SATISFIED for name in self.stages)
+
+    def _run_chain(self, chain):
+        """Runs one chain to completion, retrying it as a unit."""
+        stages = [self.stages[name] for name in chain]
+        with self._state_lock:
+            data = self.state["data"].setdefault(chain[0], {})
+        max_attempts = max(stage.retries for stage in stages) + 1
+        retry_delay = max(stage.retry_delay for stage in stages)
+
+        for attempt in range(1, max_attempts + 1):
+            contexts = self._make_contexts(stages, data)
+            self._set_status(chain, "running", started_at=datetime.now().isoformat())
+            attempt_started = time.perf_counter()
+
+            threads = [threading.Thread(target=self._run_stage, args=(ctx,), name=f"stage-{ctx.name}")
+                       for ctx in contexts]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            seconds = time.perf_counter() - attempt_started
+            errors = [ctx for ctx in contexts if ctx.error is not None]
+            with self._state_lock:
+                for ctx in contexts:
+                    record = self.state["stages"][ctx.name]
+                    record["attempts"] = record.get("attempts", 0) + 1
+                    record["seconds"] = round(record.get("seconds", 0) + ctx.seconds, 3)
+                    record.update(items_in=ctx.items_in, items_out=ctx.items_out, stats=ctx.stats,
+                                  wait_in=round(ctx.inbox.get_wait, 3) if ctx.inbox else 0.0,
+                                  wait_out=round(ctx.outbox.put_wait, 3) if ctx.outbox else 0.0)
+            if not errors:
+                self._set_status(chain, "done", finished_at=datetime.now().isoformat())
+                logging.info(f"✅ {' -> '.join(chain)} done in {seconds:.1f}s")
+                return
+
+            failed = errors[0]
+            retryable = not isinstance(failed.error, failed.stage.no_retry)
+            if attempt == max_attempts or not retryable:
+                self._set_status([ctx.name for ctx in errors], "failed", error=repr(failed.error))
+                self._set_status([ctx.name for ctx in contexts if ctx.error is None], "cancelled")
+                logging.error(f"❌ {' -> '.join(chain)} failed after {attempt} attempt(s): {failed.error!r}")
+                return
+
+            delay = retry_delay * 2 ** (attempt - 1)
+            logging.warning(f"Stage '{failed.name}' failed ({failed.error!r}); "
+                            f"retrying {' -> '.join(chain)} in {delay}s (attempt {attempt + 1}/{max_attempts})")
+            time.sleep(delay)
+
+    def _make_contexts(self, stages, data):
+        cancel_event = threading.Event()
+        contexts = []
+        for i, stage in enumerate(stages):
+            inbox = contexts[-1].outbox if i > 0 else None
+            outbox = (Channel(stages[i + 1].queue_size, cancel_event)
+                      if i + 1 < len(stages) else None)
+            ctx = StageContext(stage, self, data, inbox=inbox, outbox=outbox)
+            ctx.cancel_event = cancel_event
+            contexts.append(ctx)
+        return contexts
+
+    def _run_stage(self, ctx):
+        started = time.perf_counter()
+        try:
+            ctx.stage.func(ctx)
+            # A stage that ignores part of its input must not leave its producer blocked
+            for _ in ctx:
+                pass
+            if ctx.outbox is not None:
+                ctx.outbox.close()
+        except Cancelled:
+            pass
+        except Exception as e:
+            ctx.error = e
+            ctx.cancel_event.set()
+            logging.error(f"Stage '{ctx.name}' raised {e!r}\n{traceback.format_exc()}")
+        finally:
+            ctx.seconds = time.perf_counter() - started
+
+    # --- Reporting ---
+    def report(self):
+        """Per-stage timing report for this run."""
+        return {
+            "run_id": self.state["run_id"],
+            "started_at": self.state.get("started_at"),
+            "finished_at": self.state.get("finished_at"),
+            "seconds": self.state.get("seconds"),
+            "stages": {name: self.state["stages"][name] for name in self.stages},
+        }
+
+def format_report(report):
+    """Renders the timing report as a text table."""
+    header = f"{'stage':<32} {'status':<16} {'tries':>5} {'seconds':>9} {'in':>8} {'out':>8} " \
+             f"{'starved':>8} {'blocked':>8}  stats"
+    lines = [f"Run {report['run_id']} ({report['seconds']}s)", header, "-" * len(header)]
+    for name, record in report["stages"].items():
+        stats = ", ".join(f"{k}={v}" for k, v in record.get("stats", {}).items())
+        lines.append(f"{name:<32} {record['status']:<16} {record.get('attempts', 0):>5} "
+                     f"{record.get('seconds', 0):>9.2f} {record.get('items_in', 0):>8} "
+                     f"{record.get('items_out', 0):>8} {record.get('wait_in', 0):>8.2f} "
+                     f"{record.get('wait_out', 0):>8.2f}  {stats}")
+    return "\n".join(lines)
@@ -0,0 +1,223 @@
+import json
+import logging
+from collections import Counter
+from datetime import datetime, date, timezone
+
+import profiling
+
+# --- Configuration Section ---
+PARQUET_BATCH_SIZE = 10000          # Documents converted per Arrow record batch
+PARQUET_ROW_GROUP_SIZE = 100000     # Rows per Parquet row group (BigQuery reads row groups in parallel)
+PARQUET_COMPRESSION = "snappy"
+
+# --- Schema Helpers ---
+def load_bigquery_schema(schema_path):
+    """Loads a BigQuery JSON schema file (list of field definitions)."""
+    with open(schema_path, "r", encoding="utf-8") as schema_file:
+        schema = json.load(schema_file)
+    # Accept both a bare field list and {"fields": [...]}
+    if isinstance(schema, dict):
+        schema = schema.get("fields", [])
+    return schema
+
+def extend_schema(bq_schema, extra_fields):
+    """Returns bq_schema with the fields of extra_fields it does not already define appended."""
+    if not extra_fields:
+        return bq_schema
+    names = {field["name"] for field in bq_schema}
+    return list(bq_schema) + [field for field in extra_fields if field["name"] not in names]
+
+def _arrow_type(field):
+    """Maps a BigQuery field definition to an Arrow data type (without REPEATED)."""
+    import pyarrow as pa
+
+    field_type = field.get("type", "STRING").upper()
+    if field_type in ("RECORD", "STRUCT"):
+        return pa.struct([bigquery_field_to_arrow(f) for f in field.get("fields", [])])
+    if field_type in ("INTEGER", "INT64"):
+        return pa.int64()
+    if field_type in ("FLOAT", "FLOAT64"):
+        return pa.float64()
+    if field_type in ("BOOLEAN", "BOOL"):
+        return pa.bool_()
+    if field_type == "TIMESTAMP":
+        return pa.timestamp("us", tz="UTC")
+    if field_type == "DATETIME":
+        return pa.timestamp("us")
+    if field_type == "DATE":
+        return pa.date32()
+    if field_type in ("NUMERIC", "BIGNUMERIC"):
+        return pa.decimal128(38, 9)
+    if field_type == "BYTES":
+        return pa.binary()
+    # STRING, JSON and anything unknown are written as UTF-8 strings
+    return pa.string()
+
+def bigquery_field_to_arrow(field):
+    """Converts one BigQuery field definition to an Arrow field."""
+    import pyarrow as pa
+
+    mode = field.get("mode", "NULLABLE").upper()
+    data_type = _arrow_type(field)
+    if mode == "REPEATED":
+        return pa.field(field["name"], pa.list_(data_type))
+    return pa.field(field["name"], data_type, nullable=(mode != "REQUIRED"))
+
+def bigquery_schema_to_arrow(bq_schema):
+    """Converts a BigQuery JSON schema (list of fields) to an Arrow schema."""
+    import pyarrow as pa
+
+    return pa.schema([bigquery_field_to_arrow(f) for f in bq_schema])
+
+# --- Value Coercion ---
+def _coerce_scalar(value, field_type):
+    """Coerces a scalar value to the Python type Arrow expects for field_type, or None."""
+    if value is None:
+        return None
+    if field_type in ("RECORD", "STRUCT"):
+        return value if isinstance(value, dict) else None
+    if field_type in ("INTEGER", "INT64"):
+        if isinstance(value, bool):
+            return int(value)
+        if isinstance(value, int):
+            return value
+        if isinstance(value, float):
+            return int(value) if value.is_integer() else None
+        if isinstance(value, str):
+            try:
+                return int(value)
+            except ValueError:
+                return None
+        return None
+    if field_type in ("FLOAT", "FLOAT64"):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        if isinstance(value, str):
+            try:
+                return float(value)
+            except ValueError:
+                return None
+        return None
+    if field_type in ("BOOLEAN", "BOOL"):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            return value.lower() == "true"
+        return None
+    if field_type in ("TIMESTAMP", "DATETIME"):
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return datetime.fromtimestamp(value, tz=timezone.utc)
+        if isinstance(value, str):
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                return None
+        return None
+    if field_type == "DATE":
+        if isinstance(value, datetime):
+            return value.date()
+        if isinstance(value, date):
+            return value
+        if isinstance(value, str):
+            try:
+                return date.fromisoformat(value)
+            except ValueError:
+                return None
+        return None
+    # STRING / JSON / unknown: objects and arrays are kept as their JSON text
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+def coerce_value(value, field, dropped=None, path=None):
+    """Coerces a document value so that it conforms to a BigQuery field definition."""
+    field_type = field.get("type", "STRING").upper()
+    mode = field.get("mode", "NULLABLE").upper()
+    path = path or field["name"]
+
+    if mode == "REPEATED":
+        if value is None or value == "":
+            return []
+        if not isinstance(value, list):
+            value = [value]
+        items = [_coerce_field(v, field, field_type, dropped, path) for v in value]
+        return [item for item in items if item is not None]
+
+    return _coerce_field(value, field, field_type, dropped, path)
+
+def _coerce_field(value, field, field_type, dropped=None, path=None):
+    """Coerces a single (non-repeated) value, recursing into RECORD fields."""
+    if field_type in ("RECORD", "STRUCT"):
+        if value is None:
+            return None
+        if not isinstance(value, dict):
+            if dropped is not None:
+                dropped[path] += 1
+            return None
+        return coerce_row(value, field.get("fields", []), dropped, prefix=f"{path}.")
+    return _coerce_scalar(value, field_type)
+
+def coerce_row(doc, bq_fields, dropped=None, prefix=""):
+    """Projects a document onto the schema fields, coercing every value.
+
+    RECORD values that are not objects are written as null; when dropped (a Counter)
+    is given, they are counted in it by field path.
+    """
+    return {f["name"]: coerce_value(doc.get(f["name"]), f, dropped, prefix + f["name"]) for f in bq_fields}
+
+# --- Writer ---
+def write_to_parquet(docs, file_path, schema_path,
+                     batch_size=PARQUET_BATCH_SIZE,
+                     row_group_size=PARQUET_ROW_GROUP_SIZE,
+                     compression=PARQUET_COMPRESSION,
+                     extra_fields=None):
+    """Writes (already transformed) documents to a Parquet file using a BigQuery JSON schema."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    bq_schema = extend_schema(load_bigquery_schema(schema_path), extra_fields)
+    arrow_schema = bigquery_schema_to_arrow(bq_schema)
+
+    coerce = profiling.wrap("export.parquet_coerce", coerce_row)
+    dropped = Counter()  # RECORD values that were not objects, by field path
+    to_batch = profiling.wrap("export.arrow_batch", pa.RecordBatch.from_pylist)
+    total_rows = 0
+    rows = []
+    pending_batches = []
+    pending_rows = 0
+
+    with pq.ParquetWriter(file_path, arrow_schema, compression=compression) as writer:
+        def flush_row_group():
+            nonlocal pending_batches, pending_rows
+            if pending_batches:
+                table = pa.Table.from_batches(pending_batches, schema=arrow_schema)
+                with profiling.span("export.parquet_write"):
+                    writer.write_table(table, row_group_size=row_group_size)
+                pending_batches = []
+                pending_rows = 0
+
+        for doc in docs:
+            rows.append(coerce(doc, bq_schema, dropped))
+            if len(rows) >= batch_size:
+                pending_batches.append(to_batch(rows, schema=arrow_schema))
+                pending_rows += len(rows)
+                total_rows += len(rows)
+                rows = []
+                if pending_rows >= row_group_size:
+                    flush_row_group()
+
+        if rows:
+            pending_batches.append(to_batch(rows, schema=arrow_schema))
+            total_rows += len(rows)
+        flush_row_group()
+
+    logging.info(f"Wrote {total_rows} rows to Parquet file {file_path}")
+    if dropped:
+        # --validate quarantines these rows (record_not_object) instead of nulling the field
+        logging.warning(f"Wrote null for {sum(dropped.values())} RECORD values that were not objects: "
+                        f"{dict(dropped.most_common())}")
+    return total_rows
@@ -0,0 +1,122 @@
+# Storage and warehouse sinks used by the pipeline orchestrator (run_pipeline.py)
+#
+# Storage sinks take a local file and store it as an object; warehouse sinks load
+# a stored object into the table its name routes to (bigquery_loader.TABLE_REGISTRY).
+# The filesystem sinks mirror the GCS / BigQuery behaviour closely enough to run
+# the whole pipeline on one machine:
+#   - LocalStorage keeps objects under <root>/<bucket>/<object name>
+#   - LocalWarehouse keeps each table as a directory of loaded files and, like
+#     BigQuery, ignores a load whose job ID was already used (WRITE_TRUNCATE
+#     tables are emptied before the load)
+
+import json
+import logging
+import os
+import shutil
+import threading
+
+# --- Storage sinks ---
+class GCSStorage:
+    """Stores files in Google Cloud Storage."""
+
+    def __init__(self):
+        self._client = None
+
+    def store(self, local_path, bucket_name, object_name):
+        """Uploads a file; returns (uri, generation)."""
+        if self._client is None:
+            from google.cloud import storage
+            self._client = storage.Client()
+        blob = self._client.bucket(bucket_name).blob(object_name)
+        blob.upload_from_filename(local_path)
+        logging.info(f"Uploaded {local_path} to gs://{bucket_name}/{object_name}")
+        return f"gs://{bucket_name}/{object_name}", blob.generation
+
+class LocalStorage:
+    """Stores files in a directory laid out like a bucket."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def store(self, local_path, bucket_name, object_name):
+        """Copies a file into <root>/<bucket>/<object>; returns (path, generation)."""
+        destination = os.path.join(self.root, bucket_name, object_name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(local_path, destination)
+        logging.info(f"Stored {local_path} as {destination}")
+        return destination, os.stat(destination).st_mtime_ns
+
+# --- Warehouse sinks ---
+def _resolve(object_name):
+    """TABLE_REGISTRY entry for an object name; raises for objects no table is routed to."""
+    from bigquery_loader import resolve_target
+    target = resolve_target(object_name)
+    if target is None:
+        raise ValueError(f"No target table is registered for object '{object_name}'")
+    return target
+
+class BigQueryWarehouse:
+    """Loads GCS objects into BigQuery with the same job IDs as the bigquery_load function."""
+
+    def load(self, uri, object_name, generation):
+        """Loads one object; returns the number of rows loaded."""
+        from bigquery_loader import get_bigquery_client, load_uris, DEFAULT_WRITE_DISPOSITION
+        target = _resolve(object_name)
+        # Salting with the generation gives the job ID the per-object trigger would use,
+        # so whichever of the two runs second is rejected instead of loading twice
+        jobs = load_uris(get_bigquery_client(), target["table_id"], target["schema_path"],
+                         [uri], salt=str(generation),
+                         write_disposition=target.get("write_disposition", DEFAULT_WRITE_DISPOSITION))
+        return sum(job.output_rows or 0 for job in jobs)
+
+class LocalWarehouse:
+    """Keeps every table as a directory of loaded files, with BigQuery-like job ID deduplication."""
+
+    def __init__(self, root):
+        self.root = root
+        self.jobs_path = os.path.join(root, "_load_jobs.json")
+        self._lock = threading.Lock()
+
+    def _read_jobs(self):
+        if not os.path.exists(self.jobs_path):
+            return {}
+        with open(self.jobs_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(self, uri, object_name, generation):
+        """Loads one object; returns the number of rows loaded (0 when the job ID was already used)."""
+        from bigquery_loader import load_job_id
+        target = _resolve(object_name)
+        table_id = target["table_id"]
+        job_id = load_job_id(table_id, [uri], str(generation))
+
+        with self._lock:
+            jobs = self._read_jobs()
+            if job_id in jobs:
+                logging.info(f"Load job {job_id} already exists. Not loading {uri} again.")
+                return 0
+
+            table_dir = os.path.join(self.root, table_id)
+            if target.get("write_disposition") == "WRITE_TRUNCATE":
+                shutil.rmtree(table_dir, ignore_errors=True)
+            os.makedirs(table_dir, exist_ok=True)
+            shutil.copyfile(uri, os.path.join(table_dir, os.path.basename(object_name)))
+            rows = count_rows(uri)
+
+            jobs[job_id] = {"table_id": table_id, "uri": uri, "rows": rows}
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = f"{self.jobs_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(jobs, f, indent=4)
+            os.replace(tmp_path, self.jobs_path)
+
+        logging.info(f"Load job {job_id} done: {rows} rows into {table_id}")
+        return rows
+
+def count_rows(path):
+    """Number of rows in a JSONL or Parquet file."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        return pq.read_metadata(path).num_rows
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
@@ -1,43 +1,20 @@
 # IP Location Processing Script - Optimized with Resumption
 
 import pymongo
-import IP2Location
 import os
 import logging
 import json
-import configparser
 from datetime import datetime
 
+import profiling
+import runtime
+
+# IP2Location is only needed once lookups start
+IP2Location = runtime.lazy_import("IP2Location")
+
 # --- Set up logging for better tracking and error reporting ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# --- Load configuration from INI file ---
-def load_config(filename='config.ini'):
-    """Loads configuration from the specified INI file."""
-    config = configparser.ConfigParser()
-    if not os.path.exists(filename):
-        logging.error(f"Configuration file '{filename}' not found. Please create it.")
-        raise FileNotFoundError(f"Configuration file '{filename}' not found.")
-    config.read(filename)
-    return config
-
-# Load the config at the start of the script
-try:
-    config = load_config()
-except FileNotFoundError:
-    exit()
-
-# Extract config values
-MONGO_URI = config['mongodb']['mongo_uri']
-DB_NAME = config['mongodb']['db_name']
-SOURCE_COLLECTION_NAME = config['mongodb']['source_collection_name']
-TARGET_COLLECTION_NAME = config['mongodb']['target_collection_name']
-
-IP2LOCATION_DB_PATH = config['ip2location']['ip2location_db_path']
-
-BATCH_SIZE = int(config['script_logic']['batch_size'])
-UNIQUE_IPS_FILE = config['script_logic']['unique_ips_file']
-
 # --- Main function to process IP data ---
 def process_ip_locations():
     """
@@ -47,10 +24,22 @@ def process_ip_locations():
     """
     logging.info("Starting IP location processing...")
 
-    # 1. Connect to MongoDB
+    # Load the config (validated once per process by runtime.py)
     try:
-        client = pymongo.MongoClient(MONGO_URI)
-        db = client[DB_NAME]
+        config = runtime.load_config()
+    except (FileNotFoundError, ValueError) as e:
+        logging.error(e)
+        return
+
+    SOURCE_COLLECTION_NAME = config['mongodb']['summary_collection']
+    TARGET_COLLECTION_NAME = config['mongodb']['location_collection']
+    IP2LOCATION_DB_PATH = runtime.resolve_path(config['ip2location']['ip2location_db_path'])
+    BATCH_SIZE = int(config['script_logic']['batch_size'])
+    UNIQUE_IPS_FILE = runtime.resolve_path(config['script_logic']['unique_ips_file'])
+
+    # 1. Connect to MongoDB (shared pooled client)
+    try:
+        db = runtime.get_database()
         source_collection = db[SOURCE_COLLECTION_NAME]
         target_collection = db[TARGET_COLLECTION_NAME]
         logging.info("Successfully connected to MongoDB.")
@@ -61,7 +50,7 @@ def process_ip_locations():
     # Check if the source collection exists and has data using find_one()
     if not source_collection.find_one({}):
         logging.error(f"Source collection '{SOURCE_COLLECTION_NAME}' is empty or does not exist. Exiting.")
-        client.close()
+        runtime.close_mongo_client()
         return
 
     # 2. Get unique IPs from file or from MongoDB
@@ -83,15 +72,15 @@ def process_ip_locations():
                 {"$project": {"ip": "$_id", "_id": 0}}
             ]
             unique_ips_cursor = source_collection.aggregate(pipeline, allowDiskUse=True)
-            unique_ips = [doc['ip'] for doc in unique_ips_cursor]
+            unique_ips = [doc['ip'] for doc in profiling.timed_iter("ip.unique_ips_aggregate", unique_ips_cursor)]
             
-            with open(UNIQUE_IPS_FILE, 'w') as f:
+            with profiling.span("ip.save_unique_ips"), open(UNIQUE_IPS_FILE, 'w') as f:
                 json.dump(unique_ips, f)
             
             logging.info(f"Successfully extracted and saved {len(unique_ips)} IPs to '{UNIQUE_IPS_FILE}'.")
         except Exception as e:
             logging.error(f"Error extracting unique IPs with aggregation: {e}")
-            client.close()
+            runtime.close_mongo_client()
             return
 
     # 3. Use IP2Location to get location data and process in batches
@@ -100,14 +89,14 @@ def process_ip_locations():
         logging.info(f"Successfully loaded IP2Location database file: {IP2LOCATION_DB_PATH}")
     except FileNotFoundError:
         logging.error(f"IP2Location database file not found at '{IP2LOCATION_DB_PATH}'. Please ensure the file is in the correct path.")
-        client.close()
+        runtime.close_mongo_client()
         return
 
     # Get a list of IPs already processed to resume from where we left off
     logging.info("Checking for already processed IPs in the target collection...")
     try:
         processed_ips_cursor = target_collection.find({}, {"ip": 1, "_id": 0})
-        processed_ips = {doc['ip'] for doc in processed_ips_cursor}
+        processed_ips = {doc['ip'] for doc in profiling.timed_iter("ip.processed_ips_cursor", processed_ips_cursor)}
         logging.info(f"Found {len(processed_ips)} IPs already processed.")
     except Exception as e:
         logging.error(f"Error fetching processed IPs: {e}")
@@ -119,12 +108,13 @@ def process_ip_locations():
     
     location_data_batch = []
     processed_count = len(processed_ips)
+    get_all = profiling.wrap("ip.ip2location_lookup", ip_db.get_all)
     batch_count = 0
     
     for ip in ips_to_process:
         if ip:
             try:
-                record = ip_db.get_all(ip)
+                record = get_all(ip)
                 if record:
                     location_entry = {
                         "ip": ip,
@@ -142,7 +132,8 @@ def process_ip_locations():
         batch_count += 1
         if batch_count >= BATCH_SIZE:
             try:
-                target_collection.insert_many(location_data_batch)
+                with profiling.span("ip.insert_batch"):
+                    target_collection.insert_many(location_data_batch)
                 processed_count += len(location_data_batch)
                 logging.info(f"Successfully inserted a batch of {len(location_data_batch)} records. Total processed: {processed_count}")
             except pymongo.errors.BulkWriteError as bwe:
@@ -154,7 +145,8 @@ def process_ip_locations():
     if location_data_batch:
         logging.info(f"Inserting final batch of {len(location_data_batch)} records.")
         try:
-            target_collection.insert_many(location_data_batch)
+            with profiling.span("ip.insert_batch"):
+                target_collection.insert_many(location_data_batch)
             processed_count += len(location_data_batch)
             logging.info(f"Successfully inserted final batch. Total processed: {processed_count}")
         except pymongo.errors.BulkWriteError as bwe:
@@ -163,16 +155,24 @@ def process_ip_locations():
     # Create an index on the 'ip' field for faster lookups (do this only once)
     logging.info("Creating index on 'ip' field if it doesn't exist...")
     try:
-        target_collection.create_index("ip", unique=True)
+        with profiling.span("ip.create_index"):
+            target_collection.create_index("ip", unique=True)
         logging.info("Index created successfully.")
     except pymongo.errors.OperationFailure as e:
         logging.warning(f"Index creation failed, possibly because it already exists: {e}")
     except Exception as e:
         logging.error(f"An unexpected error occurred during index creation: {e}")
 
-    client.close()
+    runtime.close_mongo_client()
     logging.info("Processing complete. MongoDB connection closed.")
 
 # --- Script entry point ---
 if __name__ == "__main__":
-    process_ip_locations()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Resolve the geolocation of every IP in the summary collection.")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.configure(args.profile)
+    with profiling.session("process_ip_location"):
+        process_ip_locations()
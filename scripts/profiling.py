@@ -0,0 +1,269 @@
+# Profiling and timing spans shared by the crawler, the IP processor and the exporters
+#
+# Off by default. Enable it with --profile MODES on a script (or on glamira.py),
+# or with GLAMIRA_PROFILE=MODES, where MODES is a comma-separated list of
+#   spans         named timing spans, summarised per run (implied by every mode)
+#   cprofile      cProfile of the main thread (.prof file + top functions)
+#   pyinstrument  sampling profile as HTML (needs the pyinstrument package)
+#   tracemalloc   top allocation sites and peak traced memory
+# or "all". Reports are written next to the logs ([script_logic] log_file directory).
+#
+# When profiling is disabled, span() returns a shared no-op context manager and
+# wrap() / timed_iter() return the function / iterable unchanged, so hot loops
+# run exactly the code they would run without instrumentation.
+
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+# --- Configuration Section ---
+ENV_VAR = "GLAMIRA_PROFILE"
+MODES = ("spans", "cprofile", "pyinstrument", "tracemalloc")
+DEFAULT_OUTPUT_DIR = "../logs"
+CPROFILE_TOP = 40        # Functions listed in the text report (by cumulative time)
+TRACEMALLOC_TOP = 25     # Allocation sites listed in the text report
+TRACEMALLOC_FRAMES = 1
+
+enabled = False
+_modes = frozenset()
+_stats = {}  # span name -> [calls, total seconds, longest call]
+_lock = threading.Lock()
+
+# --- Switches ---
+def parse_modes(value):
+    """Parses a MODES string ("", "1", "all", "spans,tracemalloc", ...) into a set of modes."""
+    if not value:
+        return frozenset()
+    requested = {part.strip().lower() for part in value.split(",") if part.strip()}
+    if requested & {"1", "true", "yes", "all"}:
+        return frozenset(MODES)
+    unknown = requested - set(MODES)
+    if unknown:
+        raise ValueError(f"Unknown profiling mode(s) {sorted(unknown)}; choose from {', '.join(MODES)} or all")
+    return frozenset(requested | {"spans"})
+
+def configure(modes=None):
+    """Turns profiling on or off for this process (modes=None reads $GLAMIRA_PROFILE)."""
+    global enabled, _modes
+    _modes = parse_modes(os.environ.get(ENV_VAR) if modes is None else modes)
+    enabled = bool(_modes)
+    return enabled
+
+def add_argument(parser):
+    """Adds the --profile option to a script's argument parser."""
+    parser.add_argument("--profile", metavar="MODES",
+                        help=f"Profile this run: {','.join(MODES)} or all (default: ${ENV_VAR})")
+
+# --- Spans ---
+def record(name, seconds, calls=1, longest=None):
+    """Adds measured time to a named span."""
+    with _lock:
+        entry = _stats.get(name)
+        if entry is None:
+            _stats[name] = [calls, seconds, seconds if longest is None else longest]
+        else:
+            entry[0] += calls
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds if longest is None else longest)
+
+class _Span:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.started)
+        return False
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def span(name):
+    """Context manager timing the enclosed block under name (no-op when disabled)."""
+    return _Span(name) if enabled else _NO_SPAN
+
+def wrap(name, func):
+    """Returns func timed under name, or func itself when disabled."""
+    if not enabled or func is None:
+        return func
+
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter() - started)
+    return timed
+
+def timed_iter(name, iterable):
+    """Returns iterable with the time spent producing each item timed under name (unchanged when disabled)."""
+    if not enabled:
+        return iterable
+    return _timed_iter(name, iterable)
+
+def _timed_iter(name, iterable):
+    iterator = iter(iterable)
+    calls, total, longest = 0, 0.0, 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                total += time.perf_counter() - started
+                break
+            elapsed = time.perf_counter() - started
+            calls += 1
+            total += elapsed
+            if elapsed > longest:
+                longest = elapsed
+            yield item
+    finally:
+        # Aggregated locally and recorded once, so the lock is not taken per item
+        record(name, total, calls, longest)
+
+# --- Reports ---
+def output_dir():
+    """Directory of the configured log file, or DEFAULT_OUTPUT_DIR."""
+    try:
+        import runtime
+        return os.path.dirname(runtime.resolve_path(runtime.load_config()["script_logic"]["log_file"]))
+    except (FileNotFoundError, ValueError, KeyError):
+        return DEFAULT_OUTPUT_DIR
+
+def span_summary(wall_seconds):
+    """Spans sorted by total time, as a list of dicts."""
+    with _lock:
+        items = sorted(_stats.items(), key=lambda item: item[1][1], reverse=True)
+    return [{
+        "span": name,
+        "calls": calls,
+        "total_s": round(total, 4),
+        "share_of_run": round(total / wall_seconds, 4) if wall_seconds else None,
+        "mean_ms": round(total / calls * 1000, 4) if calls else None,
+        "max_ms": round(longest * 1000, 4),
+    } for name, (calls, total, longest) in items]
+
+def format_summary(run_name, wall_seconds, rows):
+    """Renders the per-run span summary table."""
+    header = f"{'span':<36} {'calls':>10} {'total s':>10} {'% run':>7} {'mean ms':>10} {'max ms':>10}"
+    lines = [f"Profile of {run_name}: {wall_seconds:.2f}s wall", header, "-" * len(header)]
+    for row in rows:
+        share = f"{row['share_of_run'] * 100:.1f}" if row["share_of_run"] is not None else "-"
+        mean = f"{row['mean_ms']:.3f}" if row["mean_ms"] is not None else "-"
+        lines.append(f"{row['span']:<36} {row['calls']:>10,} {row['total_s']:>10.3f} {share:>7} "
+                     f"{mean:>10} {row['max_ms']:>10.3f}")
+    lines.append("(spans can nest or run in parallel threads, so shares do not add up to 100%)")
+    return "\n".join(lines)
+
+@contextlib.contextmanager
+def session(run_name, directory=None):
+    """Profiles the enclosed block when profiling is enabled and writes the reports on exit."""
+    if not enabled:
+        yield
+        return
+
+    with _lock:
+        _stats.clear()
+    profiler = sampler = None
+    if "cprofile" in _modes:
+        import cProfile
+        profiler = cProfile.Profile()
+    if "pyinstrument" in _modes:
+        try:
+            from pyinstrument import Profiler
+            sampler = Profiler()
+        except ImportError:
+            logging.warning("pyinstrument is not installed; skipping the pyinstrument profile.")
+    if "tracemalloc" in _modes:
+        import tracemalloc
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+
+    if sampler is not None:
+        sampler.start()
+    if profiler is not None:
+        profiler.enable()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall_seconds = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+        if sampler is not None:
+            sampler.stop()
+        _write_reports(run_name, directory or output_dir(), wall_seconds, profiler, sampler)
+
+def _write_reports(run_name, directory, wall_seconds, profiler, sampler):
+    snapshot = None
+    if "tracemalloc" in _modes:
+        # Snapshot before building the other reports so their allocations are not counted
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"profile_{run_name}_{datetime.now().strftime('%Y-%m-%d-%H%M%S')}")
+    rows = span_summary(wall_seconds)
+    sections = [format_summary(run_name, wall_seconds, rows)]
+    report = {"run": run_name, "wall_s": round(wall_seconds, 4), "modes": sorted(_modes), "spans": rows}
+
+    if profiler is not None:
+        import io
+        import pstats
+        profiler.dump_stats(f"{base}.prof")
+        buffer = io.StringIO()
+        pstats.Stats(profiler, stream=buffer).sort_stats("cumulative").print_stats(CPROFILE_TOP)
+        sections.append(f"cProfile (main thread, top {CPROFILE_TOP} by cumulative time; full stats in {base}.prof)\n"
+                        + buffer.getvalue())
+
+    if sampler is not None:
+        with open(f"{base}.pyinstrument.html", "w", encoding="utf-8") as f:
+            f.write(sampler.output_html())
+        sections.append(f"pyinstrument profile: {base}.pyinstrument.html")
+
+    if snapshot is not None:
+        top = snapshot.statistics("lineno")[:TRACEMALLOC_TOP]
+        report["tracemalloc"] = {
+            "current_mb": round(current / 1e6, 2),
+            "peak_mb": round(peak / 1e6, 2),
+            "top": [{"site": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                    for stat in top],
+        }
+        sections.append(f"tracemalloc: peak {peak / 1e6:.1f} MB, still allocated {current / 1e6:.1f} MB\n"
+                        + "\n".join(f"  {stat.size / 1024:>10.1f} KiB {stat.count:>9} blocks  {stat.traceback[0]}"
+                                    for stat in top))
+
+    with open(f"{base}.txt", "w", encoding="utf-8") as f:
+        f.write("\n\n".join(sections) + "\n")
+    with open(f"{base}.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+
+    logging.info("\n" + sections[0])
+    logging.info(f"Profile written to {base}.txt")
+
+# Honour $GLAMIRA_PROFILE for every importer; --profile flags call configure() again
+try:
+    configure()
+except ValueError as e:
+    logging.warning(f"Ignoring ${ENV_VAR}: {e}")
@@ -0,0 +1,402 @@
+# End-to-end pipeline: crawl, IP geolocation, export, storage and warehouse load
+#
+#   ip_locations
+#   extract:user_behaviors -> write:user_behaviors -> upload:user_behaviors -> load:user_behaviors
+#   crawl_products => extract:products -> write:products -> upload:products -> load:products
+#   rollups => export:rollups
+#   ip_locations => extract:ip_locations -> write:ip_locations -> upload:ip_locations -> load:ip_locations
+#
+# With --enrich index, extract:user_behaviors also waits for ip_locations, and
+# write:user_behaviors attaches each event's IP location (see ip_enrichment.py).
+#
+# "->" streams through a bounded queue, "=>" waits for the stage to complete;
+# everything else runs concurrently (see orchestrator.py).
+#
+# Each export is split into _id range parts (same split as data_quality_scan.py).
+# extract reads one part at a time from MongoDB, write transforms and serializes it
+# into a part file, upload stores it as "<export prefix>_<run id>_part-NNNNN.<fmt>"
+# and load loads it into the table that prefix routes to. Loaded parts are
+# checkpointed, so a retried or resumed export continues with the next part.
+#
+# Everything can run on one machine: --local uses a mongomock stand-in for MongoDB
+# (optionally seeded from Extended JSON files) and filesystem storage/warehouse sinks.
+#
+# Usage:
+#   python run_pipeline.py [--local] [--seed summary=../data/summary_sample.jsonl]
+#                          [--mongo config|mock] [--storage gcs|local] [--warehouse bigquery|local]
+#                          [--skip STAGE] [--resume] [--format jsonl|parquet] [--fast] [--pushdown]
+#                          [--mode full|delta] [--partitions 16] [--chunk-rows 1000] [--queue-size 8]
+#                          [--enrich index|ip2location]
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import sys
+from collections import namedtuple
+
+import profiling
+import runtime
+from collection_export import ENRICH_SOURCES, EXPORT_FORMATS, EXPORT_MODES, EXPORT_MODULES
+from orchestrator import Stage, Orchestrator, format_report, DEFAULT_QUEUE_SIZE
+
+# --- Configuration Section ---
+STATE_FILE = "../data/pipeline_state.json"
+WORK_DIR = "../data/pipeline_parts"
+REPORT_DIR = "../logs"
+LOCAL_STORAGE_DIR = "../data/local_gcs"
+LOCAL_WAREHOUSE_DIR = "../data/local_warehouse"
+DEFAULT_PARTITIONS = 16     # _id range parts per export (one file and one load job each)
+DEFAULT_CHUNK_ROWS = 1000   # Documents per queue item between extract and write
+SEED_BATCH_SIZE = 10000
+
+# Stages an export has to wait for
+EXPORT_DEPS = {
+    "products": ["crawl_products"],  # The crawler upserts into products (see mongo_sink.py)
+    "ip_locations": ["ip_locations"],
+}
+
+# Items streamed between the export stages
+Chunk = namedtuple("Chunk", ["part", "rows", "end"])  # end: None, or {"rows", "watermark"} on a part's last chunk
+PartFile = namedtuple("PartFile", ["part", "path", "rows", "watermark", "object_name", "uri", "generation"])
+
+# --- Helper Functions ---
+def iter_parts(chunks):
+    """Groups a stream of Chunks into (part, rows, end) where rows lazily yields that part's documents.
+
+    Each rows iterator must be exhausted before moving on; end is filled in once it is.
+    """
+    chunks = iter(chunks)
+    for first in chunks:
+        end = {}
+
+        def rows(chunk=first, end=end):
+            while True:
+                yield from chunk.rows
+                if chunk.end is not None:
+                    end.update(chunk.end)
+                    return
+                chunk = next(chunks)
+
+        yield first.part, rows(), end
+
+def counted(docs, counter):
+    """Yields docs unchanged while counting them in counter["rows"]."""
+    for doc in docs:
+        counter["rows"] += 1
+        yield doc
+
+def combine_queries(*queries):
+    """ANDs MongoDB filters together, dropping empty ones."""
+    queries = [q for q in queries if q]
+    if not queries:
+        return {}
+    return queries[0] if len(queries) == 1 else {"$and": queries}
+
+# --- Export stages ---
+def extract_stage(dataset, options):
+    """Reads the export's documents from MongoDB, part by part."""
+    def run(ctx):
+        from data_quality_scan import id_partitions, range_filter
+        from export_watermark import encode_value, decode_value, load_watermark, watermark_query, WatermarkTracker
+
+        import collection_export
+        spec = importlib.import_module(EXPORT_MODULES[dataset]).export_spec()
+        collection_name = spec.collection
+        batch_size = spec.batch_size or runtime.mongo_batch_size()
+        delta = options.mode == "delta"
+
+        with ctx.lock:
+            if "partitions" not in ctx.data:
+                ranges = id_partitions(runtime.get_collection(collection_name), options.partitions)
+                ctx.data["partitions"] = [[encode_value(lower), encode_value(upper)] for lower, upper in ranges]
+                ctx.data["parts"] = {}
+                if delta:
+                    ctx.data["previous_watermark"] = encode_value(load_watermark(collection_name))
+        ctx.checkpoint()
+        previous_watermark = decode_value(ctx.data.get("previous_watermark"))
+
+        for part, (lower, upper) in enumerate(ctx.data["partitions"]):
+            if str(part) in ctx.data["parts"]:
+                continue
+            query = range_filter(decode_value(lower), decode_value(upper))
+            if delta:
+                query = combine_queries(query, watermark_query(spec.watermark_field, previous_watermark))
+            tracker = WatermarkTracker(spec.watermark_field)
+
+            if options.pushdown:
+                from export_pipelines import build_pipeline, WATERMARK_KEY
+                pipeline = build_pipeline(collection_name, query,
+                                          watermark_field=spec.watermark_field if delta else None)
+                if delta:
+                    tracker.source_key = WATERMARK_KEY
+                docs = collection_export.extract_data_pipeline(collection_name, batch_size, pipeline,
+                                                               fast=options.fast)
+            elif options.fast:
+                docs = collection_export.extract_data_fast(collection_name, batch_size=batch_size, query=query)
+            else:
+                docs = collection_export.extract_data(collection_name, batch_size=batch_size, query=query)
+
+            rows = []
+            for doc in tracker.track(docs):
+                rows.append(doc)
+                if len(rows) >= options.chunk_rows:
+                    ctx.emit(Chunk(part, rows, None))
+                    rows = []
+            ctx.emit(Chunk(part, rows, {"rows": tracker.count, "watermark": encode_value(tracker.max_value)}))
+            ctx.count("rows", tracker.count)
+    return run
+
+def write_stage(dataset, options):
+    """Transforms and serializes each part into a local part file."""
+    def run(ctx):
+        import collection_export
+        spec = importlib.import_module(EXPORT_MODULES[dataset]).export_spec()
+        transform = None if options.pushdown else spec.transform
+        os.makedirs(WORK_DIR, exist_ok=True)
+
+        enricher = None
+        parquet_options = {}
+        if options.enrich and spec.supports_enrichment:
+            from ip_enrichment import build_enricher, SCHEMA_FIELDS
+            enricher = build_enricher(options.enrich)
+            parquet_options["extra_fields"] = SCHEMA_FIELDS
+
+        for part, rows, end in iter_parts(ctx):
+            path = os.path.join(WORK_DIR, f"{dataset}_part-{part:05d}.{options.export_format}")
+            counter = {"rows": 0}
+            docs = counted(rows, counter)
+            if enricher is not None:
+                docs = enricher.enrich(docs)
+            if options.export_format == "parquet":
+                collection_export.write_to_parquet(docs, path, spec.schema_path, transform=transform,
+                                                   **parquet_options)
+            elif options.fast:
+                collection_export.write_to_jsonl_fast(docs, path, transform=transform)
+            else:
+                collection_export.write_to_jsonl(docs, path, transform=transform)
+
+            if counter["rows"] == 0:
+                os.remove(path)
+                path = None
+            else:
+                ctx.count("rows", counter["rows"])
+                ctx.count("bytes", os.path.getsize(path))
+            ctx.emit(PartFile(part, path, counter["rows"], end.get("watermark"), None, None, None))
+
+        if enricher is not None:
+            enricher.log_summary()
+            ctx.count("unresolved_ips", enricher.unresolved)
+    return run
+
+def upload_stage(dataset, options, storage):
+    """Stores each part file as an object under the export's prefix."""
+    def run(ctx):
+        spec = importlib.import_module(EXPORT_MODULES[dataset]).export_spec()
+        for part_file in ctx:
+            if part_file.path is not None:
+                object_name = f"{spec.gcs_prefix}_{ctx.run_id}_part-{part_file.part:05d}.{options.export_format}"
+                uri, generation = storage.store(part_file.path, spec.bucket, object_name)
+                os.remove(part_file.path)
+                ctx.count("objects")
+                part_file = part_file._replace(object_name=object_name, uri=uri, generation=generation)
+            ctx.emit(part_file)
+    return run
+
+def load_stage(dataset, options, warehouse):
+    """Loads each stored part into the warehouse and checkpoints it; advances the watermark at the end."""
+    def run(ctx):
+        from export_watermark import decode_value, save_watermark
+
+        spec = importlib.import_module(EXPORT_MODULES[dataset]).export_spec()
+        for part_file in ctx:
+            loaded = 0
+            if part_file.uri is not None:
+                loaded = warehouse.load(part_file.uri, part_file.object_name, part_file.generation)
+            ctx.count("rows", loaded)
+            with ctx.lock:
+                ctx.data["parts"][str(part_file.part)] = {
+                    "rows": part_file.rows, "watermark": part_file.watermark, "uri": part_file.uri,
+                }
+            ctx.checkpoint()
+
+        if options.mode == "delta":
+            # Every part is loaded at this point, so the watermark can move past all of them
+            values = [decode_value(p["watermark"]) for p in ctx.data["parts"].values() if p["watermark"] is not None]
+            if values:
+                save_watermark(spec.collection, spec.watermark_field, max(values))
+            else:
+                logging.info(f"No new documents in '{spec.collection}' since the last export.")
+    return run
+
+# --- Other stages ---
+def crawl_products_stage(ctx):
+    import crawl_product_name
+    crawl_product_name.process_product_data()
+
+def ip_locations_stage(ctx):
+    import process_ip_location
+    config = runtime.load_config()
+    ip2location_path = runtime.resolve_path(config['ip2location']['ip2location_db_path'])
+    if not os.path.exists(ip2location_path):
+        raise FileNotFoundError(f"IP2Location database file not found at '{ip2location_path}'")
+    process_ip_location.process_ip_locations()
+
+def rollups_stage(ctx):
+    import event_rollups
+    for name, status in event_rollups.update_rollups().items():
+        ctx.count(status.replace(" ", "_"))
+
+def export_rollups_stage(storage, warehouse):
+    """Writes, stores and loads one snapshot of every rollup."""
+    def run(ctx):
+        import event_rollups
+        os.makedirs(WORK_DIR, exist_ok=True)
+        for name in event_rollups.ROLLUPS:
+            path = os.path.join(WORK_DIR, f"rollup_{name}.jsonl")
+            rows = event_rollups.write_rollup(name, path)
+            object_name = event_rollups.object_name(name, ctx.run_id)
+            uri, generation = storage.store(path, event_rollups.GCS_BUCKET_NAME, object_name)
+            os.remove(path)
+            warehouse.load(uri, object_name, generation)
+            ctx.count("rows", rows)
+            ctx.count("objects")
+    return run
+
+# --- DAG ---
+def build_stages(options, storage, warehouse):
+    """All pipeline stages and their edges."""
+    stages = [
+        Stage("crawl_products", crawl_products_stage, retries=1),
+        Stage("ip_locations", ip_locations_stage, no_retry=(FileNotFoundError,)),
+        Stage("rollups", rollups_stage),
+        Stage("export:rollups", export_rollups_stage(storage, warehouse), deps=["rollups"]),
+    ]
+    for dataset in EXPORT_MODULES:
+        deps = list(EXPORT_DEPS.get(dataset, []))
+        if options.enrich == "index" and dataset == "user_behaviors":
+            deps.append("ip_locations")
+        stages += [
+            Stage(f"extract:{dataset}", extract_stage(dataset, options), deps=deps),
+            Stage(f"write:{dataset}", write_stage(dataset, options), stream_from=f"extract:{dataset}",
+                  queue_size=options.queue_size),
+            Stage(f"upload:{dataset}", upload_stage(dataset, options, storage),
+                  stream_from=f"write:{dataset}", queue_size=options.queue_size),
+            Stage(f"load:{dataset}", load_stage(dataset, options, warehouse),
+                  stream_from=f"upload:{dataset}", queue_size=options.queue_size),
+        ]
+    return stages
+
+def make_sinks(args):
+    from pipeline_sinks import GCSStorage, LocalStorage, BigQueryWarehouse, LocalWarehouse
+    storage = LocalStorage(LOCAL_STORAGE_DIR) if args.storage == "local" else GCSStorage()
+    warehouse = LocalWarehouse(LOCAL_WAREHOUSE_DIR) if args.warehouse == "local" else BigQueryWarehouse()
+    return storage, warehouse
+
+def use_mock_mongo(seeds):
+    """Installs a mongomock client as the shared client and loads the seed files into it."""
+    import mongomock
+    from bson import json_util
+
+    runtime.set_mongo_client(mongomock.MongoClient())
+    db = runtime.get_database()
+    for seed in seeds:
+        collection_name, path = seed.split("=", 1)
+        batch, total = [], 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    batch.append(json_util.loads(line))
+                if len(batch) >= SEED_BATCH_SIZE:
+                    db[collection_name].insert_many(batch)
+                    total += len(batch)
+                    batch = []
+        if batch:
+            db[collection_name].insert_many(batch)
+            total += len(batch)
+        logging.info(f"Seeded {total} documents into mock collection '{collection_name}' from {path}")
+
+# --- Script entry point ---
+def add_arguments(parser):
+    parser.add_argument("--local", action="store_true",
+                        help="Run on this machine only: --mongo mock --storage local --warehouse local, "
+                             "and skip crawl_products (it needs glamira.com)")
+    parser.add_argument("--mongo", choices=["config", "mock"], default="config",
+                        help="config: MongoDB from config.ini; mock: in-process mongomock stand-in")
+    parser.add_argument("--seed", action="append", default=[], metavar="COLLECTION=FILE",
+                        help="Extended JSON lines file loaded into the mock MongoDB")
+    parser.add_argument("--storage", choices=["gcs", "local"], default="gcs")
+    parser.add_argument("--warehouse", choices=["bigquery", "local"], default="bigquery")
+    parser.add_argument("--skip", action="append", default=[], metavar="STAGE")
+    parser.add_argument("--resume", action="store_true", help="Continue the unfinished run in the state file")
+    parser.add_argument("--format", dest="export_format", choices=EXPORT_FORMATS, default="jsonl")
+    parser.add_argument("--fast", action="store_true")
+    parser.add_argument("--pushdown", action="store_true")
+    parser.add_argument("--mode", choices=EXPORT_MODES, default="full")
+    parser.add_argument("--enrich", choices=ENRICH_SOURCES,
+                        help="Attach the IP location to every user_behaviors event")
+    parser.add_argument("--partitions", type=int, default=DEFAULT_PARTITIONS)
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument("--max-parallel", type=int, help="Chains run at once (default: all ready chains)")
+
+def run(args):
+    """Runs the pipeline; returns True if every stage succeeded or was skipped."""
+    if args.local:
+        args.mongo, args.storage, args.warehouse = "mock", "local", "local"
+        if "crawl_products" not in args.skip:
+            args.skip.append("crawl_products")
+
+    if args.mongo == "mock" and args.pushdown:
+        raise SystemExit("--pushdown needs a MongoDB server: mongomock does not implement the $type, $unset "
+                         "and $indexOfArray operators the export pipelines use (see export_pipelines.py).")
+    if args.mongo == "mock":
+        # mongomock implements neither $merge nor the date operators the rollups use
+        args.skip += [name for name in ("rollups", "export:rollups") if name not in args.skip]
+        use_mock_mongo(args.seed)
+    else:
+        # Pin the shared client so stages finishing early cannot close it under the others
+        runtime.set_mongo_client(runtime.get_mongo_client())
+
+    os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+    storage, warehouse = make_sinks(args)
+
+    orchestrator = Orchestrator(build_stages(args, storage, warehouse), STATE_FILE,
+                                skip=args.skip, max_parallel=args.max_parallel)
+    try:
+        succeeded = orchestrator.run(resume=args.resume)
+    finally:
+        runtime.close_mongo_client(force=True)
+
+    report = orchestrator.report()
+    logging.info("\n" + format_report(report))
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    report_path = os.path.join(REPORT_DIR, f"pipeline_report_{report['run_id']}.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4, default=str)
+    logging.info(f"Timing report written to {report_path}")
+    return succeeded
+
+def build_parser(prog=None):
+    parser = argparse.ArgumentParser(prog=prog,
+                                     description="Run the whole pipeline as a DAG of concurrent, streaming stages.")
+    add_arguments(parser)
+    return parser
+
+def configure_logging():
+    """Logs to the console with thread names; called by the entry points, not on import."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s')
+
+def main(argv=None):
+    configure_logging()
+    parser = build_parser()
+    profiling.add_argument(parser)
+    args = parser.parse_args(argv)
+    profiling.configure(args.profile)
+    with profiling.session("pipeline"):
+        succeeded = run(args)
+    sys.exit(0 if succeeded else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# Shared runtime for all pipeline scripts
+#
+# - one validated config loader (config/config.ini, or $GLAMIRA_CONFIG)
+# - one process-wide, pooled MongoClient tuned from the [mongodb] section
+# - lazy imports for heavy optional packages (google.cloud, bs4, IP2Location)
+#
+# Nothing here touches the network or the filesystem at import time.
+
+import configparser
+import importlib
+import logging
+import os
+import threading
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG_PATH = os.path.join(SCRIPTS_DIR, "..", "config", "config.ini")
+
+# Keys every script relies on
+REQUIRED_KEYS = {
+    "mongodb": ["mongo_uri", "db_name"],
+}
+
+# Applied before the file is read, so config.ini only needs to override them
+DEFAULTS = {
+    "mongodb": {
+        "summary_collection": "summary",
+        "location_collection": "ip_locations",
+        "products_collection": "products",
+        "max_pool_size": "50",
+        "min_pool_size": "0",
+        "read_preference": "primary",
+        "cursor_batch_size": "1000",
+        "crawl_failures_collection": "crawl_failures",
+    },
+    "script_logic": {
+        "product_sinks": "mongo, csv",
+        "sink_flush_size": "500",
+        "sink_flush_interval_seconds": "5",
+        "sink_max_buffer": "20000",
+    },
+}
+
+_config = None
+_config_path = None
+_mongo_client = None
+_mongo_client_pinned = False
+_lock = threading.Lock()
+
+# --- Configuration ---
+def set_config_path(path):
+    """Points the runtime at another config file (drops any cached config)."""
+    global _config, _config_path
+    with _lock:
+        _config = None
+        _config_path = path
+
+def config_path():
+    """Returns the config file in use: explicit path, $GLAMIRA_CONFIG, or config/config.ini."""
+    return os.path.abspath(_config_path or os.environ.get("GLAMIRA_CONFIG") or DEFAULT_CONFIG_PATH)
+
+def load_config():
+    """Loads and validates the INI configuration once per process."""
+    global _config
+    if _config is not None:
+        return _config
+
+    with _lock:
+        if _config is None:
+            filename = config_path()
+            if not os.path.exists(filename):
+                logging.error(f"Configuration file '{filename}' not found. Please create it.")
+                raise FileNotFoundError(f"Configuration file '{filename}' not found.")
+
+            config = configparser.ConfigParser()
+            config.read_dict(DEFAULTS)
+            config.read(filename)
+
+            missing = [f"[{section}] {key}" for section, keys in REQUIRED_KEYS.items()
+                       for key in keys if not config.has_option(section, key)]
+            if missing:
+                raise ValueError(f"Configuration file '{filename}' is missing: {', '.join(missing)}")
+            _config = config
+    return _config
+
+def resolve_path(path):
+    """Resolves a path from the config relative to the config file's directory."""
+    if os.path.isabs(path):
+        return path
+    return os.path.normpath(os.path.join(os.path.dirname(config_path()), path))
+
+# --- MongoDB ---
+def get_mongo_client():
+    """Returns the process-wide pooled MongoClient, creating it on first use."""
+    global _mongo_client
+    if _mongo_client is not None:
+        return _mongo_client
+
+    config = load_config()
+    with _lock:
+        if _mongo_client is None:
+            import pymongo
+
+            mongo = config["mongodb"]
+            _mongo_client = pymongo.MongoClient(
+                mongo["mongo_uri"],
+                maxPoolSize=mongo.getint("max_pool_size"),
+                minPoolSize=mongo.getint("min_pool_size"),
+                readPreference=mongo["read_preference"],
+            )
+            logging.info(f"MongoDB client created (pool {mongo['min_pool_size']}-{mongo['max_pool_size']}, "
+                         f"read preference {mongo['read_preference']})")
+    return _mongo_client
+
+def set_mongo_client(client, pinned=True):
+    """Installs a client (e.g. a mongomock stand-in) as the shared client.
+
+    A pinned client survives close_mongo_client() calls made by individual stages,
+    so stages running side by side in one process cannot close it under each other.
+    """
+    global _mongo_client, _mongo_client_pinned
+    with _lock:
+        _mongo_client = client
+        _mongo_client_pinned = pinned and client is not None
+
+def get_database():
+    """Returns the configured database on the shared client."""
+    return get_mongo_client()[load_config()["mongodb"]["db_name"]]
+
+def get_collection(name):
+    """Returns a collection on the shared client by name."""
+    return get_database()[name]
+
+def mongo_batch_size():
+    """Cursor batch size from [mongodb] cursor_batch_size."""
+    return load_config()["mongodb"].getint("cursor_batch_size")
+
+def close_mongo_client(force=False):
+    """Closes the shared client (safe to call when it was never created; pinned clients need force)."""
+    global _mongo_client, _mongo_client_pinned
+    with _lock:
+        if _mongo_client_pinned and not force:
+            return
+        if _mongo_client is not None:
+            _mongo_client.close()
+            _mongo_client = None
+            _mongo_client_pinned = False
+
+# --- Lazy imports ---
+class LazyModule:
+    """Module proxy that imports the real module on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+def lazy_import(name):
+    """Returns a LazyModule for name; the import cost is paid only when it is used."""
+    return LazyModule(name)
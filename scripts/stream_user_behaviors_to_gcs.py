@@ -0,0 +1,195 @@
+# Near-real-time export of user behaviour events via a MongoDB change stream
+#
+# Instead of re-reading summary with find(), this tails the inserts into it with
+# a change stream (replica set or sharded cluster; a single-node replica set is
+# enough locally, e.g. mongod --replSet rs0 + rs.initiate()). Events are cut into
+# micro-batches of at most MAX_BATCH_EVENTS events or MAX_BATCH_SECONDS seconds,
+# written as JSONL with the batch exporter's transform_document and uploaded under
+# the same export prefix, so bigquery_loader.py loads them into raw_user_behaviors
+# like any delta export.
+#
+# After every upload the resume token of the batch's last event is saved in its
+# own state file (STATE_FILE, key stream:summary), and a restart resumes right
+# after it. The streamer is a long-running process of its own, so it does not
+# share export_watermarks.json with the delta exports and rollups. A crash between an upload and the save re-exports that one batch
+# (at-least-once). When the token has fallen off the oplog, run a delta export
+# to catch up and restart with --reset.
+#
+# Usage: python stream_user_behaviors_to_gcs.py [--max-events N] [--max-seconds S] [--fast] [--enrich index]
+
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from itertools import chain
+
+import profiling
+import runtime
+from collection_export import manifest_name, upload_to_gcs, write_manifest, write_to_jsonl, write_to_jsonl_fast
+from export_user_behavior_to_gcs import (
+    ENRICH_LOCATIONS, ENRICHMENT_STATS_PATH, FAST_SERIALIZATION, GCS_BUCKET_NAME, GCS_EXPORT_PATH_PREFIX,
+    MONGO_COLLECTION_NAME, transform_document,
+)
+from export_watermark import WATERMARK_FILE, WatermarkTracker, format_range_value, load_watermark, save_watermark
+
+# --- Configuration Section ---
+LOCAL_FILE_PATH = "../data/user_behaviors.stream.jsonl"
+STATE_FILE = "../data/stream_state.json"
+LEGACY_STATE_FILE = WATERMARK_FILE  # Where earlier versions saved the token; read once when STATE_FILE is missing
+MAX_BATCH_EVENTS = 50000     # Upload once a batch holds this many events...
+MAX_BATCH_SECONDS = 60       # ...or once it has been open this long
+MAX_AWAIT_MS = 1000          # Longest server-side wait for new events per getMore
+STATE_KEY = f"stream:{MONGO_COLLECTION_NAME}"
+TOKEN_FIELD = "resume_token"
+CHANGE_PIPELINE = [{"$match": {"operationType": "insert"}}]  # summary is append-only
+
+# Server error codes with a specific hint
+CHANGE_STREAM_HISTORY_LOST = 286
+NOT_A_REPLICA_SET = 40573
+
+# --- Helper Functions ---
+class MicroBatch:
+    """Reads one time- or size-bounded batch of inserted documents from a change stream."""
+
+    def __init__(self, stream, max_events, max_seconds, stop):
+        self.stream = stream
+        self.max_events = max_events
+        self.deadline = time.monotonic() + max_seconds
+        self.stop = stop
+        self.resume_token = None  # Token of the last event handed out
+
+    def __iter__(self):
+        count = 0
+        while count < self.max_events and time.monotonic() < self.deadline and not self.stop.is_set():
+            change = self.stream.try_next()  # Returns None after MAX_AWAIT_MS without events
+            if change is None:
+                continue
+            self.resume_token = change["_id"]
+            count += 1
+            yield change["fullDocument"]
+
+def load_resume_token():
+    """The saved resume token, or None to stream from now on."""
+    if not os.path.exists(STATE_FILE):
+        return load_watermark(STATE_KEY, path=LEGACY_STATE_FILE)
+    return load_watermark(STATE_KEY, path=STATE_FILE)
+
+def save_resume_token(resume_token):
+    save_watermark(STATE_KEY, TOKEN_FIELD, resume_token, path=STATE_FILE)
+
+def open_change_stream(collection, resume_token):
+    """Opens the change stream on collection, right after resume_token when there is one."""
+    return collection.watch(CHANGE_PIPELINE, resume_after=resume_token, max_await_time_ms=MAX_AWAIT_MS,
+                            batch_size=runtime.mongo_batch_size())
+
+def log_stream_error(error):
+    """Logs what to do about the change stream errors an operator can fix."""
+    if error.code == CHANGE_STREAM_HISTORY_LOST:
+        logging.error("The saved resume token is no longer in the oplog. Run a delta export "
+                      "(export_user_behavior_to_gcs.py --mode delta) and restart the stream with --reset.")
+    elif error.code == NOT_A_REPLICA_SET:
+        logging.error("Change streams need a replica set or sharded cluster; start mongod with --replSet.")
+
+def stream_to_gcs(max_events=MAX_BATCH_EVENTS, max_seconds=MAX_BATCH_SECONDS, fast=FAST_SERIALIZATION,
+                  enrich=ENRICH_LOCATIONS, reset=False, max_batches=None, stop=None):
+    """Tails summary and uploads micro-batches until stopped; returns the number of batches uploaded."""
+    from pymongo.errors import OperationFailure
+
+    stop = stop or threading.Event()
+    collection = runtime.get_collection(MONGO_COLLECTION_NAME)
+    if reset:
+        save_resume_token(None)
+    resume_token = load_resume_token()
+    if resume_token is None:
+        logging.info(f"No resume token saved; streaming '{MONGO_COLLECTION_NAME}' inserts from now on.")
+
+    enricher = None
+    if enrich:
+        from ip_enrichment import build_enricher
+        enricher = build_enricher(enrich)
+    write = write_to_jsonl_fast if fast else write_to_jsonl
+
+    uploaded = 0
+    try:
+        with open_change_stream(collection, resume_token) as stream:
+            logging.info(f"Streaming '{MONGO_COLLECTION_NAME}' to gs://{GCS_BUCKET_NAME}/{GCS_EXPORT_PATH_PREFIX}_* "
+                         f"(batches of up to {max_events} events / {max_seconds}s)")
+            while not stop.is_set() and (max_batches is None or uploaded < max_batches):
+                timestamp = datetime.now().strftime("%Y-%m-%d-%H%M%S")
+                batch = MicroBatch(stream, max_events, max_seconds, stop)
+                tracker = WatermarkTracker("_id")
+                docs = tracker.track(batch)
+                # Wait for the first event before touching the local file, so idle batches write nothing
+                first = next(docs, None)
+                if tracker.count == 0:
+                    # Keep the saved token recent while idle, so it does not fall off the oplog
+                    if stream.resume_token is not None and stream.resume_token != resume_token:
+                        resume_token = stream.resume_token
+                        save_resume_token(resume_token)
+                    continue
+
+                docs = chain([first], docs)
+                if enricher is not None:
+                    docs = enricher.enrich(docs)
+                with profiling.span("stream.write_batch"):
+                    write(docs, LOCAL_FILE_PATH, transform=transform_document)
+
+                gcs_destination_blob = (f"{GCS_EXPORT_PATH_PREFIX}_{timestamp}_stream_"
+                                        f"{format_range_value(tracker.max_value)}.jsonl")
+                upload_to_gcs(GCS_BUCKET_NAME, LOCAL_FILE_PATH, gcs_destination_blob)
+                upload_to_gcs(GCS_BUCKET_NAME, write_manifest([gcs_destination_blob], manifest_name(LOCAL_FILE_PATH)),
+                              manifest_name(gcs_destination_blob))
+                # Advance the resume token only once the upload has succeeded
+                resume_token = batch.resume_token
+                save_resume_token(resume_token)
+                uploaded += 1
+                logging.info(f"Streamed batch {uploaded}: {tracker.count} events up to _id {tracker.max_value}")
+    except OperationFailure as e:
+        log_stream_error(e)
+        raise
+    finally:
+        if enricher is not None:
+            enricher.log_summary()
+            enricher.write_summary(ENRICHMENT_STATS_PATH)
+        for path in (LOCAL_FILE_PATH, manifest_name(LOCAL_FILE_PATH)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    logging.info(f"Stream stopped after {uploaded} batches.")
+    return uploaded
+
+def stop_on_signals(stop):
+    """Sets stop on SIGINT/SIGTERM, so the open batch is uploaded before exiting."""
+    def handler(signum, frame):
+        logging.info(f"Received signal {signum}; finishing the current batch...")
+        stop.set()
+    signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGTERM, handler)
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Continuously export new user behaviour events to GCS.")
+    parser.add_argument("--max-events", type=int, default=MAX_BATCH_EVENTS, help="Events per uploaded file at most")
+    parser.add_argument("--max-seconds", type=float, default=MAX_BATCH_SECONDS,
+                        help="Seconds a batch stays open at most")
+    parser.add_argument("--fast", action="store_true", default=FAST_SERIALIZATION,
+                        help="Serialize with orjson and buffered writes")
+    parser.add_argument("--enrich", choices=["index", "ip2location"], default=ENRICH_LOCATIONS,
+                        help="Attach country_code/region_name/city_name from ip_locations or the IP2Location file")
+    parser.add_argument("--reset", action="store_true", help="Forget the saved resume token and start from now")
+    parser.add_argument("--max-batches", type=int, help="Stop after uploading this many batches")
+    profiling.add_argument(parser)
+    args = parser.parse_args()
+    profiling.configure(args.profile)
+    stop = threading.Event()
+    stop_on_signals(stop)
+    try:
+        with profiling.session("stream_user_behaviors"):
+            stream_to_gcs(max_events=args.max_events, max_seconds=args.max_seconds, fast=args.fast,
+                          enrich=args.enrich, reset=args.reset, max_batches=args.max_batches, stop=stop)
+    finally:
+        runtime.close_mongo_client()
@@ -0,0 +1,70 @@
+# Verifies that the server-side export pipelines (export_pipelines.py) produce
+# byte-identical JSONL to the exporters' Python transform_document() functions.
+#
+# Usage: python verify_export_pipelines.py [--collection summary] [--limit 100000]
+
+import argparse
+import json
+import sys
+from itertools import zip_longest
+
+import export_ip_location_to_gcs
+import export_products_to_gcs
+import export_user_behavior_to_gcs
+import runtime
+from export_pipelines import build_pipeline
+
+EXPORTERS = {
+    "summary": export_user_behavior_to_gcs,
+    "products": export_products_to_gcs,
+    "ip_locations": export_ip_location_to_gcs,
+}
+
+def python_lines(collection, exporter, limit):
+    """JSONL lines produced by the current Python transform."""
+    cursor = collection.find({}).sort("_id", 1).limit(limit)
+    for doc in cursor:
+        yield json.dumps(exporter.transform_document(doc)) + "\n"
+
+def pipeline_lines(collection, collection_name, limit):
+    """JSONL lines produced by the aggregation pipeline."""
+    pipeline = [{"$sort": {"_id": 1}}, {"$limit": limit}] + build_pipeline(collection_name)
+    for doc in collection.aggregate(pipeline, allowDiskUse=True):
+        yield json.dumps(doc) + "\n"
+
+def _shown(line):
+    return "<missing>" if line is None else line.rstrip()
+
+def verify(db, collection_name, limit, max_reports=5):
+    """Compares both outputs line by line and returns the number of mismatches (missing lines included)."""
+    exporter = EXPORTERS[collection_name]
+    collection = db[collection_name]
+
+    mismatches = 0
+    compared = 0
+    # A pipeline that drops or adds documents must fail too, so the shorter side is padded with None
+    for expected, actual in zip_longest(python_lines(collection, exporter, limit),
+                                        pipeline_lines(collection, collection_name, limit)):
+        compared += 1
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= max_reports:
+                print(f"  MISMATCH\n    python:   {_shown(expected)}\n    pipeline: {_shown(actual)}")
+
+    status = "OK" if mismatches == 0 else "FAILED"
+    print(f"[{status}] {collection_name}: {compared} documents compared, {mismatches} mismatches")
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description="Check export pipelines against the Python transforms.")
+    parser.add_argument("--collection", choices=sorted(EXPORTERS), action="append")
+    parser.add_argument("--limit", type=int, default=100000)
+    args = parser.parse_args()
+
+    db = runtime.get_database()
+    failed = sum(verify(db, name, args.limit) for name in (args.collection or sorted(EXPORTERS)))
+    runtime.close_mongo_client()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
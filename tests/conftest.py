@@ -0,0 +1,5 @@
+# The scripts are flat modules that import each other by name (run from scripts/)
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
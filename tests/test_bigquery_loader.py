@@ -0,0 +1,248 @@
+import pytest
+from google.api_core.exceptions import Conflict
+from google.cloud import bigquery
+
+import bigquery_loader
+from bigquery_loader import load_job_id, load_manifest, load_object, load_prefix, load_uris, resolve_target
+from collection_export import manifest_name, write_manifest
+
+URIS = ["gs://bucket/exports/products/products_b.jsonl", "gs://bucket/exports/products/products_a.jsonl"]
+
+
+class FakeJob:
+    def __init__(self, job_id, state="RUNNING", error_result=None, output_rows=10):
+        self.job_id = job_id
+        self.state = state
+        self.error_result = error_result
+        self.output_rows = output_rows
+        self.waited = False
+
+    def result(self):
+        self.waited = True
+        self.state = "DONE"
+        return self
+
+
+class FakeClient:
+    """Records submitted load jobs; submitting an existing job ID raises Conflict like BigQuery."""
+
+    def __init__(self, jobs=()):
+        self.jobs = {job.job_id: job for job in jobs}
+        self.submitted = []
+
+    def dataset(self, dataset_id):
+        return bigquery.DatasetReference("my-project", dataset_id)
+
+    def load_table_from_uri(self, uris, table_ref, job_id, job_config):
+        if job_id in self.jobs:
+            raise Conflict(f"Already Exists: Job {job_id}")
+        self.submitted.append((job_id, list(uris), job_config))
+        self.jobs[job_id] = FakeJob(job_id)
+        return self.jobs[job_id]
+
+    def get_job(self, job_id):
+        return self.jobs[job_id]
+
+
+class FakeBlob:
+    def __init__(self, name, text=""):
+        self.name = name
+        self.text = text
+
+    def download_as_text(self):
+        return self.text
+
+
+class FakeStorage:
+    """A single bucket holding the given {object name: text} objects."""
+
+    def __init__(self, objects):
+        self.blobs = {name: FakeBlob(name, text) for name, text in objects.items()}
+
+    def bucket(self, bucket_name):
+        return self
+
+    def blob(self, name):
+        return self.blobs[name]
+
+    def list_blobs(self, bucket_name, prefix=""):
+        return [blob for name, blob in self.blobs.items() if name.startswith(prefix)]
+
+
+def failed_job(job_id):
+    return FakeJob(job_id, state="DONE", error_result={"reason": "invalid", "message": "bad row"})
+
+
+@pytest.fixture(autouse=True)
+def partitioned_tables(monkeypatch):
+    """Skips table creation and schema files: every target is an already partitioned table."""
+    table = bigquery.Table("my-project.glamira_dataset.raw_products")
+    table.time_partitioning = bigquery.TimePartitioning(type_="DAY")
+    table.clustering_fields = ["product_id"]
+    monkeypatch.setattr(bigquery_loader, "ensure_target_table", lambda client, table_id, schema_path: table)
+    monkeypatch.setattr(bigquery_loader, "get_schema", lambda client, schema_path: [])
+    return table
+
+
+# --- load_job_id ---
+def test_load_job_id_is_stable_and_order_independent():
+    job_id = load_job_id("raw_products", URIS)
+
+    assert job_id == load_job_id("raw_products", list(reversed(URIS)))
+    assert job_id.startswith("load_raw_products_") and len(job_id) == len("load_raw_products_") + 40
+
+
+def test_load_job_id_depends_on_table_uris_and_salt():
+    job_id = load_job_id("raw_products", URIS)
+
+    assert load_job_id("raw_products", URIS, salt="17") != job_id
+    assert load_job_id("raw_products", URIS[:1]) != job_id
+    assert load_job_id("raw_ip_locations", URIS).startswith("load_raw_ip_locations_")
+
+
+# --- resolve_target ---
+@pytest.mark.parametrize("object_name, table_id", [
+    ("exports/user_behaviors/user_behaviors_2024-01-01-000000.jsonl", "raw_user_behaviors"),
+    ("exports/user_behaviors/user_behaviors_2024-01-01-000000_stream_65a1.jsonl", "raw_user_behaviors"),
+    ("exports/products/products_2024-01-01-000000.parquet", "raw_products"),
+    ("exports/ip_locations/ip_locations_2024-01-01-000000.jsonl", "raw_ip_locations"),
+    ("exports/rollups/add_to_cart_daily/add_to_cart_daily_2024-01-01-000000.jsonl", "agg_add_to_cart_daily"),
+])
+def test_resolve_target_routes_by_prefix(object_name, table_id):
+    assert resolve_target(object_name)["table_id"] == table_id
+
+
+@pytest.mark.parametrize("object_name", ["exports/other/file.jsonl", "user_behaviors_x.jsonl", ""])
+def test_resolve_target_ignores_unknown_objects(object_name):
+    assert resolve_target(object_name) is None
+
+
+def test_rollup_targets_truncate():
+    assert resolve_target("exports/rollups/product_daily_events/product_daily_events_x.jsonl")[
+        "write_disposition"] == "WRITE_TRUNCATE"
+    assert "write_disposition" not in resolve_target("exports/products/products_x.jsonl")
+
+
+# --- load_uris ---
+def test_load_uris_submits_one_job_per_format():
+    client = FakeClient()
+    uris = URIS + ["gs://bucket/exports/products/products_c.parquet"]
+    jobs = load_uris(client, "raw_products", "products_schema.json", uris)
+
+    assert [job_id for job_id, _, _ in client.submitted] == [
+        load_job_id("raw_products", URIS), load_job_id("raw_products", uris[2:])]
+    assert all(job.waited for job in jobs)
+    job_config = client.submitted[0][2]
+    assert job_config.write_disposition == "WRITE_APPEND"
+    assert job_config.clustering_fields == ["product_id"]
+
+
+def test_load_uris_waits_on_existing_job_after_conflict():
+    existing = FakeJob(load_job_id("raw_products", URIS))
+    client = FakeClient([existing])
+
+    assert load_uris(client, "raw_products", "products_schema.json", URIS) == [existing]
+    assert client.submitted == [] and existing.waited
+
+
+def test_load_uris_resubmits_when_existing_job_failed():
+    client = FakeClient([failed_job(load_job_id("raw_products", URIS))])
+    [job] = load_uris(client, "raw_products", "products_schema.json", URIS)
+
+    assert job.job_id == load_job_id("raw_products", URIS, salt="-r1")
+    assert [job_id for job_id, _, _ in client.submitted] == [job.job_id]
+
+
+def test_load_uris_gives_up_after_max_attempts():
+    job_ids = [load_job_id("raw_products", URIS, salt=salt) for salt in ("", "-r1", "-r2")]
+    client = FakeClient([failed_job(job_id) for job_id in job_ids])
+
+    with pytest.raises(RuntimeError, match="failed in all 3 load jobs"):
+        load_uris(client, "raw_products", "products_schema.json", URIS)
+    assert client.submitted == []
+
+
+def test_load_uris_refuses_unpartitioned_table(partitioned_tables):
+    partitioned_tables.time_partitioning = None
+    client = FakeClient()
+
+    with pytest.raises(ValueError, match="not partitioned"):
+        load_uris(client, "raw_products", "products_schema.json", URIS)
+    assert client.submitted == []
+
+
+def test_load_object_salts_with_generation():
+    client = FakeClient()
+    load_object(client, "bucket", "exports/products/products_a.jsonl", generation="42")
+
+    assert client.submitted[0][0] == load_job_id(
+        "raw_products", ["gs://bucket/exports/products/products_a.jsonl"], salt="42")
+
+
+def test_load_object_ignores_unrouted_objects():
+    client = FakeClient()
+
+    assert load_object(client, "bucket", "exports/other/file.jsonl") == []
+    assert client.submitted == []
+
+
+# --- manifests and prefixes ---
+def test_exported_manifest_loads_its_objects_in_one_job(tmp_path):
+    data_object = "exports/products/products_2024-01-31-120000.jsonl"
+    manifest_object = manifest_name(data_object)
+    with open(write_manifest([data_object], str(tmp_path / "m.json")), encoding="utf-8") as f:
+        storage = FakeStorage({manifest_object: f.read()})
+    client = FakeClient()
+
+    load_manifest(client, storage, "bucket", manifest_object)
+
+    assert manifest_object == "exports/products/products_2024-01-31-120000_manifest.json"
+    assert [uris for _, uris, _ in client.submitted] == [["gs://bucket/" + data_object]]
+
+
+def test_manifest_objects_are_not_loaded_as_data():
+    client = FakeClient()
+
+    assert load_object(client, "bucket", "exports/products/products_2024-01-31-120000_manifest.json") == []
+    assert client.submitted == []
+
+
+def test_load_prefix_loads_one_run():
+    storage = FakeStorage({
+        "exports/products/products_2024-01-30-120000.jsonl": "",
+        "exports/products/products_2024-01-31-120000_part-00000.parquet": "",
+        "exports/products/products_2024-01-31-120000_part-00001.parquet": "",
+        "exports/products/products_2024-01-31-120000_manifest.json": "",
+    })
+    client = FakeClient()
+
+    load_prefix(client, storage, "bucket", "exports/products/products_2024-01-31-120000")
+
+    assert [uris for _, uris, _ in client.submitted] == [[
+        "gs://bucket/exports/products/products_2024-01-31-120000_part-00000.parquet",
+        "gs://bucket/exports/products/products_2024-01-31-120000_part-00001.parquet",
+    ]]
+
+
+@pytest.mark.parametrize("prefix", ["exports/products/products_", "exports/products/products_2024-01"])
+def test_load_prefix_refuses_prefixes_spanning_runs(prefix):
+    client = FakeClient()
+
+    with pytest.raises(ValueError, match="not scoped to one export run"):
+        load_prefix(client, FakeStorage({}), "bucket", prefix)
+    assert client.submitted == []
+
+
+# --- legacy entry points ---
+def test_legacy_entry_point_loads_only_its_own_objects(monkeypatch):
+    from types import SimpleNamespace
+
+    from bigquery_load_products_function import bigquery_load_products
+
+    client = FakeClient()
+    monkeypatch.setattr(bigquery_loader, "get_bigquery_client", lambda: client)
+    for name in ("exports/user_behaviors/user_behaviors_a.jsonl", "exports/products/products_a.jsonl"):
+        bigquery_load_products(SimpleNamespace(data={"bucket": "bucket", "name": name, "generation": "42"}))
+
+    assert [job_id for job_id, _, _ in client.submitted] == [
+        load_job_id("raw_products", ["gs://bucket/exports/products/products_a.jsonl"], salt="42")]
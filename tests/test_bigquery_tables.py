@@ -0,0 +1,189 @@
+import pytest
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+import bigquery_tables
+from bigquery_tables import (
+    TABLE_DEFINITIONS, apply_to_load_config, build_table, ensure_table, expiration_ms, migration_sql,
+    unpartitioned_tables,
+)
+
+TABLE_REF = "my-project.my_dataset.raw_products"
+SCHEMA = [bigquery.SchemaField("product_id", "STRING")]
+DEFINITION = TABLE_DEFINITIONS["raw_products"]
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+class FakeClient:
+    """Just enough of bigquery.Client for ensure_table()."""
+
+    def __init__(self, table=None):
+        self.table = table
+        self.created = []
+        self.updates = []
+
+    def get_table(self, table_ref):
+        if self.table is None:
+            raise NotFound(f"Table {table_ref} not found")
+        return self.table
+
+    def create_table(self, table):
+        self.created.append(table)
+        self.table = table
+        return table
+
+    def update_table(self, table, fields):
+        self.updates.append(list(fields))
+        return table
+
+
+def existing_table(partitioned=True, clustering_fields=None, expiration=None):
+    table = bigquery.Table(TABLE_REF, schema=SCHEMA)
+    if partitioned:
+        table.time_partitioning = bigquery.TimePartitioning(type_="DAY", expiration_ms=expiration)
+    table.clustering_fields = clustering_fields
+    return table
+
+
+# --- expiration_ms ---
+@pytest.mark.parametrize("days", [None, "", " ", "0", "-1", 0, -2.5])
+def test_expiration_ms_keeps_partitions_forever(days):
+    assert expiration_ms({}, days) is None
+
+
+@pytest.mark.parametrize("days, expected", [("30", 30 * DAY_MS), (1.5, int(1.5 * DAY_MS)), (7, 7 * DAY_MS)])
+def test_expiration_ms_converts_days(days, expected):
+    assert expiration_ms({}, days) == expected
+
+
+def test_expiration_ms_prefers_table_override():
+    assert expiration_ms({"partition_expiration_days": 2}, "30") == 2 * DAY_MS
+    assert expiration_ms({"partition_expiration_days": 0}, "30") is None
+
+
+# --- ensure_table ---
+def test_ensure_table_creates_missing_table():
+    client = FakeClient()
+    table = ensure_table(client, TABLE_REF, SCHEMA, DEFINITION, default_expiration_days="10")
+
+    assert client.created == [table]
+    assert table.time_partitioning.type_ == "DAY"
+    assert table.time_partitioning.field is None
+    assert table.time_partitioning.expiration_ms == 10 * DAY_MS
+    assert table.clustering_fields == DEFINITION["clustering_fields"]
+
+
+def test_ensure_table_syncs_clustering_and_expiry():
+    client = FakeClient(existing_table(clustering_fields=["name"], expiration=DAY_MS))
+    table = ensure_table(client, TABLE_REF, SCHEMA, DEFINITION, default_expiration_days="5")
+
+    assert client.created == []
+    assert client.updates == [["clustering_fields", "time_partitioning"]]
+    assert table.clustering_fields == DEFINITION["clustering_fields"]
+    assert table.time_partitioning.expiration_ms == 5 * DAY_MS
+
+
+def test_ensure_table_leaves_matching_table_alone():
+    table = existing_table(clustering_fields=DEFINITION["clustering_fields"])
+    client = FakeClient(table)
+
+    assert ensure_table(client, TABLE_REF, SCHEMA, DEFINITION) is table
+    assert client.updates == []
+
+
+def test_ensure_table_returns_unpartitioned_table_untouched():
+    table = existing_table(partitioned=False)
+    client = FakeClient(table)
+
+    assert ensure_table(client, TABLE_REF, SCHEMA, DEFINITION, default_expiration_days="5") is table
+    assert client.created == [] and client.updates == []
+    assert table.time_partitioning is None
+
+
+# --- apply_to_load_config ---
+def test_apply_to_load_config_copies_live_layout():
+    table = existing_table(clustering_fields=["product_id"], expiration=3 * DAY_MS)
+    load_config = apply_to_load_config(bigquery.LoadJobConfig(), table, DEFINITION)
+
+    assert load_config.time_partitioning.type_ == "DAY"
+    assert load_config.time_partitioning.expiration_ms == 3 * DAY_MS
+    assert load_config.clustering_fields == ["product_id"]
+
+
+def test_apply_to_load_config_refuses_unpartitioned_table():
+    load_config = bigquery.LoadJobConfig()
+    with pytest.raises(ValueError, match="not partitioned") as excinfo:
+        apply_to_load_config(load_config, existing_table(partitioned=False), DEFINITION)
+
+    assert "RENAME TO `raw_products_unpartitioned`" in str(excinfo.value)
+    assert load_config.time_partitioning is None
+
+
+# --- migration_sql ---
+def test_migration_sql_ingestion_time_table():
+    sql = migration_sql("p", "d", "raw_products", DEFINITION).splitlines()
+
+    assert sql == [
+        "ALTER TABLE `p.d.raw_products` RENAME TO `raw_products_unpartitioned`;",
+        "CREATE TABLE `p.d.raw_products` LIKE `p.d.raw_products_unpartitioned` "
+        "PARTITION BY _PARTITIONDATE CLUSTER BY product_id;",
+        "INSERT INTO `p.d.raw_products` SELECT * FROM `p.d.raw_products_unpartitioned`;",
+    ]
+
+
+def test_migration_sql_column_partitioned_table():
+    definition = TABLE_DEFINITIONS["agg_product_daily_events"]
+    sql = migration_sql("p", "d", "agg_product_daily_events", definition).splitlines()
+
+    assert sql[1] == ("CREATE TABLE `p.d.agg_product_daily_events` PARTITION BY day "
+                      "CLUSTER BY product_id, collection AS SELECT * FROM `p.d.agg_product_daily_events_unpartitioned`;")
+    assert len(sql) == 2
+
+
+def test_migration_sql_hourly_column_partitioning():
+    sql = migration_sql("p", "d", "t", {"partition_type": "HOUR", "partition_field": "ts"})
+
+    assert "PARTITION BY TIMESTAMP_TRUNC(ts, HOUR) AS SELECT * FROM `p.d.t_unpartitioned`;" in sql
+
+
+def test_migration_sql_without_clustering():
+    sql = migration_sql("p", "d", "t", {"partition_type": "HOUR"})
+
+    assert "PARTITION BY TIMESTAMP_TRUNC(_PARTITIONTIME, HOUR);" in sql
+    assert "CLUSTER BY" not in sql
+
+
+def test_unpartitioned_tables_skips_missing_and_partitioned_tables():
+    class Dataset:
+        tables = {"p.d.raw_products": existing_table(partitioned=False),
+                  "p.d.raw_ip_locations": existing_table(partitioned=True)}
+
+        def get_table(self, table_ref):
+            if table_ref not in self.tables:
+                raise NotFound(f"Table {table_ref} not found")
+            return self.tables[table_ref]
+
+    found = unpartitioned_tables(Dataset(), "p", "d", ["raw_user_behaviors", "raw_products", "raw_ip_locations"])
+
+    assert found == ["raw_products"]
+
+
+def test_print_migration_prints_one_script(capsys):
+    bigquery_tables.main(["--print-migration", "--project", "p", "--dataset", "d", "raw_products", "agg_add_to_cart_daily"])
+    script = capsys.readouterr().out
+
+    assert script.startswith("-- raw_products\n" + migration_sql("p", "d", "raw_products", DEFINITION))
+    assert "-- agg_add_to_cart_daily\n" in script
+    assert script.count("RENAME TO") == 2
+
+
+def test_print_migration_rejects_unknown_tables():
+    with pytest.raises(SystemExit):
+        bigquery_tables.main(["--print-migration", "raw_orders"])
+
+
+def test_build_table_uses_definition():
+    table = build_table(TABLE_REF, SCHEMA, TABLE_DEFINITIONS["agg_add_to_cart_daily"])
+
+    assert table.time_partitioning.field == "day"
+    assert table.clustering_fields == ["product_id"]
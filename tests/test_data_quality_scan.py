@@ -0,0 +1,130 @@
+import json
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+import data_quality_scan
+from data_quality_scan import id_partitions, iter_offenders, range_filter, run_scan
+
+START = datetime(2024, 1, 1)
+
+
+def summary_doc(i):
+    """A summary event one hour after the previous one; every third has a string cart option."""
+    doc = {
+        "_id": ObjectId.from_datetime(START + timedelta(hours=i)),
+        "cart_products": [{"option": f"ring size {i}" if i % 3 == 0 else [{"option_label": "alloy"}]},
+                          {"option": ""}],
+    }
+    if i % 5 == 0:
+        doc["option"] = {"category id": "42"}
+    return doc
+
+
+@pytest.fixture
+def db():
+    database = mongomock.MongoClient()["glamira_db"]
+    database["summary"].insert_many([summary_doc(i) for i in range(40)])
+    return database
+
+
+def partition_members(collection, ranges):
+    return [{doc["_id"] for doc in collection.find(range_filter(lower, upper))} for lower, upper in ranges]
+
+
+# --- id_partitions ---
+@pytest.mark.parametrize("partitions", [2, 4, 7])
+def test_partitions_cover_every_document_once(db, partitions):
+    collection = db["summary"]
+    ranges = id_partitions(collection, partitions)
+
+    assert len(ranges) == partitions
+    assert ranges[0][0] is None and ranges[-1][1] is None  # Open ends catch _ids past the first and last cut
+    assert all(upper == next_lower for (_, upper), (next_lower, _) in zip(ranges, ranges[1:]))
+    members = partition_members(collection, ranges)
+    assert sum(len(m) for m in members) == 40
+    assert set().union(*members) == {doc["_id"] for doc in collection.find()}
+
+
+def test_numeric_ids_are_split_by_value():
+    collection = mongomock.MongoClient()["glamira_db"]["products"]
+    collection.insert_many([{"_id": i} for i in range(0, 100, 3)])
+    ranges = id_partitions(collection, 4)
+
+    assert [upper for _, upper in ranges[:-1]] == [24.75, 49.5, 74.25]
+    assert sum(len(m) for m in partition_members(collection, ranges)) == 34
+
+
+@pytest.mark.parametrize("ids, partitions, expected", [
+    ([], 4, []),
+    ([ObjectId()], 4, [(None, None)]),
+    ([1, 2, 3], 1, [(None, None)]),
+    ([1, "a"], 4, [(None, None)]),  # Mixed _id types: no ordering to split on
+])
+def test_degenerate_collections_scan_as_one_range(ids, partitions, expected):
+    collection = mongomock.MongoClient()["glamira_db"]["products"]
+    if ids:
+        collection.insert_many([{"_id": value} for value in ids])
+
+    assert id_partitions(collection, partitions) == expected
+
+
+# --- run_scan ---
+def test_partition_results_are_merged(db, monkeypatch):
+    partials = iter([
+        {"scanned": 10, "string_cart_option": {"count": 3, "samples": ["a1", "a2", "a3"]},
+         "category_id_key": {"count": 0, "samples": []}},
+        {"scanned": 15, "string_cart_option": {"count": 4, "samples": ["b1", "b2", "b3"]},
+         "category_id_key": {"count": 1, "samples": ["c1"]}},
+        {"scanned": 15, "string_cart_option": {"count": 2, "samples": ["d1", "d2"]},
+         "category_id_key": {"count": 0, "samples": []}},
+    ])
+    monkeypatch.setattr(data_quality_scan, "scan_partition", lambda *args: next(partials))
+
+    report = run_scan(db, "summary", partitions=3, sample_size=4)
+
+    assert report["scanned"] == 40
+    assert report["checks"]["string_cart_option"]["count"] == 9
+    assert report["checks"]["string_cart_option"]["samples"] == ["a1", "a2", "a3", "b1"]
+    assert report["checks"]["category_id_key"] == {
+        "description": data_quality_scan.CHECKS["category_id_key"]["description"], "count": 1, "samples": ["c1"]}
+
+
+@pytest.mark.parametrize("partitions", [1, 4])
+def test_scan_counts_every_offender(db, partitions):
+    report = run_scan(db, "summary", partitions=partitions, sample_size=3)
+    checks = report["checks"]
+
+    assert report["scanned"] == 40
+    assert (checks["string_cart_option"]["count"], checks["category_id_key"]["count"]) == (14, 8)
+    assert [len(checks[name]["samples"]) for name in ("string_cart_option", "category_id_key")] == [3, 3]
+
+
+def test_unknown_collection_is_refused(db):
+    with pytest.raises(ValueError, match="No checks registered"):
+        run_scan(db, "orders")
+
+
+# --- iter_offenders ---
+def legacy_cart_option_lines(collection):
+    """What check_cart_products_options.py wrote before the scanner existed."""
+    lines = []
+    for doc in collection.find({"cart_products": {"$elemMatch": {"option": {"$type": "string", "$ne": ""}}}}):
+        for cart_product in doc.get("cart_products", []):
+            if isinstance(cart_product.get("option"), str) and cart_product["option"] != "":
+                lines.append(json.dumps({"_id": str(doc["_id"]), "option": cart_product["option"]},
+                                        ensure_ascii=False))
+    return lines
+
+
+@pytest.mark.parametrize("partitions", [1, 4])
+def test_offenders_match_the_legacy_script(db, partitions):
+    db["summary"].insert_one({"_id": ObjectId.from_datetime(START + timedelta(days=30)),
+                              "cart_products": [{"option": "khắc tên"}, {"option": "engraving"}]})
+    lines = [json.dumps(offender, ensure_ascii=False)
+             for offender in iter_offenders(db, "string_cart_option", partitions=partitions)]
+
+    assert lines == legacy_cart_option_lines(db["summary"])
+    assert len(lines) == 16
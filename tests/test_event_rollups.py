@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+import event_rollups
+from export_watermark import load_watermark, save_watermark
+
+
+class FakeSummary:
+    """summary collection whose latest _id is fixed; aggregate() records the windows it was asked for."""
+
+    def __init__(self, latest_id):
+        self.latest_id = latest_id
+        self.windows = []
+
+    def find_one(self, query, projection, sort):
+        return {"_id": self.latest_id}
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        time.sleep(0.05)  # Long enough for a concurrent run to overlap
+        self.windows.append(pipeline[0]["$match"]["_id"])
+        return iter(())
+
+
+class FakeDatabase(dict):
+    def drop_collection(self, name):
+        self.pop(name, None)
+
+
+@pytest.fixture
+def rollups(tmp_path, monkeypatch):
+    monkeypatch.setattr(event_rollups, "STATE_FILE", str(tmp_path / "rollup_watermarks.json"))
+    monkeypatch.setattr(event_rollups, "LEGACY_STATE_FILE", str(tmp_path / "export_watermarks.json"))
+    monkeypatch.setattr(event_rollups, "LOCK_FILE", str(tmp_path / "rollups.lock"))
+    summary = FakeSummary(latest_id=100)
+    monkeypatch.setattr(event_rollups.runtime, "load_config", lambda: {"mongodb": {"summary_collection": "summary"}})
+    monkeypatch.setattr(event_rollups.runtime, "get_database", lambda: FakeDatabase(summary=summary))
+    return summary
+
+
+def test_watermarks_go_to_the_rollup_state_file(rollups, tmp_path):
+    results = event_rollups.update_rollups(["product_daily_events"])
+
+    assert results == {"product_daily_events": "updated"}
+    assert load_watermark("rollup:product_daily_events", path=event_rollups.STATE_FILE) == 100
+    assert not (tmp_path / "export_watermarks.json").exists()
+    assert event_rollups.update_rollups(["product_daily_events"]) == {"product_daily_events": "up to date"}
+
+
+def test_rollup_watermarks_are_migrated_from_the_shared_file(rollups):
+    legacy = event_rollups.LEGACY_STATE_FILE
+    save_watermark("summary", "_id", 7, path=legacy)
+    save_watermark("rollup:product_daily_events", "_id", 40, path=legacy)
+    save_watermark("rollup:add_to_cart_daily", "_id", 100, path=legacy)
+
+    results = event_rollups.update_rollups(["product_daily_events", "add_to_cart_daily"])
+
+    assert results == {"product_daily_events": "updated", "add_to_cart_daily": "up to date"}
+    assert rollups.windows == [{"$gt": 40, "$lte": 100}]
+    assert load_watermark("summary", path=event_rollups.STATE_FILE) is None
+    assert load_watermark("rollup:product_daily_events", path=legacy) == 40
+
+
+def test_concurrent_runs_merge_each_window_once(rollups):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(event_rollups.update_rollups(["product_daily_events"])))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(rollups.windows) == 1
+    assert sorted(r["product_daily_events"] for r in results) == ["up to date", "updated"]
@@ -0,0 +1,310 @@
+import copy
+import json
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+import verify_export_pipelines
+from export_pipelines import PIPELINE_STAGES, WATERMARK_KEY, build_pipeline, schema_field_names
+
+
+@pytest.mark.parametrize("collection_name", sorted(PIPELINE_STAGES))
+def test_bare_pipeline_is_only_the_transforms(collection_name):
+    pipeline = build_pipeline(collection_name)
+
+    assert pipeline == PIPELINE_STAGES[collection_name]()
+    assert pipeline[0] == {"$set": {"_id": {"$toString": "$_id"}}}
+
+
+def test_user_behaviors_stages_rewrite_cart_products_and_option():
+    stages = build_pipeline("summary")
+
+    assert len(stages) == 2
+    assert set(stages[1]["$set"]) == {"cart_products", "option"}
+
+
+def test_ip_locations_stages_drop_last_updated():
+    assert build_pipeline("ip_locations")[-1] == {"$unset": "last_updated"}
+
+
+def test_filter_and_projection_come_before_the_transforms():
+    query = {"_id": {"$gt": 5}}
+    pipeline = build_pipeline("products", query, ["_id", "product_name"])
+
+    assert pipeline[0] == {"$match": query}
+    assert pipeline[1] == {"$project": {"_id": 1, "product_name": 1}}
+    assert pipeline[2:] == PIPELINE_STAGES["products"]()
+
+
+def test_watermark_is_projected_and_captured_before_the_transforms():
+    pipeline = build_pipeline("summary", {"time_stamp": {"$gt": 1}}, ["_id", "ip"], watermark_field="time_stamp")
+
+    assert pipeline[1] == {"$project": {"_id": 1, "ip": 1, "time_stamp": 1}}
+    assert pipeline[2] == {"$set": {WATERMARK_KEY: "$time_stamp"}}
+    assert pipeline[3:] == PIPELINE_STAGES["summary"]()
+
+
+def test_watermark_without_projection():
+    pipeline = build_pipeline("products", watermark_field="_id")
+
+    assert pipeline[0] == {"$set": {WATERMARK_KEY: "$_id"}}
+    assert "$project" not in {key for stage in pipeline for key in stage}
+
+
+def test_unknown_collection_is_rejected():
+    with pytest.raises(ValueError, match="No export pipeline"):
+        build_pipeline("orders")
+
+
+def test_schema_field_names_reads_top_level_columns(tmp_path):
+    schema_path = tmp_path / "schema.json"
+    schema_path.write_text(json.dumps({"fields": [
+        {"name": "_id", "type": "STRING"},
+        {"name": "option", "type": "RECORD", "fields": [{"name": "value", "type": "STRING"}]},
+    ]}))
+
+    assert schema_field_names(str(schema_path)) == ["_id", "option"]
+
+
+# --- Reference evaluator ---
+# mongomock implements neither $type, $unset nor $indexOfArray, so the export
+# pipelines are run here by a small evaluator of the stages and operators they
+# use, following MongoDB's semantics (missing fields, field paths over arrays).
+
+MISSING = object()
+
+
+def _resolve(value, parts):
+    for part in parts:
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list):
+            value = [item[part] for item in value if isinstance(item, dict) and part in item]
+        else:
+            return MISSING
+    return value
+
+
+def _truthy(value):
+    return value not in (MISSING, None, False, 0)
+
+
+def _bson_type(value):
+    if value is MISSING:
+        return "missing"
+    for python_type, name in ((type(None), "null"), (bool, "bool"), (int, "int"), (float, "double"),
+                              (str, "string"), (dict, "object"), (list, "array"), (ObjectId, "objectId")):
+        if isinstance(value, python_type):
+            return name
+    raise TypeError(f"No BSON type for {value!r}")
+
+
+def _equal(a, b):
+    return a is b or (a is not MISSING and b is not MISSING and _bson_type(a) == _bson_type(b) and a == b)
+
+
+def evaluate(expr, doc, variables=None):
+    variables = variables or {}
+    ev = lambda e, extra=None: evaluate(e, doc, {**variables, **(extra or {})})  # noqa: E731
+    if isinstance(expr, str) and expr.startswith("$$"):
+        name, *parts = expr[2:].split(".")
+        return _resolve(variables[name], parts)
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _resolve(doc, expr[1:].split("."))
+    if isinstance(expr, list):
+        return [None if v is MISSING else v for v in (ev(e) for e in expr)]
+    if not isinstance(expr, dict):
+        return expr
+    if len(expr) != 1 or not next(iter(expr)).startswith("$"):
+        return {k: v for k, v in ((k, ev(e)) for k, e in expr.items()) if v is not MISSING}
+
+    (op, arg), = expr.items()
+    if op == "$toString":
+        value = ev(arg)
+        return None if value in (MISSING, None) else str(value)
+    if op == "$cond":
+        return ev(arg[1]) if _truthy(ev(arg[0])) else ev(arg[2])
+    if op == "$isArray":
+        return isinstance(ev(arg), list)
+    if op == "$type":
+        return _bson_type(ev(arg))
+    if op == "$and":
+        return all(_truthy(ev(e)) for e in arg)
+    if op == "$eq":
+        return _equal(ev(arg[0]), ev(arg[1]))
+    if op == "$ne":
+        return not _equal(ev(arg[0]), ev(arg[1]))
+    if op == "$in":
+        value, array = ev(arg[0]), ev(arg[1])
+        return any(_equal(value, item) for item in array)
+    if op == "$map":
+        items = ev(arg["input"])
+        return None if items in (MISSING, None) else [
+            None if v is MISSING else v for v in (ev(arg["in"], {arg["as"]: item}) for item in items)]
+    if op == "$filter":
+        items = ev(arg["input"])
+        return None if items in (MISSING, None) else [
+            item for item in items if _truthy(ev(arg["cond"], {arg["as"]: item}))]
+    if op == "$let":
+        return ev(arg["in"], {name: ev(e) for name, e in arg["vars"].items()})
+    if op == "$objectToArray":
+        value = ev(arg)
+        if value in (MISSING, None):
+            return None
+        if not isinstance(value, dict):
+            raise ValueError(f"$objectToArray requires an object input, found {_bson_type(value)}")
+        return [{"k": k, "v": v} for k, v in value.items()]
+    if op == "$arrayToObject":
+        return {kv["k"]: kv["v"] for kv in ev(arg)}
+    if op == "$concatArrays":
+        return [item for array in ev(arg) for item in array]
+    if op == "$arrayElemAt":
+        array, index = ev(arg[0]), ev(arg[1])
+        return array[index] if -len(array) <= index < len(array) else MISSING
+    if op == "$indexOfArray":
+        array, value = ev(arg[0]), ev(arg[1])
+        return next((i for i, item in enumerate(array) if _equal(item, value)), -1)
+    raise NotImplementedError(op)
+
+
+def run_pipeline(docs, pipeline):
+    docs = [copy.deepcopy(doc) for doc in docs]
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name == "$sort":
+            (key, direction), = spec.items()
+            docs.sort(key=lambda doc: doc[key], reverse=direction < 0)
+        elif name == "$limit":
+            docs = docs[:spec]
+        elif name == "$set":
+            for doc in docs:
+                values = {field: evaluate(expr, doc) for field, expr in spec.items()}
+                for field, value in values.items():
+                    if value is MISSING:
+                        doc.pop(field, None)
+                    else:
+                        doc[field] = value
+        elif name == "$unset":
+            for doc in docs:
+                for field in [spec] if isinstance(spec, str) else spec:
+                    doc.pop(field, None)
+        elif name == "$project":
+            docs = [{k: v for k, v in doc.items() if k == "_id" or spec.get(k)} for doc in docs]
+        else:
+            raise NotImplementedError(name)
+    return docs
+
+
+class EvaluatedCollection:
+    """A mongomock collection whose aggregate() runs the pipeline through the reference evaluator."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, query):
+        return self.collection.find(query)
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        return iter(run_pipeline(list(self.collection.find({})), pipeline))
+
+
+SEED = {
+    "summary": [
+        {"ip": "1.1.1.1", "cart_products": [{"product_id": 1, "option": ""},
+                                             {"product_id": 2, "option": [{"option_label": "alloy"}]},
+                                             {"product_id": 3, "option": "engraving"},
+                                             {"product_id": 4}],
+         "option": {"option_label": "size", "category id": "5", "alias": "x"}, "time_stamp": 1591266092},
+        {"ip": "2.2.2.2", "option": {"alias": "y"}},
+        {"ip": "3.3.3.3", "option": "", "cart_products": []},
+        {"ip": "4.4.4.4", "option": {"category id": None}, "nested": {"a": [1, {"b": 2.5}]}},
+        {"ip": "5.5.5.5", "collection": "option", "current_url": "https://www.glamira.de/"},
+    ],
+    "products": [
+        {"product_id": "1", "collection": float("inf")},
+        {"product_id": "2", "collection": "Glamira Sale"},
+        {"product_id": "3", "collection": 1.5},
+        {"product_id": "4"},
+    ],
+    "ip_locations": [
+        {"ip": "1.1.1.1", "country_code": "VN", "last_updated": "2024-01-01"},
+        {"ip": "2.2.2.2", "country_code": "DE"},
+    ],
+}
+
+
+@pytest.fixture
+def seeded_db():
+    db = mongomock.MongoClient().glamira
+    for name, docs in SEED.items():
+        db[name].insert_many(copy.deepcopy(docs))
+    return {name: EvaluatedCollection(db[name]) for name in SEED}
+
+
+@pytest.mark.parametrize("collection_name", sorted(SEED))
+def test_pipeline_output_is_byte_identical_to_the_python_transform(seeded_db, collection_name):
+    collection = seeded_db[collection_name]
+    exporter = verify_export_pipelines.EXPORTERS[collection_name]
+    expected = list(verify_export_pipelines.python_lines(collection, exporter, 100))
+    actual = list(verify_export_pipelines.pipeline_lines(collection, collection_name, 100))
+
+    assert len(expected) == len(SEED[collection_name])
+    assert actual == expected
+    assert verify_export_pipelines.verify(seeded_db, collection_name, limit=100) == 0
+
+
+def test_verify_reports_a_diverging_transform(seeded_db, monkeypatch):
+    monkeypatch.setitem(PIPELINE_STAGES, "products",
+                        lambda: [{"$set": {"_id": {"$toString": "$_id"}}}])
+
+    assert verify_export_pipelines.verify(seeded_db, "products", limit=100) == 1
+
+
+def test_verify_counts_documents_missing_from_the_pipeline_output(seeded_db, monkeypatch):
+    monkeypatch.setattr(verify_export_pipelines, "build_pipeline",
+                        lambda name: build_pipeline(name) + [{"$limit": 1}])
+
+    assert verify_export_pipelines.verify(seeded_db, "ip_locations", limit=100) == 1
+
+
+def test_projection_is_opt_in():
+    doc = SEED["summary"][4]
+    projected = run_pipeline([dict(doc, _id=ObjectId())], build_pipeline("summary", fields=["_id", "ip"]))
+
+    assert set(projected[0]) == {"_id", "ip"}
+    assert "current_url" in run_pipeline([dict(doc, _id=ObjectId())], build_pipeline("summary"))[0]
+
+
+def test_evaluator_agrees_with_mongomock_on_the_operators_it_implements():
+    # Limited to inputs mongomock gets right (it fails on $filter over null and on $$var.field inside $map)
+    collection = mongomock.MongoClient().glamira.summary
+    collection.insert_many([
+        {"cart_products": [{"option": ""}, {"option": "x", "id": 2}, {"id": 3}], "nested": {"a": 1, "b": [2]}},
+        {"cart_products": "none", "nested": {}},
+    ])
+    expressions = {
+        "id": {"$toString": "$_id"},
+        "is_array": {"$isArray": "$cart_products"},
+        "are_arrays": {"$cond": [{"$isArray": "$cart_products"},
+                            {"$map": {"input": "$cart_products", "as": "cp", "in": {"$isArray": "$$cp"}}}, None]},
+        "keys": {"$let": {"vars": {"kvs": {"$objectToArray": "$nested"}},
+                          "in": {"$filter": {"input": "$$kvs", "as": "kv", "cond": {"$ne": ["$$kv.k", "b"]}}}}},
+        "has_a": {"$in": ["a", {"$map": {"input": {"$objectToArray": "$nested"}, "as": "kv", "in": "$$kv.k"}}]},
+        "joined": {"$concatArrays": [["a"], ["b"]]},
+        "first": {"$arrayElemAt": [["a", "b"], 1]},
+    }
+    pipeline = [{"$sort": {"_id": 1}}, {"$set": expressions}]
+
+    expected = list(collection.aggregate(pipeline))
+    assert json.dumps(run_pipeline(list(collection.find({})), pipeline), default=str) == json.dumps(expected, default=str)
+
+
+def test_local_pushdown_fails_with_a_clear_error():
+    import argparse
+    import run_pipeline
+
+    parser = argparse.ArgumentParser()
+    run_pipeline.add_arguments(parser)
+    with pytest.raises(SystemExit, match="--pushdown needs a MongoDB server"):
+        run_pipeline.run(parser.parse_args(["--local", "--pushdown"]))
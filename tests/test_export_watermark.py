@@ -0,0 +1,52 @@
+import os
+import threading
+from datetime import datetime
+
+from bson import ObjectId
+
+from export_watermark import WatermarkTracker, load_watermark, save_watermark, watermark_query
+
+
+def test_round_trip_of_watermark_types(tmp_path):
+    path = str(tmp_path / "watermarks.json")
+    oid, when = ObjectId(), datetime(2024, 5, 1, 12, 30)
+    save_watermark("summary", "_id", oid, path=path)
+    save_watermark("products", "updated_at", when, path=path)
+    save_watermark("ip_locations", "_id", None, path=path)
+
+    assert load_watermark("summary", path=path) == oid
+    assert load_watermark("products", path=path) == when
+    assert load_watermark("ip_locations", path=path) is None
+    assert load_watermark("unknown", path=path) is None
+
+
+def test_concurrent_writers_keep_every_key(tmp_path):
+    path = str(tmp_path / "watermarks.json")
+    errors = []
+
+    def writer(n):
+        try:
+            for i in range(25):
+                save_watermark(f"c{n}", "_id", i, path=path)
+        except Exception as e:  # Reported below; an exception would otherwise only end the thread
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert [load_watermark(f"c{n}", path=path) for n in range(8)] == [24] * 8
+    assert os.listdir(tmp_path) == ["watermarks.json"]
+
+
+def test_tracker_and_query():
+    tracker = WatermarkTracker("_id")
+    docs = list(tracker.track([{"_id": 3}, {"_id": 7}, {"_id": 5}]))
+
+    assert len(docs) == 3
+    assert (tracker.count, tracker.max_value) == (3, 7)
+    assert watermark_query("_id", 7) == {"_id": {"$gt": 7}}
+    assert watermark_query("_id", None) == {}
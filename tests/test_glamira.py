@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import glamira
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+
+
+def run_python(code):
+    """Runs code in a fresh interpreter from scripts/ and returns its stdout."""
+    return subprocess.run([sys.executable, "-c", code], cwd=SCRIPTS_DIR, capture_output=True, text=True,
+                          check=True).stdout.strip()
+
+
+def test_parser_does_not_import_stage_modules():
+    imported = run_python("import sys, glamira; glamira.build_parser(); "
+                          "print(sorted(m for m in ('run_pipeline', 'orchestrator', 'data_quality_scan') if m in sys.modules))")
+
+    assert imported == "[]"
+
+
+def test_importing_the_pipeline_leaves_logging_alone():
+    assert run_python("import logging, run_pipeline; print(len(logging.getLogger().handlers))") == "0"
+
+
+def test_pass_through_commands_keep_their_options():
+    args = glamira.parse_args(["--profile", "spans", "pipeline", "--local", "--skip", "rollups"])
+
+    assert (args.command, args.profile, args.stage_args) == ("pipeline", "spans", ["--local", "--skip", "rollups"])
+
+
+def test_other_commands_reject_unknown_options():
+    with pytest.raises(SystemExit):
+        glamira.parse_args(["crawl", "--local"])
+
+
+def test_dq_scan_delegates_to_the_scanner(monkeypatch):
+    import data_quality_scan
+
+    calls = []
+    monkeypatch.setattr(data_quality_scan, "main", lambda argv, prog=None: calls.append(argv))
+    glamira.run_dq_scan(glamira.parse_args(["dq-scan", "--collection", "summary", "--partitions", "4"]))
+
+    assert calls == [["--collection", "summary", "--partitions", "4"]]
+
+
+def test_pipeline_options_are_parsed_by_the_pipeline(monkeypatch):
+    import run_pipeline
+
+    runs = []
+    monkeypatch.setattr(run_pipeline, "configure_logging", lambda: None)
+    monkeypatch.setattr(run_pipeline, "run", lambda options: runs.append(options) or True)
+    glamira.run_full_pipeline(glamira.parse_args(["pipeline", "--local", "--partitions", "4"]))
+
+    assert runs[0].local and runs[0].partitions == 4
+    assert runs[0].queue_size == run_pipeline.DEFAULT_QUEUE_SIZE
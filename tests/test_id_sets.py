@@ -0,0 +1,97 @@
+import json
+import random
+
+import pytest
+
+import id_sets
+from id_sets import IdSet, IdSetBuilder, load_ids, save_ids
+
+MIXED_IDS = ["0", "42", "-7", "999999999999999999", "007", "A12", "12.5", "9223372036854775807", ""]
+
+
+@pytest.fixture(params=["numpy", "pure-python"], autouse=True)
+def backend(request, monkeypatch):
+    """Runs every test with NumPy and with the array('q') fallback."""
+    if request.param == "pure-python":
+        monkeypatch.setattr(id_sets, "np", None)
+    elif id_sets.np is None:
+        pytest.skip("NumPy is not installed")
+    return request.param
+
+
+def random_ids(rng, n):
+    """Mostly numeric IDs with a few non-numeric ones, like the crawler's inputs."""
+    return {str(rng.randrange(100000, 100000 + 4 * n)) if rng.random() < 0.9 else f"P{rng.randrange(50)}"
+            for _ in range(n)}
+
+
+def test_round_trip_keeps_every_id(tmp_path):
+    path = save_ids(MIXED_IDS, str(tmp_path / "processed.ids"))
+    ids = load_ids(path)
+
+    assert sorted(ids) == sorted(MIXED_IDS)
+    assert len(ids) == len(MIXED_IDS)
+
+
+@pytest.mark.parametrize("values", [[], ["A12"], ["1", "2"]])
+def test_round_trip_of_small_sets(tmp_path, values):
+    path = save_ids(values, str(tmp_path / "processed.ids"))
+
+    assert sorted(load_ids(path)) == sorted(values)
+
+
+def test_legacy_json_file_is_migrated_once(tmp_path):
+    legacy = tmp_path / "processed.json"
+    legacy.write_text(json.dumps(["3", "1", "A12", "1"]))
+
+    ids = load_ids(str(legacy))
+
+    assert sorted(ids) == ["1", "3", "A12"]
+    assert (tmp_path / "processed.ids").exists() and legacy.exists()
+    legacy.write_text(json.dumps(["changed"]))  # The .ids file wins from now on
+    assert sorted(load_ids(str(tmp_path / "processed.ids"))) == ["1", "3", "A12"]
+
+
+def test_missing_file_loads_as_none(tmp_path):
+    assert load_ids(str(tmp_path / "processed.ids")) is None
+
+
+def test_other_files_are_refused(tmp_path):
+    path = tmp_path / "processed.ids"
+    path.write_bytes(b"not an id file" * 4)
+
+    with pytest.raises(ValueError, match="not a product ID file"):
+        load_ids(str(path))
+
+
+def test_only_canonical_integers_are_stored_as_numbers():
+    ids = IdSet.from_ids(MIXED_IDS)
+
+    # Numbers of 19+ digits may overflow int64 and stay strings
+    assert sorted(ids.strings) == ["", "007", "12.5", "9223372036854775807", "A12"]
+    assert list(ids.ints) == [-7, 0, 42, 999999999999999999]
+    assert "42" in ids and 42 in ids and "007" in ids
+    assert "7" not in ids and "042" not in ids
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_set_operations_match_python_sets(tmp_path, seed):
+    rng = random.Random(seed)
+    left, right = random_ids(rng, 2000), random_ids(rng, 300)
+    loaded = load_ids(save_ids(left, str(tmp_path / "left.ids")))
+
+    assert set(loaded.difference(right)) == left - right
+    assert set(loaded.union(right)) == left | right
+    assert set(IdSet.from_ids(right).difference(loaded)) == right - left
+    assert len(loaded.union(right)) == len(left | right)
+
+
+def test_builder_matches_a_python_set():
+    rng = random.Random(7)
+    values = [rng.choice(sorted(random_ids(rng, 50))) for _ in range(500)]
+    builder = IdSetBuilder(chunk_size=16)
+    for value in values:
+        builder.add(value)
+
+    assert set(builder.build()) == set(values)
+    assert len(builder.build()) == len(set(values))
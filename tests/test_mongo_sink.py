@@ -0,0 +1,207 @@
+import pytest
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import AutoReconnect
+
+import mongo_sink
+from id_sets import load_ids
+from mongo_sink import BulkUpsertSink
+
+
+class FakeResult:
+    def __init__(self, operations):
+        self.bulk_api_result = {
+            "nUpserted": sum(isinstance(op, UpdateOne) for op in operations),
+            "nModified": 0,
+            "nRemoved": sum(isinstance(op, DeleteOne) for op in operations),
+        }
+
+
+class FakeCollection:
+    """Records bulk writes; raises AutoReconnect while down is set."""
+
+    name = "products"
+
+    def __init__(self):
+        self.writes = []
+        self.attempts = 0
+        self.down = False
+
+    def bulk_write(self, operations, ordered=True):
+        self.attempts += 1
+        if self.down:
+            raise AutoReconnect("connection refused")
+        self.writes.append(operations)
+        return FakeResult(operations)
+
+
+def make_sink(collection, **kwargs):
+    kwargs.setdefault("flush_size", 2)
+    kwargs.setdefault("flush_interval", 0)  # No timer thread; tests flush explicitly
+    return BulkUpsertSink(collection, "product_id", **kwargs)
+
+
+def test_full_buffer_flushes_latest_record_per_key():
+    collection = FakeCollection()
+    sink = make_sink(collection, flush_size=3)
+    sink.add({"product_id": "1", "name": "a"})
+    sink.add({"product_id": "1", "name": "b"})
+    sink.add({"product_id": "2", "name": "c"})
+    assert collection.writes == []
+
+    sink.add({"product_id": "3", "name": "d"})
+    assert len(collection.writes) == 1
+    assert [op._doc["$set"]["name"] for op in collection.writes[0]] == ["b", "c", "d"]
+    assert sink.upserted == 3
+
+
+def test_delete_is_batched_and_replaced_by_a_later_add():
+    collection = FakeCollection()
+    sink = make_sink(collection, flush_size=10)
+    sink.delete("1")
+    sink.delete("2")
+    sink.add({"product_id": "2", "name": "back"})
+    sink.flush()
+
+    first, second = collection.writes[0]
+    assert isinstance(first, DeleteOne) and first._filter == {"product_id": "1"}
+    assert isinstance(second, UpdateOne)
+    assert (sink.deleted, sink.upserted) == (1, 1)
+
+
+def test_connection_error_backs_off_size_triggered_flushes(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(mongo_sink.time, "monotonic", lambda: now[0])
+    collection = FakeCollection()
+    collection.down = True
+    sink = make_sink(collection, flush_interval=5)
+    sink._stopped.set()  # Keep the timer thread from flushing on its own
+
+    for i in range(6):
+        sink.add({"product_id": str(i)})
+    assert collection.attempts == 1
+    assert sink.pending() == 6
+
+    collection.down = False
+    now[0] += 5
+    sink.add({"product_id": "6"})
+    assert collection.attempts == 2
+    assert sink.pending() == 0
+    assert sink.upserted == 7
+
+
+def test_buffer_is_capped_while_unreachable(caplog):
+    collection = FakeCollection()
+    collection.down = True
+    sink = make_sink(collection, max_buffer=4)
+
+    for i in range(10):
+        sink.add({"product_id": str(i)})
+    sink.add({"product_id": "0", "name": "update of a buffered key"})
+
+    assert sink.pending() == 4
+    assert sink.dropped == 6
+    assert "buffer is full" in caplog.text
+
+
+def test_close_writes_what_is_left():
+    collection = FakeCollection()
+    sink = make_sink(collection, flush_size=10, flush_interval=0.05)
+    sink.add({"product_id": "1"})
+    sink.close()
+
+    assert sink.pending() == 0
+    assert sink.upserted == 1
+
+
+@pytest.fixture
+def data_handler(tmp_path):
+    from crawl_product_name import ThreadSafeDataHandler
+
+    class RecordingSink:
+        def __init__(self):
+            self.added, self.deleted = [], []
+
+        def add(self, record):
+            self.added.append(record["product_id"])
+
+        def delete(self, key_value):
+            self.deleted.append(key_value)
+
+    return ThreadSafeDataHandler(str(tmp_path / "failed.csv"), str(tmp_path / "processed.json"),
+                                 str(tmp_path / "success.csv"), product_sink=RecordingSink(),
+                                 failure_sink=RecordingSink(), write_csv=False)
+
+
+def test_successful_crawl_clears_the_recorded_failure(data_handler):
+    data_handler.add_failure("42", "https://example.com/42", "HTTP 503")
+    data_handler.add_success("42", {"product_name": "Ring"}, "https://example.com/42")
+
+    assert data_handler.failure_sink.added == ["42"]
+    assert data_handler.failure_sink.deleted == ["42"]
+    assert data_handler.product_sink.added == ["42"]
+
+
+def test_on_written_reports_applied_upserts_only():
+    from pymongo.errors import BulkWriteError
+
+    class RejectingCollection(FakeCollection):
+        def bulk_write(self, operations, ordered=True):
+            raise BulkWriteError({"nUpserted": 1, "nRemoved": 1,
+                                  "writeErrors": [{"index": 1, "errmsg": "document too large"}]})
+
+    written = []
+    sink = make_sink(RejectingCollection(), flush_size=10, on_written=written.extend)
+    sink.add({"product_id": "1"})
+    sink.add({"product_id": "2"})
+    sink.delete("3")
+    sink.flush()
+
+    assert written == ["1"]
+    assert sink.failed == 1
+
+
+def crawl_handler(tmp_path, collection, write_csv=False, **sink_options):
+    from crawl_product_name import ThreadSafeDataHandler
+
+    return ThreadSafeDataHandler(str(tmp_path / "failed.csv"), str(tmp_path / "processed.ids"),
+                                 str(tmp_path / "success.csv"),
+                                 product_sink=make_sink(collection, **sink_options),
+                                 failure_sink=make_sink(FakeCollection(), flush_size=10), write_csv=write_csv)
+
+
+def test_mongo_only_crawl_marks_ids_processed_once_written(tmp_path):
+    collection = FakeCollection()
+    handler = crawl_handler(tmp_path, collection, flush_size=10)
+    handler.add_success("1", {"name": "Ring"}, "https://example.com/1")
+    handler.add_failure("2", "https://example.com/2", "HTTP 404")
+    assert handler.new_processed_ids == set()
+
+    handler.product_sink.close()
+    handler.failure_sink.close()
+    handler.checkpoint_save(force=True)
+
+    assert set(load_ids(str(tmp_path / "processed.ids"))) == {"1", "2"}
+
+
+def test_mongo_only_crawl_does_not_mark_records_the_sink_lost(tmp_path):
+    collection = FakeCollection()
+    collection.down = True
+    handler = crawl_handler(tmp_path, collection, flush_size=1, max_buffer=1)
+    handler.add_success("1", {"name": "Ring"}, "https://example.com/1")
+    handler.add_success("2", {"name": "Pendant"}, "https://example.com/2")  # Dropped: buffer full
+
+    handler.product_sink.close()  # Gives up on "1" while MongoDB is down
+    handler.failure_sink.close()
+    handler.checkpoint_save(force=True)
+
+    assert handler.product_sink.dropped == 1
+    assert len(load_ids(str(tmp_path / "processed.ids"))) == 0
+
+
+def test_csv_crawl_marks_ids_processed_at_once(tmp_path):
+    collection = FakeCollection()
+    collection.down = True
+    handler = crawl_handler(tmp_path, collection, write_csv=True)
+    handler.add_success("1", {"name": "Ring"}, "https://example.com/1")
+
+    assert handler.new_processed_ids == {"1"}
@@ -0,0 +1,65 @@
+import threading
+
+from orchestrator import Orchestrator, Stage
+
+
+def emit_items(ctx):
+    for item in range(3):
+        ctx.emit(item)
+
+
+def make(tmp_path, stages, **kwargs):
+    return Orchestrator(stages, str(tmp_path / "state.json"), **kwargs)
+
+
+def test_runs_dependent_chains_in_order(tmp_path):
+    seen = []
+    stages = [
+        Stage("extract", emit_items),
+        Stage("load", lambda ctx: seen.extend(ctx), stream_from="extract"),
+        Stage("report", lambda ctx: seen.append("report"), deps=["load"]),
+    ]
+    orch = make(tmp_path, stages)
+
+    assert orch.run()
+    assert seen == [0, 1, 2, "report"]
+    assert {name: record["status"] for name, record in orch.report()["stages"].items()} == {
+        "extract": "done", "load": "done", "report": "done"}
+
+
+def test_failure_marks_dependents_upstream_failed(tmp_path):
+    def fail(ctx):
+        raise ValueError("bad input")
+
+    stages = [Stage("extract", fail, no_retry=(ValueError,)), Stage("report", lambda ctx: None, deps=["extract"])]
+    orch = make(tmp_path, stages)
+
+    assert not orch.run()
+    assert orch.status("extract") == "failed"
+    assert orch.status("report") == "upstream_failed"
+
+
+def test_dependency_that_never_completes_does_not_spin(tmp_path, monkeypatch):
+    stages = [Stage("extract", lambda ctx: None), Stage("report", lambda ctx: None, deps=["extract"])]
+    orch = make(tmp_path, stages)
+    # A chain that returns without recording an outcome leaves its stages pending
+    monkeypatch.setattr(orch, "_run_chain", lambda chain: None)
+
+    finished = threading.Event()
+    thread = threading.Thread(target=lambda: (orch.run(), finished.set()), daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+
+    assert finished.is_set()
+    assert orch.status("extract") == "pending"
+    assert orch.status("report") == "upstream_failed"
+
+
+def test_resume_skips_completed_chains(tmp_path):
+    calls = []
+    stages = [Stage("extract", lambda ctx: calls.append("extract")),
+              Stage("report", lambda ctx: calls.append("report"), deps=["extract"])]
+    make(tmp_path, stages).run()
+
+    assert make(tmp_path, stages).run(resume=True)
+    assert calls == ["extract", "report"]
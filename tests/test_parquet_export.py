@@ -0,0 +1,57 @@
+import json
+import logging
+from collections import Counter
+
+import pyarrow.parquet as pq
+
+from export_validation import SchemaValidator
+from parquet_export import coerce_row, write_to_parquet
+
+SCHEMA = [
+    {"name": "product_id", "type": "STRING"},
+    {"name": "quantity", "type": "INTEGER"},
+    {"name": "option", "type": "RECORD", "mode": "REPEATED", "fields": [
+        {"name": "option_label", "type": "STRING"},
+        {"name": "value", "type": "RECORD", "fields": [{"name": "id", "type": "INTEGER"}]},
+    ]},
+    {"name": "location", "type": "RECORD", "fields": [{"name": "city", "type": "STRING"}]},
+]
+
+
+def test_coerce_row_projects_and_coerces():
+    row = coerce_row({"product_id": 42, "quantity": "3", "extra": 1,
+                      "option": {"option_label": "size", "value": {"id": "7"}},
+                      "location": {"city": "Hanoi"}}, SCHEMA)
+
+    assert row == {"product_id": "42", "quantity": 3,
+                   "option": [{"option_label": "size", "value": {"id": 7}}],
+                   "location": {"city": "Hanoi"}}
+
+
+def test_coerce_row_counts_records_that_are_not_objects():
+    dropped = Counter()
+    row = coerce_row({"product_id": "1", "location": "Hanoi",
+                      "option": [{"option_label": "size", "value": "7"}, "loose"]}, SCHEMA, dropped)
+
+    assert row["location"] is None
+    assert row["option"] == [{"option_label": "size", "value": None}]
+    assert dropped == {"location": 1, "option": 1, "option.value": 1}
+
+
+def test_validator_quarantines_the_same_values():
+    problems = SchemaValidator(SCHEMA).validate({"product_id": "1", "location": "Hanoi"})
+
+    assert problems == [("record_not_object", "location")]
+
+
+def test_write_to_parquet_logs_nulled_records(tmp_path, caplog):
+    schema_path = tmp_path / "schema.json"
+    schema_path.write_text(json.dumps(SCHEMA))
+    file_path = tmp_path / "rows.parquet"
+    docs = [{"product_id": "1", "location": {"city": "Hanoi"}}, {"product_id": "2", "location": "Hanoi"}]
+
+    with caplog.at_level(logging.WARNING):
+        assert write_to_parquet(docs, str(file_path), str(schema_path)) == 2
+
+    assert pq.read_table(file_path).column("location").to_pylist() == [{"city": "Hanoi"}, None]
+    assert "1 RECORD values that were not objects: {'location': 1}" in caplog.text
@@ -0,0 +1,121 @@
+import json
+import threading
+
+import pytest
+
+import export_watermark
+from collection_export import MANIFEST_SUFFIX
+import stream_user_behaviors_to_gcs as stream_module
+
+
+class FakeChangeStream:
+    """Hands out the queued insert events, then reports idle and stops the run."""
+
+    def __init__(self, events, stop):
+        self.events = list(events)
+        self.stop = stop
+        self.resume_token = None  # Token of the last event returned, like pymongo's
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def try_next(self):
+        if not self.events:
+            self.stop.set()
+            return None
+        change = self.events.pop(0)
+        self.resume_token = change["_id"]
+        return change
+
+
+class FakeCollection:
+    def __init__(self, events, stop):
+        self.events = events
+        self.stop = stop
+        self.resumed_after = []
+
+    def watch(self, pipeline, resume_after=None, **kwargs):
+        self.resumed_after.append(resume_after)
+        return FakeChangeStream(self.events, self.stop)
+
+
+def event(n):
+    return {"_id": {"_data": f"token-{n}"}, "fullDocument": {"_id": n}}
+
+
+@pytest.fixture
+def stream(tmp_path, monkeypatch):
+    """Runs stream_to_gcs against fake events; the state file and uploads stay in tmp_path."""
+    state_path = str(tmp_path / "stream_state.json")
+    monkeypatch.setattr(stream_module, "STATE_FILE", state_path)
+    monkeypatch.setattr(stream_module, "LEGACY_STATE_FILE", str(tmp_path / "export_watermarks.json"))
+    monkeypatch.setattr(stream_module, "LOCAL_FILE_PATH", str(tmp_path / "stream.jsonl"))
+    uploads, manifests = [], []
+
+    def upload(bucket, source_file, destination_blob):
+        with open(source_file, encoding="utf-8") as f:
+            if destination_blob.endswith(MANIFEST_SUFFIX):
+                manifests.append(json.load(f)["objects"])
+            else:
+                uploads.append([json.loads(line) for line in f])
+    monkeypatch.setattr(stream_module, "upload_to_gcs", upload)
+
+    def run(events, **kwargs):
+        stop = threading.Event()
+        collection = FakeCollection(events, stop)
+        monkeypatch.setattr(stream_module.runtime, "get_collection", lambda name: collection)
+        monkeypatch.setattr(stream_module.runtime, "mongo_batch_size", lambda: 100)
+        kwargs.setdefault("max_seconds", 5)
+        uploaded = stream_module.stream_to_gcs(fast=False, enrich=None, stop=stop, **kwargs)
+        return uploaded, collection.resumed_after[0]
+
+    run.uploads = uploads
+    run.manifests = manifests
+    run.saved_token = lambda: export_watermark.load_watermark(stream_module.STATE_KEY, path=state_path)
+    return run
+
+
+def test_resume_token_round_trip(stream):
+    uploaded, resumed_after = stream([event(1), event(2)], max_events=2)
+    assert (uploaded, resumed_after) == (1, None)
+    assert stream.uploads == [[{"_id": "1"}, {"_id": "2"}]]
+    assert len(stream.manifests) == 1 and stream.manifests[0][0].endswith(".jsonl")
+    assert stream.saved_token() == {"_data": "token-2"}
+
+    # A restart resumes right after the last uploaded event
+    uploaded, resumed_after = stream([event(3)], max_events=1)
+    assert (uploaded, resumed_after) == (1, {"_data": "token-2"})
+    assert stream.saved_token() == {"_data": "token-3"}
+
+    # --reset forgets the token and streams from now on
+    uploaded, resumed_after = stream([], reset=True)
+    assert (uploaded, resumed_after) == (0, None)
+    assert stream.saved_token() is None
+
+
+def test_idle_batch_writes_and_uploads_nothing(stream, monkeypatch):
+    writes = []
+    monkeypatch.setattr(stream_module, "write_to_jsonl", lambda *args, **kwargs: writes.append(args))
+
+    uploaded, _ = stream([])
+
+    assert uploaded == 0
+    assert writes == []
+    assert stream.uploads == stream.manifests == []
+
+
+def test_token_from_the_shared_watermark_file_is_picked_up_once(stream, tmp_path):
+    legacy_path = str(tmp_path / "export_watermarks.json")
+    export_watermark.save_watermark(stream_module.STATE_KEY, "resume_token", {"_data": "token-0"}, path=legacy_path)
+    export_watermark.save_watermark("summary", "_id", 41, path=legacy_path)
+
+    uploaded, resumed_after = stream([event(1)], max_events=1)
+
+    assert (uploaded, resumed_after) == (1, {"_data": "token-0"})
+    assert stream.saved_token() == {"_data": "token-1"}
+    # The exports' watermark in the shared file is left alone
+    assert export_watermark.load_watermark("summary", path=legacy_path) == 41
+    assert export_watermark.load_watermark(stream_module.STATE_KEY, path=legacy_path) == {"_data": "token-0"}